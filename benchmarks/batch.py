@@ -0,0 +1,88 @@
+"""Пачка запросов: цикл по search / BooleanSearchEngine.search против search_many.
+
+Запросы — слова из частой части словаря корпуса (lemmas_tokens/), с повторами, как
+в офлайн-задачах. Замеры идут по прогретым кэшам. Для каждого индекса печатается
+пропускная способность цикла, search_many в одном процессе и search_many с пулом
+процессов, и совпадают ли выдачи.
+Запуск из корня репозитория (нужны индексы search.py, bm25.py и inverted_search.py):
+    python -m benchmarks.batch --queries 10000 --top-k 10 --processes 4
+"""
+import argparse
+import math
+import os
+import time
+
+import inverted_search
+import search
+from benchmarks.synthetic import real_vocabulary, sample_text_queries
+from bm25 import BM25Index, BM25_INDEX_FILE
+from inverted_search import BooleanSearchEngine
+
+OPERATORS = ("and", "or", "and not")
+
+
+def throughput(label, queries, run):
+    start = time.perf_counter()
+    results = run(queries)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {len(queries) / elapsed:10.0f} запросов/с ({elapsed:.2f} с)")
+    return results
+
+
+def same_results(got, expected):
+    """Ранжированные выдачи сравниваются с допуском на порядок сложения оценок, булевы — точно"""
+    return len(got) == len(expected) and all(
+        a == b if isinstance(a, set) else
+        len(a) == len(b) and all(x[0] == y[0] and math.isclose(x[1], y[1], abs_tol=1e-12) for x, y in zip(a, b))
+        for a, b in zip(got, expected))
+
+
+def compare(label, queries, loop, many, processes, pool_module):
+    print(f"{label}:")
+    # Прогрев: кэши лемм, битовых карт и страниц индекса одинаково тёплые для всех замеров
+    for query in queries:
+        loop(query)
+    expected = throughput("цикл по одному запросу", queries, lambda batch: [loop(query) for query in batch])
+    same = same_results(throughput("search_many", queries, lambda batch: many(batch, 1)), expected)
+    # Порог пула снижается, чтобы пул включался на любой пачке этого замера
+    pool_min = pool_module.POOL_MIN_QUERIES
+    pool_module.POOL_MIN_QUERIES = 1
+    try:
+        same &= same_results(throughput(f"search_many, процессов: {processes}", queries,
+                                        lambda batch: many(batch, processes)), expected)
+    finally:
+        pool_module.POOL_MIN_QUERIES = pool_min
+    print(f"  выдачи совпадают: {'да' if same else 'НЕТ'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    words = sample_text_queries(real_vocabulary(), args.queries, seed=args.seed)
+    queries = [" ".join(query) for query in words]
+    boolean_queries = [f" {OPERATORS[i % len(OPERATORS)]} ".join(query) for i, query in enumerate(words)]
+    print(f"Запросов: {len(queries)}, различных: {len(set(queries))}\n")
+
+    k = args.top_k
+    index = search.open_index()
+    compare("tf-idf, search_index.bin", queries, lambda query: search.search(query, index, k),
+            lambda batch, processes: search.search_many(batch, index, k, processes=processes), args.processes, search)
+
+    if os.path.exists(BM25_INDEX_FILE):
+        bm25 = BM25Index()
+        compare("BM25, bm25_index.bin", queries, lambda query: search.search(query, bm25, k),
+                lambda batch, processes: search.search_many(batch, bm25, k, processes=processes), args.processes,
+                search)
+
+    engine = BooleanSearchEngine("lemmas_tokens", "inverted_index.bin")
+    compare("булев поиск, inverted_index.bin", boolean_queries, engine.search,
+            lambda batch, processes: engine.search_many(batch, processes), args.processes, inverted_search)
+
+
+if __name__ == "__main__":
+    main()
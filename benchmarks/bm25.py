@@ -0,0 +1,103 @@
+"""BM25 с квантованными вкладами против нынешнего косинуса по tf-idf: качество и скорость.
+
+Качество меряется поиском известного документа: запрос — несколько лемм случайного
+документа, выбранных пропорционально числу их вхождений, нужный ответ — сам документ.
+Длины документов сильно различаются, как в настоящем корпусе. Запуск из корня репозитория:
+    python -m benchmarks.bm25 --docs 100000 --queries 500
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+import ranked_search
+import search
+from binary_index import BinaryIndex
+from benchmarks.synthetic import synthetic_vocabulary, tfidf_index
+from bm25 import BM25Index, write_bm25_index
+
+# Самые частые леммы ведут себя как стоп-слова, в запросы их не берём
+COMMON_TERMS = 100
+
+
+def counted_documents(n_docs, vocab_size=50000, mean_length=300, seed=42):
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(vocab_size)
+    lengths = np.maximum(10, rng.lognormal(np.log(mean_length), 0.8, n_docs)).astype(int)
+    documents = []
+    for length in lengths:
+        ids = rng.zipf(1.1, length) - 1
+        documents.append(Counter({vocabulary[i]: count for i, count in Counter(ids[ids < vocab_size].tolist()).items()}))
+    return documents, set(vocabulary[:COMMON_TERMS])
+
+
+def known_item_queries(documents, common, count, seed=7):
+    rng = np.random.default_rng(seed)
+    queries = []
+    while len(queries) < count:
+        doc_num = int(rng.integers(len(documents)))
+        terms = [term for term in documents[doc_num] if term not in common]
+        if len(terms) < 3:
+            continue
+        weights = np.array([documents[doc_num][term] for term in terms], dtype=np.float64)
+        size = int(rng.integers(2, 4))
+        chosen = rng.choice(len(terms), size, replace=False, p=weights / weights.sum())
+        queries.append((str(doc_num + 1), [terms[i] for i in chosen]))
+    return queries
+
+
+def evaluate(label, queries, run, k):
+    reciprocal = []
+    start = time.perf_counter()
+    results = [run(lemmas) for _, lemmas in queries]
+    elapsed = time.perf_counter() - start
+    for (target, _), found in zip(queries, results):
+        ranks = [rank for rank, (doc_id, _) in enumerate(found, start=1) if doc_id == target]
+        reciprocal.append(1 / ranks[0] if ranks else 0.0)
+    reciprocal = np.array(reciprocal)
+    print(f"{label:<22} MRR@{k}: {reciprocal.mean():.4f}  найдено в топ-{k}: {(reciprocal > 0).mean():6.1%}  "
+          f"{elapsed / len(queries) * 1000:7.3f} мс/запрос")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents, common = counted_documents(args.docs)
+    queries = known_item_queries(documents, common, args.queries)
+    k = args.top_k
+
+    # Как сейчас: каждая лемма документа считается один раз, tf = 1 / число разных лемм
+    cosine_index = tfidf_index([list(counts) for counts in documents])
+    cosine = ranked_search.PostingsIndex.from_index(cosine_index)
+    evaluate("косинус, в памяти", queries,
+             lambda lemmas: ranked_search.search({lemma: cosine.idf(lemma) or 0.0 for lemma in lemmas}, cosine, k), k)
+
+    doc_ids = [str(doc_num) for doc_num in range(1, len(documents) + 1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Так ищет search.py: бинарный индекс через mmap
+        path = os.path.join(tmp, "search_index.bin")
+        search.build_index_file(cosine_index, path)
+        binary = BinaryIndex(path)
+        evaluate("косинус, mmap", queries,
+                 lambda lemmas: ranked_search.search({lemma: binary.idf(lemma) or 0.0 for lemma in lemmas}, binary, k), k)
+        print(f"{'':<22} индекс {os.path.getsize(path) / 2 ** 20:.1f} МБ")
+
+        for bits in (16, 8):
+            path = os.path.join(tmp, f"bm25_{bits}.bin")
+            start = time.perf_counter()
+            write_bm25_index(path, doc_ids, documents, bits=bits)
+            built = time.perf_counter() - start
+            index = BM25Index(path)
+            evaluate(f"BM25, вклады {bits} бит", queries, lambda lemmas: index.search(lemmas, k), k)
+            print(f"{'':<22} индекс {os.path.getsize(path) / 2 ** 20:.1f} МБ, построен за {built:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
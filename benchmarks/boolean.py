@@ -0,0 +1,89 @@
+"""Глубоко вложенные булевы запросы: BooleanSearchEngine на битовых картах против множеств Python.
+
+Запуск из корня репозитория:
+    python -m benchmarks.boolean --docs 10000 100000 1000000 --queries 50 --depth 4
+"""
+import argparse
+import random
+import time
+
+from benchmarks.synthetic import synthetic_postings
+from inverted_search import BooleanSearchEngine
+
+
+def random_query(terms, depth, rng):
+    """Запрос в виде дерева ("and"/"or", [операнды]) или ("not", операнд) или термин"""
+    if depth == 0 or rng.random() < 0.2:
+        term = rng.choice(terms)
+        return ("not", term) if rng.random() < 0.2 else term
+    operator = rng.choice(["and", "or"])
+    # Первым всегда идёт термин: так запрос не начинается со скобки
+    operands = [rng.choice(terms)] + [random_query(terms, depth - 1, rng) for _ in range(rng.randint(1, 3))]
+    node = (operator, operands)
+    return ("not", node) if rng.random() < 0.15 else node
+
+
+def render(node):
+    if isinstance(node, str):
+        return node
+    if node[0] == "not":
+        operand = render(node[1])
+        return f"not {operand}" if isinstance(node[1], str) else f"not ({operand})"
+    parts = [render(operand) if isinstance(operand, str) or operand[0] == "not" and isinstance(operand[1], str)
+             else f"({render(operand)})" for operand in node[1]]
+    return f" {node[0]} ".join(parts)
+
+
+def evaluate_sets(node, postings, universe):
+    if isinstance(node, str):
+        return postings.get(node, set())
+    if node[0] == "not":
+        return universe - evaluate_sets(node[1], postings, universe)
+    results = [evaluate_sets(operand, postings, universe) for operand in node[1]]
+    if node[0] == "and":
+        return set.intersection(*results)
+    return set.union(*results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--terms", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=4)
+    args = parser.parse_args()
+
+    for n_docs in args.docs:
+        postings = synthetic_postings(n_docs, args.terms)
+        documents = [f"doc_{i}" for i in range(n_docs)]
+        engine = BooleanSearchEngine.from_postings(documents, postings)
+
+        set_postings = {term: set(docs.tolist()) for term, docs in postings.items()}
+        universe = set(range(n_docs))
+
+        rng = random.Random(n_docs)
+        queries = [random_query(list(postings), args.depth, rng) for _ in range(args.queries)]
+        texts = [render(query) for query in queries]
+
+        start = time.perf_counter()
+        expected = [evaluate_sets(query, set_postings, universe) for query in queries]
+        sets_time = time.perf_counter() - start
+
+        # Битовые карты терминов строятся при первом обращении — прогреваем кэш отдельно
+        start = time.perf_counter()
+        for text in texts:
+            engine.evaluate(text)
+        cold_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [engine.evaluate(text) for text in texts]
+        warm_time = time.perf_counter() - start
+
+        mismatched = sum(set(got.to_indices().tolist()) != want for got, want in zip(results, expected))
+        print(f"{n_docs:>8} документов: множества {sets_time / len(queries) * 1000:9.2f} мс/запрос, "
+              f"битовые карты {cold_time / len(queries) * 1000:8.2f} (холодный) / "
+              f"{warm_time / len(queries) * 1000:8.2f} мс/запрос (тёплый), расхождений: {mismatched}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Память индекса в рабочем процессе: словарь словарей search.load_index, булевы постинги
+и матрица поиска против compact_index.CompactIndex, в МБ на миллион постингов.
+
+Память считается через tracemalloc (NumPy тоже сообщает ему о своих массивах): сколько
+осталось занято после построения структуры, без временных объектов. Поиск по компактному
+индексу сверяется с поиском по матрице из словаря словарей. Запуск из корня репозитория:
+    python -m benchmarks.compact_index --docs 20000 --terms-per-doc 50 --queries 200
+"""
+import argparse
+import gc
+import math
+import time
+import tracemalloc
+from collections import defaultdict
+
+import ranked_search
+import search
+from benchmarks.synthetic import sample_queries, synthetic_documents, tfidf_index
+from compact_index import CompactIndex
+from inverted_search import BooleanSearchEngine
+
+
+def retained(build):
+    """Результат build() и сколько байт он удерживает"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def string_sets(index):
+    """Булев индекс в старом виде: термин -> множество строковых doc_id"""
+    postings = defaultdict(set)
+    for doc_id, doc_data in index.items():
+        name = f"lemmas_{doc_id}"
+        for lemma in doc_data:
+            postings[lemma].add(name)
+    return postings
+
+
+def int_arrays(index):
+    """Булев индекс сейчас: термин -> номера документов int32 (BooleanSearchEngine.from_postings)"""
+    postings = defaultdict(list)
+    for doc_num, doc_data in enumerate(index.values()):
+        for lemma in doc_data:
+            postings[lemma].append(doc_num)
+    return BooleanSearchEngine.from_postings([f"lemmas_{doc_id}" for doc_id in index], postings)
+
+
+def query_vector(lemmas, index):
+    # Тот же вес, что в search.compute_query_vector: tf / max_tf * idf
+    return {lemma: index.idf(lemma) or search.EPSILON for lemma in lemmas}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--terms-per-doc", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.docs, terms_per_doc=args.terms_per_doc)
+    tracemalloc.start()
+    index, dict_bytes = retained(lambda: tfidf_index(documents))
+    n_postings = sum(len(doc_data) for doc_data in index.values())
+    print(f"Статей: {len(index)}, постингов: {n_postings}\n")
+
+    def report(label, size):
+        print(f"{label:<52} {size / 2 ** 20:9.1f} МБ, {size / n_postings * 1e6 / 2 ** 20:7.1f} МБ на миллион постингов")
+
+    report("search.load_index: статья -> лемма -> (idf, tf-idf)", dict_bytes)
+    sets, sets_bytes = retained(lambda: string_sets(index))
+    report("булев индекс: термин -> set(doc_id)", sets_bytes)
+    del sets
+    engine, engine_bytes = retained(lambda: int_arrays(index))
+    report("булев индекс: термин -> массив int32", engine_bytes)
+    del engine
+    matrix, matrix_bytes = retained(lambda: search.build_search_matrix(index))
+    report("search.SearchMatrix (поверх словаря словарей)", matrix_bytes)
+    compact, compact_bytes = retained(lambda: CompactIndex.from_index(index))
+    report("CompactIndex", compact_bytes)
+    print(f"{'CompactIndex.nbytes':<52} {compact.nbytes / 2 ** 20:9.1f} МБ\n")
+    tracemalloc.stop()
+
+    queries = [query_vector(lemmas, compact) for lemmas in sample_queries(documents, args.queries)]
+    results = []
+    for label, run in (("словарь словарей + SearchMatrix", lambda query: search.rank(query, matrix, args.top_k)),
+                       ("CompactIndex", lambda query: ranked_search.search(query, compact, args.top_k))):
+        start = time.perf_counter()
+        results.append([run(query) for query in queries])
+        print(f"Поиск, {label:<44} {(time.perf_counter() - start) / len(queries) * 1000:7.3f} мс/запрос")
+    expected, got = results
+    same = all(len(a) == len(b) and all(x[0] == y[0] and math.isclose(x[1], y[1], rel_tol=1e-5) for x, y in zip(a, b))
+               for a, b in zip(expected, got))
+    print(f"Выдачи совпадают (веса CompactIndex — float32, как в бинарном индексе): {'да' if same else 'НЕТ'}")
+
+
+if __name__ == "__main__":
+    main()
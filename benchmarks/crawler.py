@@ -0,0 +1,115 @@
+"""Скорость обхода (страниц в секунду) на локальном HTTP-сервере-заглушке.
+
+Сервер отдаёт страницы списка /page/N по 10 ссылок и статьи с искусственной задержкой,
+имитирующей сеть. Запуск из корня репозитория:
+    python -m benchmarks.crawler --articles 100 --latency 0.05
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import crawler
+from crawl_state import CrawlState
+
+LINKS_PER_PAGE = 10
+
+
+def make_handler(base_url, articles, latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            parts = self.path.strip("/").split("/")
+            if parts[0] == "page" and len(parts) == 2 and parts[1].isdigit():
+                first = (int(parts[1]) - 1) * LINKS_PER_PAGE + 1
+                numbers = range(first, min(first + LINKS_PER_PAGE, articles + 1))
+                body = "".join(f'<a href="{base_url}article_{n}/">Статья {n}</a>' for n in numbers)
+            elif parts[0].startswith("article_"):
+                body = f"<h1>{parts[0]}</h1><script>x()</script>" + "<p>Текст статьи про газон.</p>" * 200
+            else:
+                self.send_error(404)
+                return
+            # Статьи не меняются, поэтому ETag — просто путь; на совпадающий If-None-Match отвечаем 304
+            etag = f'"{self.path}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            data = f"<html><body>{body}</body></html>".encode("utf-8")
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(articles, latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    server.RequestHandlerClass = make_handler(base_url, articles, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url
+
+
+def run_sequential(base_url, save_dir, articles):
+    """Прежний порядок: сначала все страницы списка (с паузой 1 с), потом статьи по одной"""
+    crawler.START_URL, crawler.BASE_URL, crawler.SAVE_DIR = base_url + "page", base_url, save_dir
+    crawler.TOTAL_PAGES = articles
+    crawler.added_links.clear()
+    links = crawler.get_all_article_links()
+    return [url for i, url in enumerate(links, start=1) if crawler.download_article(url, i)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=crawler.WORKERS)
+    parser.add_argument("--rate", type=float, default=0, help="запросов в секунду на хост, 0 — без ограничения")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.articles, args.latency)
+    pages = args.articles + (args.articles + LINKS_PER_PAGE - 1) // LINKS_PER_PAGE
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as save_dir:
+            start = time.perf_counter()
+            entries = crawler.ConcurrentCrawler(base_url + "page", base_url, save_dir, args.articles,
+                                                workers=args.workers, per_host=args.workers, rate=args.rate).crawl()
+            results["параллельно"] = (time.perf_counter() - start, len(entries))
+            assert len(os.listdir(save_dir)) == len(entries)
+
+            # Повторный обход с состоянием: первый проход заполняет его, второй получает 304
+            state = CrawlState(os.path.join(save_dir, "state.sqlite"))
+            for name in ("первый обход", "повторный обход"):
+                start = time.perf_counter()
+                entries = crawler.ConcurrentCrawler(base_url + "page", base_url, save_dir, args.articles,
+                                                    workers=args.workers, per_host=args.workers, rate=args.rate,
+                                                    state=state).crawl()
+                results[name] = (time.perf_counter() - start, len(entries))
+            state.close()
+
+        if not args.skip_sequential:
+            with tempfile.TemporaryDirectory() as save_dir:
+                start = time.perf_counter()
+                downloaded = run_sequential(base_url, save_dir, args.articles)
+                results["последовательно"] = (time.perf_counter() - start, len(downloaded))
+    finally:
+        server.shutdown()
+
+    print()
+    for name, (elapsed, count) in results.items():
+        print(f"{name:<16} {count} статей за {elapsed:6.2f} с — {pages / elapsed:7.1f} страниц/с")
+
+
+if __name__ == "__main__":
+    main()
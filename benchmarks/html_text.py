@@ -0,0 +1,93 @@
+"""Извлечение текста из rt_articles/: BeautifulSoup (как было) против потокового html_text.
+
+Сравниваются время на статью для очистки HTML в краулере, извлечения текста и подготовки
+токенов при повторной обработке из HTML и из сохранённого текста, а также сколько
+шаблонных слов сайта попадает в токены. Запуск из корня репозитория:
+    python -m benchmarks.html_text --repeat 3
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+import crawler
+import html_text
+import lemmas
+
+# Слова из меню, подвала и кнопок сайта, которых нет в самих статьях
+BOILERPLATE_WORDS = ("меню", "поделиться", "перейти", "зарегистрироваться", "пароль")
+
+
+def soup_extract_text(html):
+    """lemmas.extract_text до html_text"""
+    text = BeautifulSoup(html, "html.parser").get_text()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def soup_clean_html(html):
+    """crawler.clean_article_html до html_text"""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(["link", "script"]):
+        tag.decompose()
+    return str(soup)
+
+
+def read_file(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def per_doc_ms(label, documents, run, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [run(document) for document in documents]
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<44} {best / len(documents) * 1000:8.2f} мс/статья")
+    return results
+
+
+def boilerplate_share(texts):
+    docs = sum(any(word in lemmas.count_tokens(text) for word in BOILERPLATE_WORDS) for text in texts)
+    tokens = sum(sum(lemmas.count_tokens(text).values()) for text in texts) / len(texts)
+    return f"статей с шаблонными словами: {docs} из {len(texts)}, токенов на статью: {tokens:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=html_text.HTML_FOLDER)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    names = sorted(name for name in os.listdir(args.input) if re.fullmatch(r"article_\d+\.txt", name))
+    documents = [read_file(os.path.join(args.input, name)) for name in names]
+    print(f"Статей: {len(documents)}, средний размер HTML: {sum(map(len, documents)) / len(documents) / 1024:.0f} КБ")
+
+    print("\nОчистка HTML в краулере")
+    per_doc_ms("BeautifulSoup: удалить <script>/<link>", documents, soup_clean_html, args.repeat)
+    per_doc_ms("регулярное выражение", documents, crawler.clean_article_html, args.repeat)
+
+    print("\nИзвлечение текста")
+    before = per_doc_ms("BeautifulSoup get_text", documents, soup_extract_text, args.repeat)
+    after = per_doc_ms("html_text.extract_text", documents, html_text.extract_text, args.repeat)
+    print(f"до:    {boilerplate_share(before)}")
+    print(f"после: {boilerplate_share(after)}")
+
+    print("\nПовторная обработка: от файла статьи до токенов")
+    with tempfile.TemporaryDirectory() as folder:
+        for doc_id, text in enumerate(after):
+            html_text.write_text(text, doc_id, folder)
+        paths = [os.path.join(args.input, name) for name in names]
+        per_doc_ms("HTML -> BeautifulSoup -> токены", paths,
+                   lambda path: lemmas.count_tokens(soup_extract_text(read_file(path))), args.repeat)
+        per_doc_ms("HTML -> html_text -> токены", paths,
+                   lambda path: lemmas.count_tokens(lemmas.extract_text_from_html(path)), args.repeat)
+        per_doc_ms("сохранённый текст -> токены", range(len(after)),
+                   lambda doc_id: lemmas.count_tokens(html_text.read_text(doc_id, folder)), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Пропускная способность lemmas.process_articles: последовательно и в несколько процессов,
+с пустым и с сохранённым кэшем словоформ. Результаты пишутся во временную папку.
+
+Запуск из корня репозитория:
+    python -m benchmarks.lemmas --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+import lemmas
+
+
+def run(label, doc_ids, workers, cache_file):
+    # Кэш в родительском процессе очищаем, чтобы прогоны не влияли друг на друга
+    lemmas.lemma_cache = lemmas.LemmaCache(lemmas.analyze)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = lemmas.process_articles(doc_ids, workers, cache_file)
+    total = stats["hits"] + stats["misses"]
+    print(f"{label:<36} {stats['documents'] / stats['seconds']:7.1f} док/с, "
+          f"попаданий в кэш: {stats['hits'] / total if total else 0:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--docs", type=int, default=100)
+    args = parser.parse_args()
+
+    doc_ids = range(1, args.docs + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        lemmas.OUTPUT_FOLDER = os.path.join(tmp, "lemmas_tokens")
+        cache_file = os.path.join(tmp, "lemma_cache.json")
+
+        run("1 процесс, без сохранённого кэша", doc_ids, 1, None)
+        run(f"{args.workers} процесса, без сохранённого кэша", doc_ids, args.workers, cache_file)
+        run(f"{args.workers} процесса, кэш с прошлого запуска", doc_ids, args.workers, cache_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Цена инструментирования: поиск с выключенными и включёнными метриками.
+
+Отдельно — стоимость одного таймера и счётчика, когда сбор выключен и включён,
+и поиск под выборочным профилировщиком. Запуск из корня репозитория:
+    python -m benchmarks.metrics --repeat 200
+"""
+import argparse
+import time
+
+import metrics
+from search import open_index, search
+
+QUERIES = ("полив газона летом", "удобрение почвы", "стрижка травы весной", "газо*", "уход за деревьями")
+
+
+def per_call_ns(label, run, calls=200_000):
+    start = time.perf_counter()
+    for _ in range(calls):
+        run()
+    print(f"{label:<40} {(time.perf_counter() - start) / calls * 1e9:8.0f} нс/вызов")
+
+
+def empty_timer():
+    with metrics.timer("bench"):
+        pass
+
+
+def per_query_us(label, index, repeat):
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                search(query, index, top_k=10)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best / repeat / len(QUERIES) * 1e6:8.1f} мкс/запрос")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    index = open_index()
+    for query in QUERIES:
+        search(query, index, top_k=10)
+
+    metrics.enable(False)
+    per_call_ns("таймер, сбор выключен", empty_timer)
+    per_call_ns("счётчик, сбор выключен", lambda: metrics.count("bench"))
+    per_query_us("поиск, сбор выключен", index, args.repeat)
+
+    metrics.enable()
+    per_call_ns("таймер, сбор включён", empty_timer)
+    per_call_ns("счётчик, сбор включён", lambda: metrics.count("bench"))
+    per_query_us("поиск, сбор включён", index, args.repeat)
+
+    with metrics.SamplingProfiler() as profiler:
+        per_query_us("поиск под профилировщиком", index, args.repeat)
+    print(f"Выборок: {sum(profiler.samples.values())}, чаще всего: {profiler.top(3)}")
+
+    metrics.registry.reset()
+
+
+if __name__ == "__main__":
+    main()
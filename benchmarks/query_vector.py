@@ -0,0 +1,53 @@
+"""Накладные расходы search.compute_query_vector на запрос в зависимости от размера корпуса.
+
+Прежний способ — разбор каждого слова pymorphy и поиск IDF перебором документов;
+новый — кэш словоформ и таблица IDF, построенная вместе с матрицей. Запуск из корня репозитория:
+    python -m benchmarks.query_vector --sizes 1000 10000 100000 --queries 200
+"""
+import argparse
+import time
+from collections import defaultdict
+
+import search
+from benchmarks.synthetic import synthetic_documents, tfidf_index, sample_queries
+
+
+def legacy_query_vector(query, index):
+    """compute_query_vector до появления кэша и таблицы IDF"""
+    words = [word for word in query.split() if word.isalpha()]
+    query_tf = defaultdict(int)
+    for lemma in (search.morph.parse(word)[0].normal_form for word in words):
+        query_tf[lemma] += 1
+    max_tf = max(query_tf.values()) if query_tf else 1
+    return {lemma: (tf / max_tf) * next((index[doc][lemma][0] for doc in index if lemma in index[doc]), search.EPSILON)
+            for lemma, tf in query_tf.items()}
+
+
+def per_query_ms(queries, run):
+    start = time.perf_counter()
+    for query in queries:
+        run(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'документов':>10} {'прежний, мс':>12} {'новый, мс':>10} {'попаданий в кэш лемм':>22}")
+    for size in args.sizes:
+        documents = synthetic_documents(size)
+        index = tfidf_index(documents)
+        matrix = search.build_search_matrix(index)
+        queries = [" ".join(lemmas) for lemmas in sample_queries(documents, args.queries)]
+
+        legacy = per_query_ms(queries, lambda q: legacy_query_vector(q, index))
+        search.query_lemma_cache.reset_stats()
+        current = per_query_ms(queries, lambda q: search.compute_query_vector(q, index, matrix))
+        print(f"{size:>10} {legacy:>12.3f} {current:>10.3f} {search.query_lemma_cache.hit_rate:>22.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Сравнение search.rank (разреженная матрица) и ranked_search на синтетическом корпусе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.ranked --docs 100000 --queries 200 --top-k 10
+"""
+import argparse
+import math
+import time
+
+import ranked_search
+import search
+from benchmarks.synthetic import synthetic_documents, tfidf_index, sample_queries
+
+
+def query_vector(lemmas, index):
+    # Тот же вес, что в search.compute_query_vector: tf / max_tf * idf
+    return {lemma: index.idf(lemma) or search.EPSILON for lemma in lemmas}
+
+
+def timed(label, queries, run):
+    start = time.perf_counter()
+    results = [run(query) for query in queries]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(queries) * 1000:8.3f} мс/запрос")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--terms-per-doc", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    documents = synthetic_documents(args.docs, terms_per_doc=args.terms_per_doc)
+    index = tfidf_index(documents)
+    print(f"Корпус: {len(index)} документов, построен за {time.perf_counter() - start:.1f} с")
+
+    start = time.perf_counter()
+    matrix = search.build_search_matrix(index)
+    print(f"Матрица документов: {time.perf_counter() - start:.1f} с")
+
+    start = time.perf_counter()
+    postings = ranked_search.PostingsIndex.from_index(index)
+    print(f"Индекс постингов: {time.perf_counter() - start:.1f} с")
+    del index
+
+    queries = [query_vector(lemmas, postings) for lemmas in sample_queries(documents, args.queries)]
+    k = args.top_k
+
+    baseline = timed("search.rank (косинус)", queries, lambda q: search.rank(q, matrix, k))
+    runs = {
+        "taat": timed("ranked_search taat", queries, lambda q: ranked_search.search_taat(q, postings, k)),
+        "maxscore": timed("ranked_search maxscore", queries, lambda q: ranked_search.search_maxscore(q, postings, k)),
+        "maxscore ~": timed("ranked_search maxscore ~", queries,
+                            lambda q: ranked_search.search_maxscore(q, postings, k, exact=False)),
+    }
+
+    print("\nСовпадение с косинусной выдачей (recall@k):")
+    for name, results in runs.items():
+        recall = sum(len({d for d, _ in got} & {d for d, _ in expected}) / max(1, len(expected))
+                     for got, expected in zip(results, baseline)) / len(queries)
+        mismatched = sum(any(not math.isclose(a[1], b[1], abs_tol=1e-9) for a, b in zip(got, expected))
+                         or len(got) != len(expected)
+                         for got, expected in zip(results, baseline))
+        print(f"  {name:<12} {recall:.4f}  (запросов с другими оценками: {mismatched})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Поиск по шардам против единого индекса на синтетическом корпусе.
+
+Корпус пишется во временную папку в формате lemmas_tokens/lemmas_N.txt, из него строятся
+один шард (это и есть единый индекс) и --shards шардов. Выдачи должны совпадать,
+задержка сравнивается для опроса шардов в пуле процессов и по очереди в одном процессе.
+Запуск из корня репозитория:
+    python -m benchmarks.sharded --docs 100000 --shards 4 --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import search
+from benchmarks.synthetic import synthetic_documents, sample_queries
+from sharded_index import ShardedIndex, build_shards
+
+
+def write_tokens_dir(folder, documents):
+    for doc_id, lemmas in enumerate(documents, start=1):
+        with open(os.path.join(folder, f"lemmas_{doc_id}.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{lemma} {lemma}\n" for lemma in lemmas)
+
+
+def query_vector(lemmas, index):
+    # Синтетические леммы не прогоняются через лемматизатор; вес как в search.compute_query_vector
+    return {lemma: index.idf(lemma) or search.EPSILON for lemma in lemmas}
+
+
+def timed(label, queries, run):
+    start = time.perf_counter()
+    results = [run(query) for query in queries]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / len(queries) * 1000:8.3f} мс/запрос")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.docs)
+    queries = sample_queries(documents, args.queries)
+
+    with tempfile.TemporaryDirectory() as folder:
+        tokens_dir = os.path.join(folder, "tokens")
+        os.makedirs(tokens_dir)
+        write_tokens_dir(tokens_dir, documents)
+
+        start = time.perf_counter()
+        build_shards(os.path.join(folder, "single"), 1, tokens_dir)
+        print(f"Единый индекс построен за {time.perf_counter() - start:.1f} с")
+        start = time.perf_counter()
+        build_shards(os.path.join(folder, "sharded"), args.shards, tokens_dir)
+        print(f"{args.shards} шардов построены за {time.perf_counter() - start:.1f} с")
+
+        with ShardedIndex(os.path.join(folder, "single"), processes=0) as single, \
+                ShardedIndex(os.path.join(folder, "sharded"), processes=0) as inline, \
+                ShardedIndex(os.path.join(folder, "sharded")) as pooled:
+            expected = timed("единый индекс", queries, lambda q: single.search(query_vector(q, single), args.top_k))
+            in_process = timed(f"{args.shards} шардов в одном процессе", queries,
+                               lambda q: inline.search(query_vector(q, inline), args.top_k))
+            in_pool = timed(f"{args.shards} шардов в пуле процессов", queries,
+                            lambda q: pooled.search(query_vector(q, pooled), args.top_k))
+
+    same = sum(_same(a, b) and _same(a, c) for a, b, c in zip(expected, in_process, in_pool))
+    print(f"Совпадающих выдач: {same} из {len(queries)}")
+
+
+def _same(first, second):
+    return [doc_id for doc_id, _ in first] == [doc_id for doc_id, _ in second] and \
+        all(abs(a - b) < 1e-5 for (_, a), (_, b) in zip(first, second))
+
+
+if __name__ == "__main__":
+    main()
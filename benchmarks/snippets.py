@@ -0,0 +1,66 @@
+"""Сниппеты для страницы ТОП-10: разбор HTML из rt_articles/ на каждое попадание против
+сжатого хранилища forward_store.
+
+Для каждого запроса замеряется только подготовка сниппетов по уже найденной выдаче:
+текст статьи (из HTML или из хранилища) и выбор окна с подсветкой. Холодный замер —
+с пустыми кэшами блоков и словоформ, тёплый — повтор тех же запросов.
+Запуск из корня репозитория (нужны search_index.bin и rt_articles/):
+    python -m benchmarks.snippets --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import html_text
+import snippets
+from forward_store import ForwardStore, build_forward_store
+from search import compute_query_vector, open_index, search
+
+QUERIES = ("полив газона летом", "удобрение почвы", "стрижка травы весной", "посадка семян", "борьба с сорняками",
+           "цветки растения", "лекарственные свойства", "газо*", "уход за деревьями", "корень")
+
+
+def from_html(doc_id, weights):
+    with open(os.path.join(html_text.HTML_FOLDER, f"article_{doc_id}.txt"), encoding="utf-8") as f:
+        return snippets.make_snippet(html_text.extract_text(f.read()), weights)
+
+
+def page_ms(label, pages, make, repeat):
+    """Лучшее из repeat время на страницу; первый проход — холодный"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for weights, results in pages:
+            [make(doc_id, weights) for doc_id, _ in results]
+        times.append((time.perf_counter() - start) / len(pages) * 1000)
+    print(f"{label:<36} холодный {times[0]:7.2f} мс/страница, тёплый {min(times[1:] or times):7.2f} мс/страница")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    index = open_index()
+    pages = [(compute_query_vector(query, index), search(query, index, top_k=10)) for query in QUERIES]
+    print(f"Запросов: {len(pages)}, статей в индексе: {len(index)}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "forward_store.bin")
+        start = time.perf_counter()
+        writer = build_forward_store(html_text.HTML_FOLDER, path)
+        print(f"Сборка хранилища: {time.perf_counter() - start:.2f} с, "
+              f"текст {writer.text_size / 1024:.0f} КБ -> {os.path.getsize(path) / 1024:.0f} КБ")
+
+        snippets.word_forms.cache_clear()
+        page_ms("HTML -> html_text -> сниппет", pages, from_html, args.repeat)
+        snippets.word_forms.cache_clear()
+        store = ForwardStore(path)
+        page_ms("хранилище -> сниппет", pages, lambda doc_id, weights: snippets.make_snippet(store.text(doc_id), weights),
+                args.repeat)
+        page_ms("только распаковка текста", pages, lambda doc_id, _: store.text(doc_id), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
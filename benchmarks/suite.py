@@ -0,0 +1,297 @@
+"""Воспроизводимый набор замеров на синтетическом корпусе из настоящего словаря.
+
+Корпус: статьи из словоформ lemmas_tokens/ с частотами по Ципфу (benchmarks.synthetic.zipf_texts),
+при одинаковых --docs и --seed он один и тот же. Статьи пишутся как извлечённый текст
+в rt_texts/ рабочей папки, дальше идут настоящие шаги обработки:
+lemmas.process_articles -> count_tf_and_idf -> индекс ранжирования и булев индекс.
+
+Каждый сценарий выполняется в отдельном процессе, поэтому пиковая память (peak_rss_mb)
+и холодный старт у каждого свои. Перед холодным стартом файлы индекса вытесняются
+из страничного кэша системы (posix_fadvise), время включает импорт модулей и открытие индекса.
+Замеры задержки — по одному запросу (p50, p95, среднее) и пачкой подряд (запросов в секунду).
+
+Результат — JSON с параметрами запуска; --compare сравнивает с прошлым файлом и
+отмечает метрики, ухудшившиеся больше чем на --threshold (код выхода 1).
+Запуск из корня репозитория:
+    python -m benchmarks.suite --docs 10000 --output bench_10k.json
+    python -m benchmarks.suite --docs 10000 --compare bench_10k.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKENS_DIR = "lemmas_tokens"
+BOOLEAN_INDEX_FILE = "inverted_index.bin"
+SCENARIOS = ("build_lemmas", "build_tf_idf", "build_ranked", "build_boolean",
+             "ranked_cold", "ranked_warm", "boolean_cold", "boolean_warm")
+# Какой сценарий строит файлы, нужные этому
+REQUIRES = {"build_tf_idf": "build_lemmas", "build_ranked": "build_tf_idf", "build_boolean": "build_lemmas",
+            "ranked_cold": "build_ranked", "ranked_warm": "build_ranked",
+            "boolean_cold": "build_boolean", "boolean_warm": "build_boolean"}
+# Метрики, у которых больше — лучше; у остальных (время, размер, память) лучше меньше
+HIGHER_IS_BETTER = {"docs_per_second", "queries_per_second", "many_queries_per_second"}
+# Время на одной и той же машине от запуска к запуску гуляет на 10–20%
+THRESHOLD = 0.25
+
+
+def _peak_rss_mb() -> float:
+    # На Linux ru_maxrss в килобайтах, на macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024
+
+
+def _evict(paths):
+    """Вытесняет файлы из страничного кэша, чтобы следующее чтение шло с диска"""
+    for path in paths:
+        if os.path.exists(path) and hasattr(os, "posix_fadvise"):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def _latency(run, queries, batch, run_many=None):
+    """Задержка одиночных запросов и пропускная способность пачки: циклом по run и,
+    если передан run_many, одним вызовом search_many"""
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        times.append((time.perf_counter() - start) * 1000)
+    batch_queries = (queries * (batch // len(queries) + 1))[:batch]
+    start = time.perf_counter()
+    for query in batch_queries:
+        run(query)
+    batch_seconds = time.perf_counter() - start
+    result = {
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "mean_ms": float(np.mean(times)),
+        "batch_ms": batch_seconds * 1000,
+        "queries_per_second": len(batch_queries) / batch_seconds,
+    }
+    if run_many is not None:
+        start = time.perf_counter()
+        run_many(batch_queries)
+        result["many_queries_per_second"] = len(batch_queries) / (time.perf_counter() - start)
+    return result
+
+
+def _queries(args, boolean=False):
+    from benchmarks.synthetic import real_vocabulary, sample_text_queries
+
+    vocabulary = real_vocabulary(os.path.join(REPO_ROOT, TOKENS_DIR))
+    queries = sample_text_queries(vocabulary, args.queries, seed=args.seed)
+    if not boolean:
+        return [" ".join(words) for words in queries]
+    operators = ("and", "or", "and not")
+    return [f" {operators[i % len(operators)]} ".join(words) for i, words in enumerate(queries)]
+
+
+def build_lemmas(args):
+    import lemmas
+
+    result = lemmas.process_articles(range(1, args.docs + 1), args.workers, from_texts=True)
+    return {"seconds": result["seconds"], "docs_per_second": result["documents"] / result["seconds"]}
+
+
+def build_tf_idf(args):
+    import count_tf_and_idf
+
+    start = time.perf_counter()
+    count_tf_and_idf.run()
+    return {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(count_tf_and_idf.TF_IDF_FILE)}
+
+
+def build_ranked(args):
+    import search
+
+    if os.path.exists(search.INDEX_FILE):
+        os.remove(search.INDEX_FILE)
+    start = time.perf_counter()
+    search.open_index()
+    return {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(search.INDEX_FILE)}
+
+
+def build_boolean(args):
+    from inverted_search import BooleanSearchEngine
+
+    start = time.perf_counter()
+    BooleanSearchEngine(TOKENS_DIR, BOOLEAN_INDEX_FILE, rebuild=True)
+    return {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(BOOLEAN_INDEX_FILE)}
+
+
+def ranked_cold(args):
+    queries = _queries(args)
+    _evict(["search_index.bin", "lemma_cache.json"])
+    start = time.perf_counter()
+    import search
+
+    index = search.open_index()
+    opened = time.perf_counter()
+    search.search(queries[0], index, top_k=args.top_k)
+    return {"open_ms": (opened - start) * 1000, "first_query_ms": (time.perf_counter() - opened) * 1000}
+
+
+def ranked_warm(args):
+    import search
+
+    queries = _queries(args)
+    index = search.open_index()
+    for query in queries:
+        search.search(query, index, top_k=args.top_k)
+    return _latency(lambda query: search.search(query, index, top_k=args.top_k), queries, args.batch,
+                    lambda batch: search.search_many(batch, index, top_k=args.top_k, processes=args.workers))
+
+
+def boolean_cold(args):
+    queries = _queries(args, boolean=True)
+    _evict([BOOLEAN_INDEX_FILE])
+    start = time.perf_counter()
+    from inverted_search import BooleanSearchEngine
+
+    engine = BooleanSearchEngine(TOKENS_DIR, BOOLEAN_INDEX_FILE)
+    opened = time.perf_counter()
+    engine.search(queries[0])
+    return {"open_ms": (opened - start) * 1000, "first_query_ms": (time.perf_counter() - opened) * 1000}
+
+
+def boolean_warm(args):
+    from inverted_search import BooleanSearchEngine
+
+    queries = _queries(args, boolean=True)
+    engine = BooleanSearchEngine(TOKENS_DIR, BOOLEAN_INDEX_FILE)
+    for query in queries:
+        engine.search(query)
+    # Планы запросов кэшируются: в замер попадает вычисление по уже разобранным запросам
+    return _latency(engine.search, queries, args.batch, lambda batch: engine.search_many(batch, args.workers))
+
+
+def write_corpus(args, workdir):
+    import html_text
+    from benchmarks.synthetic import real_vocabulary, zipf_texts
+
+    vocabulary = real_vocabulary(os.path.join(REPO_ROOT, TOKENS_DIR))
+    start = time.perf_counter()
+    size = 0
+    for doc_id, text in zipf_texts(args.docs, vocabulary, args.words, args.exponent, args.seed):
+        size += os.path.getsize(html_text.write_text(text, doc_id, os.path.join(workdir, html_text.TEXT_FOLDER)))
+    print(f"Корпус: {args.docs} статей, {size / 2 ** 20:.1f} МБ текста, словарь {len(vocabulary)} слов, "
+          f"{time.perf_counter() - start:.1f} с")
+    return len(vocabulary), size
+
+
+def run_scenario(name, args, workdir):
+    """Сценарий в отдельном процессе; последняя строка его вывода — JSON с метриками"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable, "-m", "benchmarks.suite", "--scenario", name, "--docs", str(args.docs),
+               "--queries", str(args.queries), "--batch", str(args.batch), "--top-k", str(args.top_k),
+               "--seed", str(args.seed), "--workers", str(args.workers)]
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode:
+        print(completed.stderr, file=sys.stderr)
+        raise RuntimeError(f"сценарий {name} завершился с кодом {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Печатает изменения метрик; возвращает список ухудшившихся больше чем на threshold"""
+    if baseline["meta"].get("docs") != current["meta"].get("docs"):
+        print(f"Внимание: в базовом запуске {baseline['meta'].get('docs')} статей, сейчас {current['meta']['docs']}")
+    regressions = []
+    print(f"\n{'метрика':<40} {'было':>12} {'стало':>12} {'изменение':>10}")
+    for scenario, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            old = baseline["results"].get(scenario, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = "  <- хуже" if worse > threshold else ""
+            if flag:
+                regressions.append(f"{scenario}.{metric}")
+            print(f"{scenario + '.' + metric:<40} {old:>12.3f} {value:>12.3f} {change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=300, help="слов в статье в среднем")
+    parser.add_argument("--exponent", type=float, default=1.1, help="показатель закона Ципфа")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=200, help="запросов для замера одиночной задержки")
+    parser.add_argument("--batch", type=int, default=1000, help="запросов в пачке")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="процессов лемматизации в build_lemmas и пула search_many")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="какие сценарии запускать, через запятую (нужные им сборки добавятся сами)")
+    parser.add_argument("--workdir", help="рабочая папка (по умолчанию временная, удаляется после запуска)")
+    parser.add_argument("--output", help="куда записать результаты в JSON")
+    parser.add_argument("--compare", metavar="JSON", help="прошлые результаты для сравнения")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="допустимое ухудшение, доля")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)  # запуск внутри дочернего процесса
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = globals()[args.scenario](args)
+        result["peak_rss_mb"] = _peak_rss_mb()
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        vocabulary, text_bytes = write_corpus(args, workdir)
+        selected = set(args.scenarios.split(","))
+        for name in reversed(SCENARIOS):
+            if name in selected and name in REQUIRES:
+                selected.add(REQUIRES[name])
+        results = {}
+        for name in [name for name in SCENARIOS if name in selected]:
+            results[name] = run_scenario(name, args, workdir)
+            print(f"{name:<14} " + ", ".join(f"{key} {value:.3f}" for key, value in results[name].items()))
+
+    report = {
+        "meta": {
+            "docs": args.docs, "words": args.words, "exponent": args.exponent, "seed": args.seed,
+            "vocabulary": vocabulary, "text_bytes": text_bytes, "queries": args.queries, "batch": args.batch,
+            "top_k": args.top_k, "workers": args.workers, "commit": _commit(),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"Ухудшились: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
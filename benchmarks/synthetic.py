@@ -0,0 +1,128 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Предложение синтетической статьи: от и до стольких слов
+SENTENCE_WORDS = (6, 18)
+
+
+def synthetic_vocabulary(size: int) -> List[str]:
+    """Искусственные «леммы» из кириллических слогов — уникальные и без лемматизации"""
+    syllables = [c + v for c in "бвгдзклмнпрстф" for v in "аеиоуя"]
+    words = []
+    for i in range(size):
+        parts = []
+        i += len(syllables)
+        while i:
+            i, rest = divmod(i, len(syllables))
+            parts.append(syllables[rest])
+        words.append("".join(parts))
+    return words
+
+
+def synthetic_documents(n_docs: int, vocab_size: int = 50000, terms_per_doc: int = 40,
+                        seed: int = 42) -> List[List[str]]:
+    """Документы как наборы уникальных лемм; частоты лемм распределены по Ципфу"""
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(vocab_size)
+
+    lengths = np.maximum(1, rng.poisson(terms_per_doc, n_docs))
+    ids = rng.zipf(1.2, int(lengths.sum() * 1.3)) - 1
+    ids = ids[ids < vocab_size]
+
+    documents = []
+    pos = 0
+    for length in lengths:
+        chunk = ids[pos:pos + length]
+        pos += length
+        if pos >= len(ids):
+            ids = rng.zipf(1.2, int(lengths.sum())) - 1
+            ids = ids[ids < vocab_size]
+            pos = 0
+        documents.append([vocabulary[i] for i in set(chunk.tolist())])
+    return documents
+
+
+def tfidf_index(documents: List[List[str]]) -> Dict[str, Dict[str, Tuple[float, float]]]:
+    """Индекс в формате search.load_index, посчитанный так же, как в count_tf_and_idf.py"""
+    df = {}
+    for lemmas in documents:
+        for lemma in lemmas:
+            df[lemma] = df.get(lemma, 0) + 1
+
+    n = len(documents)
+    idf = {lemma: math.log(n / count) for lemma, count in df.items()}
+
+    index = {}
+    for doc_num, lemmas in enumerate(documents, start=1):
+        tf = 1 / len(lemmas)
+        index[str(doc_num)] = {lemma: (idf[lemma], tf * idf[lemma]) for lemma in lemmas}
+    return index
+
+
+def sample_queries(documents: List[List[str]], count: int, max_terms: int = 4, seed: int = 7) -> List[List[str]]:
+    """Запросы из лемм случайных документов, чтобы у каждого были совпадения"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        doc = documents[rng.integers(len(documents))]
+        size = min(len(doc), int(rng.integers(1, max_terms + 1)))
+        queries.append([doc[i] for i in rng.choice(len(doc), size, replace=False)])
+    return queries
+
+
+def synthetic_postings(n_docs: int, n_terms: int = 64, seed: int = 42) -> Dict[str, np.ndarray]:
+    """Постинги для булева поиска: доля документов с r-м термином убывает как 1/r"""
+    rng = np.random.default_rng(seed)
+    postings = {}
+    for rank, term in enumerate(synthetic_vocabulary(n_terms), start=1):
+        df = max(1, int(n_docs * 0.5 / rank))
+        postings[term] = np.sort(rng.choice(n_docs, df, replace=False)).astype(np.int32)
+    return postings
+
+
+def real_vocabulary(tokens_dir: str = "lemmas_tokens") -> List[str]:
+    """Словоформы из tokens_N.txt настоящего корпуса, от самых частых (по числу статей) к редким"""
+    df = Counter()
+    for name in os.listdir(tokens_dir):
+        if re.fullmatch(r"tokens_\d+\.txt", name):
+            with open(os.path.join(tokens_dir, name), encoding="utf-8") as f:
+                df.update({line.strip().lower() for line in f if line.strip()})
+    return sorted(df, key=lambda word: (-df[word], word))
+
+
+def zipf_texts(n_docs: int, vocabulary: List[str], words_per_doc: int = 300, exponent: float = 1.1,
+               seed: int = 42) -> Iterator[Tuple[int, str]]:
+    """Статьи (номер с 1, текст) из слов vocabulary: r-е по частоте слово встречается с вероятностью ~ 1/r^exponent.
+
+    Длина статьи — по Пуассону вокруг words_per_doc, текст разбит на предложения,
+    чтобы его одинаково понимали токенизатор, позиционный индекс и сниппеты.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** exponent
+    cumulative = np.cumsum(weights / weights.sum())
+    for doc_id in range(1, n_docs + 1):
+        length = max(SENTENCE_WORDS[0], int(rng.poisson(words_per_doc)))
+        ids = np.minimum(np.searchsorted(cumulative, rng.random(length)), len(vocabulary) - 1)
+        words = [vocabulary[i] for i in ids.tolist()]
+        sentences = []
+        pos = 0
+        while pos < len(words):
+            size = int(rng.integers(*SENTENCE_WORDS))
+            sentence = " ".join(words[pos:pos + size])
+            sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+            pos += size
+        yield doc_id, " ".join(sentences)
+
+
+def sample_text_queries(vocabulary: List[str], count: int, max_terms: int = 3, head: int = 2000,
+                        seed: int = 7) -> List[List[str]]:
+    """Запросы из слов верхней части словаря (первые head) — как у пользователей, по частым словам"""
+    rng = np.random.default_rng(seed)
+    head = min(head, len(vocabulary))
+    return [[vocabulary[i] for i in rng.choice(head, int(rng.integers(1, max_terms + 1)), replace=False)]
+            for _ in range(count)]
@@ -0,0 +1,75 @@
+"""count_tf_and_idf: расчёт через Counter и словари (как было) против разреженной матрицы.
+
+Документы синтетические (benchmarks.synthetic), чтение файлов не входит в замер.
+Отдельно сравнивается запись результата: текстовые файлы по статьям против одного файла.
+Запуск из корня репозитория:
+    python -m benchmarks.tf_idf --docs 20000
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import count_tf_and_idf
+from benchmarks.synthetic import synthetic_documents
+
+
+def legacy_tf_idf(documents):
+    """Расчёт из count_tf_and_idf.py до пакетной версии"""
+    doc_counts = []
+    df = defaultdict(int)
+    for terms in documents:
+        counts = Counter(terms)
+        doc_counts.append(counts)
+        for term in counts:
+            df[term] += 1
+    idf = {term: math.log(len(documents) / count) for term, count in df.items()}
+    results = []
+    for counts in doc_counts:
+        total = sum(counts.values())
+        results.append([(term, idf[term], counts[term] / total * idf[term]) for term in sorted(counts)])
+    return results
+
+
+def legacy_write(results, folder):
+    for i, rows in enumerate(results, start=1):
+        with open(os.path.join(folder, f'article_{i}_lemmas.txt'), 'w', encoding='utf-8') as f:
+            for term, idf, tfidf in rows:
+                f.write(f'{term} {idf:.6f} {tfidf:.6f}\n')
+
+
+def timed(label, run):
+    start = time.perf_counter()
+    result = run()
+    print(f"{label:<40} {time.perf_counter() - start:8.2f} с")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.docs)
+    doc_ids = list(range(1, args.docs + 1))
+    print(f"Документов: {args.docs}, терминов в документе: {len(documents[0])}")
+
+    legacy = timed("Counter и словари", lambda: legacy_tf_idf(documents))
+    batch = timed("разреженная матрица", lambda: count_tf_and_idf.compute_tf_idf(doc_ids, documents))
+
+    with tempfile.TemporaryDirectory() as folder:
+        timed("запись: текстовый файл на статью", lambda: legacy_write(legacy, folder))
+        path = os.path.join(folder, count_tf_and_idf.TF_IDF_FILE)
+        timed("запись: один файл", lambda: count_tf_and_idf.save_tf_idf({'lemmas': batch}, path))
+        print(f"Размер файла: {os.path.getsize(path) / 2 ** 20:.1f} МБ")
+
+    # Проверка: те же значения, что и у прежнего расчёта
+    row = batch.tf_idf.getrow(0)
+    expected = {term: tfidf for term, _, tfidf in legacy[0]}
+    assert all(abs(expected[batch.terms[col]] - value) < 1e-12 for col, value in zip(row.indices, row.data))
+
+
+if __name__ == '__main__':
+    main()
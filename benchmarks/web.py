@@ -0,0 +1,119 @@
+"""Нагрузочный тест /api/search: задержка p50/p99 и запросов в секунду.
+
+По умолчанию поднимает локальный web.py на свободном порту. Запросы — случайные
+сочетания лемм из словаря индекса; --distinct задаёт число разных запросов,
+от него зависит доля попаданий в кэш. Запуск из корня репозитория:
+    python -m benchmarks.web --workers 4 --concurrency 16 --requests 5000
+    python -m benchmarks.web --url http://127.0.0.1:5000
+"""
+import argparse
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from search import open_index
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(workers):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "web.py", "--port", str(port), "--workers", str(workers)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            requests.get(url + "/api/search", params={"q": "тест"}, timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Сервер не запустился")
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    terms = [term for term in open_index().terms if term.isalpha()]
+    return [" ".join(rng.sample(terms, rng.randint(1, 3))) for _ in range(count)]
+
+
+def run_load(url, queries, total, concurrency, k):
+    latencies = []
+    cached = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        session = requests.Session()
+        rng = random.Random(threading.get_ident())
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            try:
+                response = session.get(url + "/api/search", params={"q": rng.choice(queries), "k": k}, timeout=30)
+                response.raise_for_status()
+                hit = response.json()["cached"]
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(e)
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                cached.append(hit)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, np.array(latencies) * 1000, cached, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="адрес уже запущенного сервера; без него поднимается локальный")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=500, help="сколько разных запросов в нагрузке")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_local_server(args.workers)
+        print(f"Локальный сервер {url}, рабочих процессов: {args.workers}")
+
+    try:
+        queries = make_queries(args.distinct)
+        elapsed, latencies, cached, errors = run_load(url, queries, args.requests, args.concurrency, args.k)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"Запросов: {len(latencies)}, ошибок: {len(errors)}, параллельно: {args.concurrency}")
+    if len(latencies):
+        print(f"QPS: {len(latencies) / elapsed:.1f}")
+        print(f"p50: {np.percentile(latencies, 50):.2f} мс, p99: {np.percentile(latencies, 99):.2f} мс")
+        print(f"Ответов из кэша: {sum(cached) / len(cached):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from typing import Iterable, List, Tuple, Dict, Optional, Sequence
+
+import numpy as np
+
+import metrics
+from term_dictionary import TermDictionary
+
+MAGIC = b"IPIX"
+VERSION = 1
+
+# Заголовок: сигнатура, версия, число секций; затем таблица секций (имя, смещение, длина)
+_HEADER = struct.Struct("<4sII")
+_SECTION = struct.Struct("<8sQQ")
+
+# Запись о термине: фиксированного размера, чтобы доставать её по номеру без разбора всего словаря
+TERM_INFO = np.dtype([
+    ("df", "<u4"),
+    ("postings_offset", "<u8"),
+    ("postings_length", "<u4"),
+    ("weights_offset", "<u8"),
+    ("idf", "<f8"),
+    ("max_weight", "<f4"),
+])
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """Кодирует неотрицательные числа в varint (по 7 бит, старший бит — «есть продолжение»)"""
+    values = values.astype(np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        nbytes += values >= (1 << shift)
+
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    starts = np.cumsum(nbytes) - nbytes
+    for j in range(int(nbytes.max(initial=0))):
+        mask = nbytes > j
+        chunk = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (nbytes[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + j] = chunk | more
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Обратное к encode_varints, без цикла по числам"""
+    if not len(data):
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[group]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def _string_table(strings: Sequence[bytes]) -> bytes:
+    offsets = np.zeros(len(strings) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(s) for s in strings])
+    return struct.pack("<I", len(strings)) + offsets.tobytes() + b"".join(strings)
+
+
+class _StringTable(Sequence):
+    """Таблица строк внутри mmap: строки декодируются только при обращении"""
+
+    def __init__(self, buffer: mmap.mmap, offset: int):
+        self._buffer = buffer
+        self._count = struct.unpack_from("<I", buffer, offset)[0]
+        self._offsets = np.frombuffer(buffer, dtype="<u8", count=self._count + 1, offset=offset + 4)
+        self._data = offset + 4 + 8 * (self._count + 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def raw(self, i: int) -> bytes:
+        return self._buffer[self._data + int(self._offsets[i]):self._data + int(self._offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self.raw(i).decode("utf-8")
+
+
+class _RawKeys:
+    """Последовательность байтовых ключей для bisect по словарю терминов"""
+
+    def __init__(self, table: _StringTable):
+        self._table = table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._table.raw(i)
+
+
+def is_stale(path: str, sources: Iterable[str]) -> bool:
+    """Индекса нет или он старше какого-либо из источников: файлов или папок.
+    У папки учитываются и её файлы, и она сама — так заметно и удаление файла"""
+    if not os.path.exists(path):
+        return True
+    built = os.path.getmtime(path)
+    for source in sources:
+        if not os.path.exists(source):
+            continue
+        if os.path.getmtime(source) > built:
+            return True
+        if os.path.isdir(source):
+            with os.scandir(source) as entries:
+                if any(entry.stat().st_mtime > built for entry in entries):
+                    return True
+    return False
+
+
+@metrics.timed("index_write")
+def write_binary_index(path: str, doc_ids: List[str], postings: Dict[str, Sequence[int]],
+                       weights: Optional[Dict[str, Sequence[float]]] = None,
+                       idf: Optional[Dict[str, float]] = None,
+                       extra_sections: Optional[Dict[str, bytes]] = None):
+    """Записывает индекс: словарь терминов по возрастанию, постинги delta+varint, веса float32.
+
+    postings[term] — номера документов (позиции в doc_ids) по возрастанию,
+    weights[term] — веса в том же порядке; без weights получается индекс только для булева поиска.
+    extra_sections — дополнительные именованные секции (имя до 8 символов ASCII).
+    """
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    info = np.zeros(len(terms), dtype=TERM_INFO)
+
+    encoded = []
+    weight_parts = []
+    postings_offset = 0
+    weights_offset = 0
+    for i, term in enumerate(terms):
+        docs = np.asarray(postings[term], dtype=np.int64)
+        deltas = np.diff(docs, prepend=0)
+        data = encode_varints(deltas)
+        encoded.append(data.tobytes())
+
+        record = info[i]
+        record["df"] = len(docs)
+        record["postings_offset"] = postings_offset
+        record["postings_length"] = len(data)
+        record["idf"] = idf.get(term, 0.0) if idf else 0.0
+        postings_offset += len(data)
+
+        if weights is not None:
+            term_weights = np.asarray(weights[term], dtype="<f4")
+            record["weights_offset"] = weights_offset
+            record["max_weight"] = term_weights.max(initial=0.0)
+            weight_parts.append(term_weights.tobytes())
+            weights_offset += len(term_weights)
+
+    sections = [
+        (b"docs", _string_table([doc_id.encode("utf-8") for doc_id in doc_ids])),
+        (b"terms", _string_table([term.encode("utf-8") for term in terms])),
+        (b"tinfo", info.tobytes()),
+        (b"post", b"".join(encoded)),
+    ]
+    if weights is not None:
+        sections.append((b"weights", b"".join(weight_parts)))
+    for name, data in (extra_sections or {}).items():
+        sections.append((name.encode("ascii"), data))
+
+    _write_sections(path, sections)
+
+
+def _write_sections(path: str, sections: List[Tuple[bytes, bytes]]):
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for name, data in sections:
+        # Секции выровнены по 8 байт, чтобы массивы читались из mmap без копирования
+        offset += -offset % 8
+        table.append((name, offset, len(data)))
+        offset += len(data)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(sections)))
+        for name, section_offset, length in table:
+            f.write(_SECTION.pack(name, section_offset, length))
+        for (_, data), (_, section_offset, _) in zip(sections, table):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, path)
+    metrics.count("index_bytes_written", offset)
+
+
+class BinaryIndex:
+    """Индекс, открытый через mmap: при открытии читается только заголовок,
+    страницы постингов подгружаются системой по мере обращения к терминам"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат индекса")
+
+        self._sections = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(self._buffer, _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+
+        self.doc_ids = _StringTable(self._buffer, self._sections["docs"][0])
+        self.terms = _StringTable(self._buffer, self._sections["terms"][0])
+        self._keys = _RawKeys(self.terms)
+        self._info = np.frombuffer(self._buffer, dtype=TERM_INFO, count=len(self.terms),
+                                   offset=self._sections["tinfo"][0])
+        self.has_weights = "weights" in self._sections
+        self._dictionary = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def has_section(self, name: str) -> bool:
+        return name in self._sections
+
+    def section(self, name: str, dtype=np.uint8) -> np.ndarray:
+        """Содержимое секции как массив NumPy поверх mmap, без копирования"""
+        offset, length = self._sections[name]
+        return np.frombuffer(self._buffer, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    @property
+    def dictionary(self) -> TermDictionary:
+        """Сжатый словарь терминов для шаблонов и нечёткого поиска, строится при первом обращении.
+        Обычным запросам он не нужен: поиск берёт его только для шаблона или исправления опечатки"""
+        if self._dictionary is None:
+            self._dictionary = TermDictionary(self.terms)
+        return self._dictionary
+
+    def close(self):
+        self._buffer.close()
+
+    def term_id(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+
+    def doc_numbers(self, term: str) -> np.ndarray:
+        term_id = self.term_id(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32)
+        return self.doc_numbers_at(term_id)
+
+    def doc_numbers_at(self, term_id: int) -> np.ndarray:
+        """Постинги термина по его номеру в словаре (см. term_id)"""
+        record = self._info[term_id]
+        start = self._sections["post"][0] + int(record["postings_offset"])
+        data = np.frombuffer(self._buffer, dtype=np.uint8, count=int(record["postings_length"]), offset=start)
+        return np.cumsum(decode_varints(data)).astype(np.int32)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        term_id = self.term_id(term)
+        if term_id is None or not self.has_weights:
+            return None
+        record = self._info[term_id]
+        weights = np.frombuffer(self._buffer, dtype="<f4", count=int(record["df"]),
+                                offset=self._sections["weights"][0] + 4 * int(record["weights_offset"]))
+        return self.doc_numbers_at(term_id), weights
+
+    def df(self, term: str) -> int:
+        term_id = self.term_id(term)
+        return 0 if term_id is None else int(self._info[term_id]["df"])
+
+    def idf(self, term: str) -> Optional[float]:
+        term_id = self.term_id(term)
+        return None if term_id is None else float(self._info[term_id]["idf"])
+
+    def max_weight(self, term: str) -> float:
+        term_id = self.term_id(term)
+        return 0.0 if term_id is None else float(self._info[term_id]["max_weight"])
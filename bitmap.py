@@ -0,0 +1,73 @@
+from typing import Iterable
+
+import numpy as np
+
+WORD_BITS = 64
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+class Bitmap:
+    """Множество номеров документов 0..size-1, упакованное по 64 бита в слово.
+    Пересечение, объединение и дополнение выполняются сразу над словами."""
+    __slots__ = ("words", "size")
+
+    def __init__(self, words: np.ndarray, size: int):
+        self.words = words
+        self.size = size
+
+    @staticmethod
+    def _word_count(size: int) -> int:
+        return (size + WORD_BITS - 1) // WORD_BITS
+
+    @classmethod
+    def empty(cls, size: int) -> "Bitmap":
+        return cls(np.zeros(cls._word_count(size), dtype=np.uint64), size)
+
+    @classmethod
+    def full(cls, size: int) -> "Bitmap":
+        return ~cls.empty(size)
+
+    @classmethod
+    def from_indices(cls, indices: Iterable[int], size: int) -> "Bitmap":
+        bits = np.zeros(cls._word_count(size) * WORD_BITS, dtype=bool)
+        bits[np.asarray(indices, dtype=np.int64)] = True
+        return cls(np.packbits(bits, bitorder="little").view(np.uint64), size)
+
+    def to_indices(self) -> np.ndarray:
+        bits = np.unpackbits(self.words.view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits[:self.size])
+
+    def __len__(self) -> int:
+        return _popcount(self.words)
+
+    def __bool__(self) -> bool:
+        return bool(self.words.any())
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.words & other.words, self.size)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.words | other.words, self.size)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.words & ~other.words, self.size)
+
+    def __invert__(self) -> "Bitmap":
+        words = ~self.words
+        tail = self.size % WORD_BITS
+        if tail:
+            # Биты за последним документом должны оставаться нулевыми
+            words[-1] &= np.uint64((1 << tail) - 1)
+        return Bitmap(words, self.size)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and self.size == other.size and np.array_equal(self.words, other.words)
+
+    def __contains__(self, doc: int) -> bool:
+        return 0 <= doc < self.size and bool(int(self.words[doc // WORD_BITS]) >> (doc % WORD_BITS) & 1)
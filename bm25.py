@@ -0,0 +1,149 @@
+"""Ранжирование BM25 по заранее посчитанным вкладам (impacts).
+
+Вклад леммы в оценку документа зависит только от пары (лемма, документ), поэтому он
+считается при построении индекса и хранится квантованным до uint8 или uint16 с общим
+масштабом. Запрос сводится к сложению целых чисел по постингам его лемм.
+"""
+import argparse
+import os
+import re
+import struct
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from binary_index import BinaryIndex, write_binary_index
+from term_dictionary import TermDictionary
+
+BM25_INDEX_FILE = "bm25_index.bin"
+K1 = 1.2
+B = 0.75
+IMPACT_BITS = 16  # 16 или 8: 8 бит вдвое компактнее, но оценки грубее и чаще совпадают
+
+# Параметры BM25 и масштаб, на который умножается целая оценка, чтобы получить настоящую
+_PARAMS = struct.Struct("<ddId")
+
+
+def bm25_idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    return np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def write_bm25_index(path: str, doc_ids: List[str], doc_counts: Sequence[Dict[str, int]],
+                     k1: float = K1, b: float = B, bits: int = IMPACT_BITS):
+    """doc_counts[i] — сколько раз каждая лемма встречается в документе doc_ids[i]"""
+    if bits not in (8, 16):
+        raise ValueError("Вклады хранятся в 8 или 16 битах")
+
+    postings = defaultdict(list)
+    counts = defaultdict(list)
+    for doc_num, lemma_counts in enumerate(doc_counts):
+        for lemma, count in lemma_counts.items():
+            postings[lemma].append(doc_num)
+            counts[lemma].append(count)
+
+    lengths = np.array([sum(lemma_counts.values()) for lemma_counts in doc_counts], dtype=np.float64)
+    avg_length = lengths.mean() if len(lengths) else 0.0
+    # Знаменатель BM25 без tf зависит только от длины документа
+    length_norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(len(lengths), k1)
+
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    impacts = []
+    for term in terms:
+        docs = np.array(postings[term])
+        tf = np.array(counts[term], dtype=np.float64)
+        idf = bm25_idf(len(docs), len(doc_ids))
+        impacts.append(idf * tf * (k1 + 1) / (tf + length_norm[docs]))
+
+    top = max((float(term_impacts.max()) for term_impacts in impacts), default=0.0)
+    scale = top / (2 ** bits - 1) if top else 1.0
+    dtype = np.dtype(f"<u{bits // 8}")
+    # Ненулевой вклад не округляется до нуля, иначе документ пропал бы из выдачи по лемме
+    quantized = [np.maximum(1, np.rint(term_impacts / scale)).astype(dtype) for term_impacts in impacts]
+    offsets = np.concatenate(([0], np.cumsum([len(q) for q in quantized]))).astype("<u8")
+
+    write_binary_index(path, doc_ids, postings, extra_sections={
+        "bm25": _PARAMS.pack(k1, b, bits, scale),
+        "impoffs": offsets.tobytes(),
+        "impacts": b"".join(q.tobytes() for q in quantized),
+    })
+
+
+class BM25Index:
+    """Индекс BM25, открытый через mmap"""
+
+    def __init__(self, path: str = BM25_INDEX_FILE):
+        self.index = BinaryIndex(path)
+        self.doc_ids = self.index.doc_ids
+        self.k1, self.b, self.bits, self.scale = _PARAMS.unpack(self.index.section("bm25").tobytes())
+        self._offsets = self.index.section("impoffs", "<u8")
+        self._impacts = self.index.section("impacts", f"<u{self.bits // 8}")
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def dictionary(self) -> TermDictionary:
+        return self.index.dictionary
+
+    def df(self, lemma: str) -> int:
+        return self.index.df(lemma)
+
+    def postings(self, lemma: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Номера документов и целые вклады леммы"""
+        term_id = self.index.term_id(lemma)
+        if term_id is None:
+            return None
+        start, end = self._offsets[term_id:term_id + 2]
+        return self.index.doc_numbers_at(term_id), self._impacts[start:end]
+
+    def search(self, lemmas: List[str], top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Лемма, повторённая в запросе, учитывается столько раз, сколько повторена"""
+        if not lemmas or not len(self):
+            return []
+
+        with metrics.timer("scoring"):
+            scores = np.zeros(len(self), dtype=np.uint32)
+            for lemma, query_tf in Counter(lemmas).items():
+                found = self.postings(lemma)
+                if found is not None:
+                    docs, impacts = found
+                    # Внутри списка документы не повторяются, поэтому сложение по индексам корректно
+                    scores[docs] += impacts.astype(np.uint32) * query_tf
+
+        with metrics.timer("sort"):
+            candidates = np.flatnonzero(scores)
+            metrics.count("candidates_scored", len(candidates))
+            if top_k is not None and top_k < len(candidates):
+                if top_k <= 0:
+                    return []
+                kth = np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]
+                candidates = candidates[scores[candidates] >= kth]
+
+            # При равных оценках выше документ с меньшим номером, как и в остальных режимах
+            order = np.lexsort((candidates, -scores[candidates].astype(np.int64)))[:top_k]
+            return [(self.doc_ids[candidates[i]], float(scores[candidates[i]]) * self.scale) for i in order]
+
+
+def read_counts_folder(folder: str) -> Tuple[List[str], List[Dict[str, int]]]:
+    """Документы из lemma_counts_N.txt (см. lemmas.py) по возрастанию номера"""
+    doc_nums = sorted(int(match.group(1)) for match in
+                      (re.fullmatch(r"lemma_counts_(\d+)\.txt", name) for name in os.listdir(folder)) if match)
+    doc_counts = []
+    for doc_num in doc_nums:
+        with open(os.path.join(folder, f"lemma_counts_{doc_num}.txt"), encoding="utf-8") as f:
+            doc_counts.append({lemma: int(count) for lemma, count in (line.split() for line in f if line.strip())})
+    return [str(doc_num) for doc_num in doc_nums], doc_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts-dir", default="lemma_counts", help="папка с lemma_counts_N.txt из lemmas.py")
+    parser.add_argument("--bits", type=int, choices=(8, 16), default=IMPACT_BITS)
+    parser.add_argument("--output", default=BM25_INDEX_FILE)
+    args = parser.parse_args()
+
+    doc_ids, doc_counts = read_counts_folder(args.counts_dir)
+    write_bm25_index(args.output, doc_ids, doc_counts, bits=args.bits)
+    print(f"Индекс BM25 сохранен в {args.output}: документов {len(doc_ids)}, вклады по {args.bits} бит")
@@ -0,0 +1,367 @@
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from bitmap import Bitmap
+from term_dictionary import fuzzy_distance, is_pattern
+
+OPERATORS = ('and', 'or', 'not')
+NEAR_RE = re.compile(r'near/(\d+)')
+FUZZY_RE = re.compile(r'(.+)~(\d*)')
+MAX_FUZZY_DISTANCE = 2  # больше опечаток — слишком много похожих терминов и долгий перебор словаря
+
+
+class Term(NamedTuple):
+    text: str
+
+
+class Not(NamedTuple):
+    child: "Node"
+
+
+class And(NamedTuple):
+    children: Tuple["Node", ...]
+
+
+class Or(NamedTuple):
+    children: Tuple["Node", ...]
+
+
+class Const(NamedTuple):
+    value: bool
+
+
+class Phrase(NamedTuple):
+    """Слова подряд в этом порядке, в запросе — в кавычках"""
+    words: Tuple[str, ...]
+
+
+class Near(NamedTuple):
+    """Два слова в любом порядке не дальше distance позиций друг от друга: первое NEAR/3 второе"""
+    words: Tuple[str, str]
+    distance: int
+
+
+class Wildcard(NamedTuple):
+    """Шаблон термина: * — любая подстрока, ? — один символ"""
+    pattern: str
+
+
+class Fuzzy(NamedTuple):
+    """Термин с опечатками: слово~ (допуск по длине слова) или слово~N"""
+    word: str
+    distance: int
+
+
+Node = Union[Term, Not, And, Or, Const, Phrase, Near, Wildcard, Fuzzy]
+
+EMPTY = Const(False)  # ни одного документа
+ALL = Const(True)     # все документы
+
+
+def normalize_text(query: str) -> str:
+    """Ключ кэша планов: запрос в нижнем регистре с одиночными пробелами"""
+    return ' '.join(query.lower().split())
+
+
+def tokenize(query: str) -> List[str]:
+    """Токены запроса; фраза в кавычках — один токен вместе с кавычками"""
+    tokens = []
+    current = []
+    in_quotes = False
+    for char in query:
+        if char == '"':
+            if in_quotes:
+                tokens.append('"' + ''.join(current) + '"')
+                current = []
+            elif current:
+                tokens.append(''.join(current))
+                current = []
+            in_quotes = not in_quotes
+        elif in_quotes:
+            current.append(char)
+        elif char in '()' or char.isspace():
+            if current:
+                tokens.append(''.join(current))
+                current = []
+            if not char.isspace():
+                tokens.append(char)
+        else:
+            current.append(char)
+    if in_quotes:
+        raise ValueError("Некорректное выражение: не закрыта кавычка")
+    if current:
+        tokens.append(''.join(current))
+    return tokens
+
+
+class _Parser:
+    """Рекурсивный спуск; приоритет операторов: NEAR/n > NOT > AND > OR"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Некорректное выражение: лишний токен '{self.peek()}'")
+        return node
+
+    def parse_or(self) -> Node:
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self) -> Node:
+        children = [self.parse_not()]
+        while self.peek() == 'and':
+            self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_not(self) -> Node:
+        if self.peek() == 'not':
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_near()
+
+    def parse_near(self) -> Node:
+        node = self.parse_atom()
+        match = NEAR_RE.fullmatch(self.peek() or '')
+        if match is None:
+            return node
+        self.take()
+        right = self.parse_atom()
+        if not isinstance(node, Term) or not isinstance(right, Term) or NEAR_RE.fullmatch(self.peek() or ''):
+            raise ValueError("Некорректное выражение: NEAR/n соединяет два слова")
+        # Порядок слов не важен, поэтому храним их по алфавиту
+        return Near(tuple(sorted((node.text, right.text))), int(match.group(1)))
+
+    def parse_atom(self) -> Node:
+        token = self.take()
+        if token is None:
+            raise ValueError("Некорректное выражение: запрос оборвался, ожидался термин")
+        if token == '(':
+            node = self.parse_or()
+            if self.take() != ')':
+                raise ValueError("Некорректное выражение: не закрыта скобка")
+            return node
+        if token == ')' or token in OPERATORS or NEAR_RE.fullmatch(token):
+            raise ValueError(f"Некорректное выражение: ожидался термин, получено '{token}'")
+        if token.startswith('"'):
+            words = tuple(token.strip('"').split())
+            if not words:
+                raise ValueError("Некорректное выражение: пустая фраза в кавычках")
+            return Phrase(words) if len(words) > 1 else Term(words[0])
+        match = FUZZY_RE.fullmatch(token)
+        if match is not None:
+            word, distance = match.group(1), match.group(2)
+            distance = int(distance) if distance else fuzzy_distance(word)
+            if distance > MAX_FUZZY_DISTANCE:
+                raise ValueError(f"Некорректное выражение: допускается не больше {MAX_FUZZY_DISTANCE} опечаток")
+            return Fuzzy(word, distance)
+        if is_pattern(token):
+            return Wildcard(token)
+        return Term(token)
+
+
+def parse(query: str) -> Node:
+    return _Parser(tokenize(query.lower())).parse()
+
+
+def to_text(node: Node) -> str:
+    """Каноническая запись дерева; у нормализованных деревьев совпадает для равных запросов"""
+    if isinstance(node, Term):
+        return node.text
+    if isinstance(node, Const):
+        return '<all>' if node.value else '<empty>'
+    if isinstance(node, Phrase):
+        return '"' + ' '.join(node.words) + '"'
+    if isinstance(node, Near):
+        return f"{node.words[0]} near/{node.distance} {node.words[1]}"
+    if isinstance(node, Wildcard):
+        return node.pattern
+    if isinstance(node, Fuzzy):
+        return f"{node.word}~{node.distance}"
+    if isinstance(node, Not):
+        return f"not {to_text(node.child)}"
+    operator = ' and ' if isinstance(node, And) else ' or '
+    return '(' + operator.join(to_text(child) for child in node.children) + ')'
+
+
+def expand(node: Node, terms: Callable[[Node], Sequence[str]]) -> Node:
+    """Заменяет шаблоны и термины с опечатками на OR найденных по словарю терминов;
+    terms(node) возвращает найденные термины. Выполняется до normalize и plan"""
+    if isinstance(node, (Wildcard, Fuzzy)):
+        found = terms(node)
+        if not found:
+            return EMPTY
+        return Term(found[0]) if len(found) == 1 else Or(tuple(Term(term) for term in found))
+    if isinstance(node, Not):
+        return Not(expand(node.child, terms))
+    if isinstance(node, (And, Or)):
+        return type(node)(tuple(expand(child, terms) for child in node.children))
+    return node
+
+
+def normalize(node: Node) -> Node:
+    """Убирает двойное отрицание, спускает NOT к листьям по де Моргану,
+    раскрывает вложенные AND/OR одного вида и упорядочивает операнды"""
+    if isinstance(node, (Term, Const, Phrase, Near, Wildcard, Fuzzy)):
+        return node
+
+    if isinstance(node, Not):
+        child = node.child
+        if isinstance(child, Not):
+            return normalize(child.child)
+        if isinstance(child, Const):
+            return Const(not child.value)
+        if isinstance(child, And):
+            return normalize(Or(tuple(Not(c) for c in child.children)))
+        if isinstance(child, Or):
+            return normalize(And(tuple(Not(c) for c in child.children)))
+        return node
+
+    kind = type(node)
+    children = {}
+    for child in node.children:
+        child = normalize(child)
+        for part in (child.children if isinstance(child, kind) else (child,)):
+            children.setdefault(to_text(part), part)
+
+    if len(children) == 1:
+        return next(iter(children.values()))
+    return kind(tuple(children[key] for key in sorted(children)))
+
+
+def plan(node: Node, df: Callable[[str], int], n_docs: int) -> Node:
+    """Сворачивает константы (термины без документов — пустое множество)
+    и расставляет операнды AND по возрастанию оценки числа документов"""
+    return _fold(node, df, n_docs)[0]
+
+
+def _fold(node: Node, df: Callable[[str], int], n_docs: int) -> Tuple[Node, int]:
+    if isinstance(node, Const):
+        return node, n_docs if node.value else 0
+
+    if isinstance(node, Term):
+        count = df(node.text)
+        return (node, count) if count else (EMPTY, 0)
+
+    if isinstance(node, (Phrase, Near)):
+        # Документов не больше, чем у самого редкого слова
+        count = min(df(word) for word in node.words)
+        return (node, count) if count else (EMPTY, 0)
+
+    if isinstance(node, Not):
+        child, count = _fold(node.child, df, n_docs)
+        if isinstance(child, Const):
+            return Const(not child.value), n_docs - count
+        return Not(child), n_docs - count
+
+    folded = [_fold(child, df, n_docs) for child in node.children]
+
+    if isinstance(node, And):
+        if any(child == EMPTY for child, _ in folded):
+            return EMPTY, 0
+        folded = [(child, count) for child, count in folded if child != ALL]
+        if not folded:
+            return ALL, n_docs
+        # Сначала самые избирательные операнды; отрицания в конце — они вычитаются из результата
+        folded.sort(key=lambda item: (isinstance(item[0], Not), item[1]))
+        count = min(count for _, count in folded)
+    else:
+        if any(child == ALL for child, _ in folded):
+            return ALL, n_docs
+        folded = [(child, count) for child, count in folded if child != EMPTY]
+        if not folded:
+            return EMPTY, 0
+        count = min(n_docs, sum(count for _, count in folded))
+
+    if len(folded) == 1:
+        return folded[0]
+    return type(node)(tuple(child for child, _ in folded)), count
+
+
+def execute(node: Node, term_docs: Callable[[str], Bitmap], n_docs: int,
+            positional_docs: Optional[Callable[[Node], Bitmap]] = None,
+            memo: Optional[Dict[str, Bitmap]] = None) -> Bitmap:
+    """positional_docs вычисляет фразы и NEAR по позиционному индексу.
+    memo — общие для пачки запросов результаты подвыражений по их тексту (to_text)"""
+    if memo is not None and isinstance(node, (Not, And, Or, Phrase, Near)):
+        key = to_text(node)
+        result = memo.get(key)
+        if result is None:
+            result = memo[key] = _execute(node, term_docs, n_docs, positional_docs, memo)
+        return result
+    return _execute(node, term_docs, n_docs, positional_docs, memo)
+
+
+def _execute(node: Node, term_docs: Callable[[str], Bitmap], n_docs: int,
+             positional_docs: Optional[Callable[[Node], Bitmap]], memo: Optional[Dict[str, Bitmap]]) -> Bitmap:
+    if isinstance(node, Term):
+        return term_docs(node.text)
+    if isinstance(node, (Phrase, Near)):
+        if positional_docs is None:
+            raise ValueError("Для фраз и NEAR нужен позиционный индекс")
+        return positional_docs(node)
+    if isinstance(node, Const):
+        return Bitmap.full(n_docs) if node.value else Bitmap.empty(n_docs)
+    if isinstance(node, Not):
+        return ~execute(node.child, term_docs, n_docs, positional_docs, memo)
+    if isinstance(node, Or):
+        result = execute(node.children[0], term_docs, n_docs, positional_docs, memo)
+        for child in node.children[1:]:
+            result = result | execute(child, term_docs, n_docs, positional_docs, memo)
+        return result
+
+    # AND: пересекаем по порядку плана и останавливаемся на пустом результате
+    result = None
+    for child in node.children:
+        if isinstance(child, Not):
+            if result is None:
+                result = Bitmap.full(n_docs)
+            result = result - execute(child.child, term_docs, n_docs, positional_docs, memo)
+        else:
+            docs = execute(child, term_docs, n_docs, positional_docs, memo)
+            result = docs if result is None else result & docs
+        if not result:
+            break
+    return result
+
+
+class PlanCache:
+    """LRU скомпилированных планов по нормализованному тексту запроса"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._plans = OrderedDict()
+
+    def get(self, key: str):
+        plan_ = self._plans.get(key)
+        if plan_ is not None:
+            self._plans.move_to_end(key)
+        return plan_
+
+    def put(self, key: str, plan_: Node):
+        self._plans[key] = plan_
+        self._plans.move_to_end(key)
+        if len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+
+    def clear(self):
+        self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
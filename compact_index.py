@@ -0,0 +1,180 @@
+"""Компактный индекс tf-idf в памяти — для рабочих процессов, обслуживающих запросы.
+
+search.load_index держит словарь словарей «статья -> лемма -> (idf, tf-idf)»: на каждую пару
+приходятся ключ, кортеж и два объекта float, а IDF леммы повторяется в каждой статье.
+Здесь леммы получают номера по алфавиту в сжатом словаре TermDictionary, постинги лежат
+столбцами NumPy (смещения по леммам, номера документов int32, веса float32, нормированные
+по длине документа, как в бинарном индексе), IDF — один вектор по номеру леммы, а статьи —
+целые номера, из которых, как и везде, получается URL вида URL_FOR_PARSE/номер.
+
+Набор методов тот же, что у binary_index.BinaryIndex (doc_ids, postings, df, idf, max_weight,
+dictionary, doc_numbers), поэтому search.search, search.search_many и
+BooleanSearchEngine.from_index работают с ним так же. Запуск из корня репозитория:
+    python compact_index.py  — размер индекса по tf_idf.npz
+"""
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from count_tf_and_idf import TF_IDF_FILE, TfIdf, load_tf_idf
+from term_dictionary import TermDictionary
+
+# Номера недавних лемм запросов: без кэша каждый поиск номера разбирает блок словаря
+TERM_ID_CACHE_SIZE = 4096
+
+
+class _DocIds(Sequence):
+    """Номера статей как строки doc_id, без отдельного объекта str на каждую статью"""
+
+    def __init__(self, numbers: np.ndarray):
+        self.numbers = numbers
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [str(number) for number in self.numbers[i].tolist()]
+        return str(int(self.numbers[i]))
+
+
+class CompactIndex:
+    """Постинги по леммам в столбцах NumPy (формат CSC: статьи × леммы по столбцам)"""
+
+    def __init__(self, doc_numbers: np.ndarray, dictionary: TermDictionary, idf: np.ndarray, offsets: np.ndarray,
+                 docs: np.ndarray, weights: np.ndarray, norms: np.ndarray):
+        self.doc_ids = _DocIds(doc_numbers)
+        self.dictionary = dictionary
+        self._idf = idf
+        self._offsets = offsets
+        self._docs = docs
+        self._weights = weights
+        self._norms = norms
+        self._term_ids = OrderedDict()
+        self._term_ids_lock = threading.Lock()
+        self._max_weights = np.zeros(len(idf), dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(offsets))
+        if len(nonempty):
+            self._max_weights[nonempty] = np.maximum.reduceat(weights, offsets[nonempty])
+
+    @classmethod
+    def from_matrix(cls, doc_numbers: np.ndarray, terms: Sequence, idf: np.ndarray, matrix: csr_matrix) -> "CompactIndex":
+        """matrix — tf-idf «статья × лемма», леммы по алфавиту; явные нули остаются постингами,
+        как в бинарном индексе, чтобы df совпадал"""
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        norms = np.sqrt(np.bincount(rows, weights=matrix.data * matrix.data, minlength=matrix.shape[0]))
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        # Нормировка прямо по данным: multiply у scipy выбросил бы явные нули
+        normalized = csr_matrix((matrix.data * scale[rows], matrix.indices, matrix.indptr),
+                                shape=matrix.shape)
+        columns = normalized.tocsc()
+        columns.sort_indices()
+        return cls(np.asarray(doc_numbers, dtype=np.int32), TermDictionary(terms), np.asarray(idf, dtype=np.float64),
+                   columns.indptr.astype(np.int64), columns.indices.astype(np.int32),
+                   columns.data.astype(np.float32), norms)
+
+    @classmethod
+    def from_tf_idf(cls, result: TfIdf) -> "CompactIndex":
+        """Из результата count_tf_and_idf без промежуточного словаря словарей"""
+        return cls.from_matrix(result.doc_ids, result.terms.tolist(), result.idf, result.tf_idf)
+
+    @classmethod
+    def from_index(cls, index: Dict[str, Dict[str, Tuple[float, float]]]) -> "CompactIndex":
+        """Из индекса в формате search.load_index; doc_id — номера статей"""
+        terms = sorted({lemma for doc_data in index.values() for lemma in doc_data})
+        term_ids = {lemma: term_id for term_id, lemma in enumerate(terms)}
+        idf = np.zeros(len(terms))
+        indptr = [0]
+        indices = []
+        data = []
+        for doc_data in index.values():
+            for lemma, (lemma_idf, tfidf) in doc_data.items():
+                idf[term_ids[lemma]] = lemma_idf
+                indices.append(term_ids[lemma])
+                data.append(tfidf)
+            indptr.append(len(indices))
+        matrix = csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32),
+                             np.array(indptr, dtype=np.int64)), shape=(len(index), len(terms)))
+        matrix.sort_indices()
+        return cls.from_matrix(np.array([int(doc_id) for doc_id in index]), terms, idf, matrix)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Память под данные индекса: массивы и словарь лемм"""
+        arrays = (self.doc_ids.numbers, self._idf, self._offsets, self._docs, self._weights, self._norms,
+                  self._max_weights)
+        return sum(array.nbytes for array in arrays) + self.dictionary.nbytes
+
+    @property
+    def n_postings(self) -> int:
+        return len(self._docs)
+
+    def term_id(self, term: str) -> Optional[int]:
+        with self._term_ids_lock:
+            if term in self._term_ids:
+                self._term_ids.move_to_end(term)
+                return self._term_ids[term]
+            term_id = self._term_ids[term] = self.dictionary.term_id(term)
+            if len(self._term_ids) > TERM_ID_CACHE_SIZE:
+                self._term_ids.popitem(last=False)
+        return term_id
+
+    def doc_numbers(self, term: str) -> np.ndarray:
+        term_id = self.term_id(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32)
+        return self._docs[self._offsets[term_id]:self._offsets[term_id + 1]]
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        start, end = self._offsets[term_id], self._offsets[term_id + 1]
+        return self._docs[start:end], self._weights[start:end]
+
+    def df(self, term: str) -> int:
+        term_id = self.term_id(term)
+        return 0 if term_id is None else int(self._offsets[term_id + 1] - self._offsets[term_id])
+
+    def idf(self, term: str) -> Optional[float]:
+        term_id = self.term_id(term)
+        return None if term_id is None else float(self._idf[term_id])
+
+    def max_weight(self, term: str) -> float:
+        term_id = self.term_id(term)
+        return 0.0 if term_id is None else float(self._max_weights[term_id])
+
+    def document(self, doc_id: str) -> Dict[str, Tuple[float, float]]:
+        """Леммы статьи с (idf, tf-idf), как index[doc_id] у search.load_index.
+        Постинги лежат по леммам, поэтому это проход по всем постингам — для отладки, не для запросов;
+        tf-idf восстанавливается из нормированного веса float32 с той же точностью"""
+        doc_num = np.flatnonzero(self.doc_ids.numbers == int(doc_id))
+        if not len(doc_num):
+            raise KeyError(doc_id)
+        positions = np.flatnonzero(self._docs == doc_num[0])
+        term_ids = np.searchsorted(self._offsets, positions, side="right") - 1
+        norm = float(self._norms[doc_num[0]])
+        return {self.dictionary[term_id]: (float(self._idf[term_id]), float(self._weights[position]) * norm)
+                for term_id, position in zip(term_ids.tolist(), positions.tolist())}
+
+
+def open_compact_index(path: str = TF_IDF_FILE) -> CompactIndex:
+    """Индекс лемм из файла count_tf_and_idf.py"""
+    return CompactIndex.from_tf_idf(load_tf_idf(path)["lemmas"])
+
+
+if __name__ == "__main__":
+    if not os.path.exists(TF_IDF_FILE):
+        raise SystemExit(f"Нет {TF_IDF_FILE}: сначала запустите count_tf_and_idf.py")
+    index = open_compact_index()
+    print(f"Статей: {len(index)}, лемм: {len(index.dictionary)}, постингов: {index.n_postings}, "
+          f"в памяти {index.nbytes / 2 ** 20:.2f} МБ "
+          f"({index.nbytes / max(1, index.n_postings) * 1e6 / 2 ** 20:.1f} МБ на миллион постингов)")
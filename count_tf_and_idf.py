@@ -1,69 +1,168 @@
+"""TF-IDF токенов и лемм статей одним пакетным проходом.
+
+Термины всех статей получают целые номера по алфавиту, из них за один проход строится
+разреженная матрица «статья × термин» с числом вхождений. DF, IDF и tf-idf считаются
+операциями над столбцами и строками матрицы. Результат — один файл TF_IDF_FILE с обеими
+матрицами; текстовые output_tokens/ и output_lemmas/ пишутся только по флагу --text.
+"""
+import argparse
 import os
-import math
-from collections import defaultdict, Counter
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import metrics
+from index_writer import tokens_doc_ids
 
 # --- Константы ---
-ARTICLES_COUNT = 100
 TOKENS_DIR = 'lemmas_tokens'
 OUTPUT_TERMS_DIR = 'output_tokens'
 OUTPUT_LEMMAS_DIR = 'output_lemmas'
+TF_IDF_FILE = 'tf_idf.npz'
+KINDS = ('tokens', 'lemmas')
+
+
+class TfIdf(NamedTuple):
+    doc_ids: np.ndarray  # номер статьи по строке матрицы
+    terms: np.ndarray    # термин по столбцу, по алфавиту
+    idf: np.ndarray      # IDF по столбцу
+    tf_idf: csr_matrix   # статьи × термины
+
+
+@metrics.timed("read")
+def read_documents(doc_ids: Sequence[int], tokens_dir: str = TOKENS_DIR) -> Tuple[List[List[str]], List[List[str]]]:
+    """Токены (tokens_N.txt) и леммы (первый столбец lemmas_N.txt) каждой статьи"""
+    tokens = []
+    lemmas = []
+    for i in doc_ids:
+        with open(os.path.join(tokens_dir, f'tokens_{i}.txt'), encoding='utf-8') as f:
+            tokens.append([line.strip().lower() for line in f if line.strip()])
+        with open(os.path.join(tokens_dir, f'lemmas_{i}.txt'), encoding='utf-8') as f:
+            lemmas.append([line.strip().split()[0].lower() for line in f if line.strip()])
+    return tokens, lemmas
+
+
+def count_matrix(documents: List[List[str]]) -> Tuple[np.ndarray, csr_matrix]:
+    """Словарь (по алфавиту) и матрица числа вхождений «статья × термин»"""
+    lengths = np.fromiter((len(terms) for terms in documents), dtype=np.int64, count=len(documents))
+    # Номера в порядке появления, затем перенумерация по алфавиту: сортируется только словарь
+    ids = {}
+    term_ids = np.fromiter((ids.setdefault(term, len(ids)) for term in chain.from_iterable(documents)),
+                           dtype=np.int64, count=int(lengths.sum()))
+    terms = np.array(list(ids), dtype=str)
+    order = np.argsort(terms, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    terms = terms[order]
+    rows = np.repeat(np.arange(len(documents)), lengths)
+    # Повторы термина в статье складываются при построении матрицы
+    counts = csr_matrix((np.ones(len(term_ids)), (rows, rank[term_ids])), shape=(len(documents), len(terms)))
+    counts.sum_duplicates()
+    return terms, counts
+
+
+@metrics.timed("tf_idf")
+def compute_tf_idf(doc_ids: Sequence[int], documents: List[List[str]]) -> TfIdf:
+    terms, counts = count_matrix(documents)
+    n_docs = counts.shape[0]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log(n_docs / df)
+
+    # tf — доля вхождений термина среди всех терминов статьи
+    totals = np.asarray(counts.sum(axis=1)).ravel()
+    inverse_totals = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+    tf_idf = counts.multiply(inverse_totals.reshape(-1, 1)).multiply(idf.reshape(1, -1)).tocsr()
+    tf_idf.sort_indices()
+    return TfIdf(np.asarray(doc_ids, dtype=np.int64), terms, idf, tf_idf)
+
+
+@metrics.timed("index_write")
+def save_tf_idf(results: Dict[str, TfIdf], path: str = TF_IDF_FILE):
+    arrays = {}
+    for kind, result in results.items():
+        arrays[f'{kind}_doc_ids'] = result.doc_ids
+        arrays[f'{kind}_terms'] = result.terms
+        arrays[f'{kind}_idf'] = result.idf
+        arrays[f'{kind}_indptr'] = result.tf_idf.indptr
+        arrays[f'{kind}_indices'] = result.tf_idf.indices
+        arrays[f'{kind}_data'] = result.tf_idf.data
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+
+def load_tf_idf(path: str = TF_IDF_FILE) -> Dict[str, TfIdf]:
+    results = {}
+    with np.load(path) as arrays:
+        for kind in KINDS:
+            doc_ids = arrays[f'{kind}_doc_ids']
+            terms = arrays[f'{kind}_terms']
+            matrix = csr_matrix((arrays[f'{kind}_data'], arrays[f'{kind}_indices'], arrays[f'{kind}_indptr']),
+                                shape=(len(doc_ids), len(terms)))
+            results[kind] = TfIdf(doc_ids, terms, arrays[f'{kind}_idf'], matrix)
+    return results
+
+
+def to_index(result: TfIdf) -> Dict[str, Dict[str, Tuple[float, float]]]:
+    """Индекс в формате search.load_index: статья -> термин -> (idf, tf-idf)"""
+    terms = result.terms.tolist()
+    idf = result.idf.tolist()
+    matrix = result.tf_idf
+    index = {}
+    for row, doc_id in enumerate(result.doc_ids.tolist()):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        index[str(doc_id)] = {terms[col]: (idf[col], weight)
+                              for col, weight in zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist())}
+    return index
+
+
+@metrics.timed("index_write")
+def export_text(result: TfIdf, folder: str, suffix: str):
+    """Файлы article_N_<suffix>.txt со строками «термин idf tf-idf», как раньше"""
+    os.makedirs(folder, exist_ok=True)
+    terms = result.terms.tolist()
+    idf = result.idf.tolist()
+    matrix = result.tf_idf
+    for row, doc_id in enumerate(result.doc_ids.tolist()):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        lines = [f'{terms[col]} {idf[col]:.6f} {weight:.6f}\n'
+                 for col, weight in zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist())]
+        with open(os.path.join(folder, f'article_{doc_id}_{suffix}.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+
+
+def run(tokens_dir: str = TOKENS_DIR, count: Optional[int] = None, output: str = TF_IDF_FILE,
+        terms_dir: Optional[str] = None, lemmas_dir: Optional[str] = None) -> Dict[str, TfIdf]:
+    """count — взять только первые count статей; terms_dir и lemmas_dir — куда выгрузить текст"""
+    doc_ids = tokens_doc_ids(tokens_dir)[:count]
+    tokens, lemmas = read_documents(doc_ids, tokens_dir)
+    results = {'tokens': compute_tf_idf(doc_ids, tokens), 'lemmas': compute_tf_idf(doc_ids, lemmas)}
+    save_tf_idf(results, output)
+    if terms_dir:
+        export_text(results['tokens'], terms_dir, 'tokens')
+    if lemmas_dir:
+        export_text(results['lemmas'], lemmas_dir, 'lemmas')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens-dir', default=TOKENS_DIR, help='папка с tokens_N.txt и lemmas_N.txt из lemmas.py')
+    parser.add_argument('--count', type=int, help='обработать только первые COUNT статей (по умолчанию все)')
+    parser.add_argument('--output', default=TF_IDF_FILE)
+    parser.add_argument('--text', action='store_true', help='дополнительно записать текстовые файлы по статьям')
+    parser.add_argument('--terms-dir', default=OUTPUT_TERMS_DIR)
+    parser.add_argument('--lemmas-dir', default=OUTPUT_LEMMAS_DIR)
+    parser.add_argument('--metrics', action='store_true', help='вывести время по стадиям')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
 
-# --- Создание директорий ---
-os.makedirs(OUTPUT_TERMS_DIR, exist_ok=True)
-os.makedirs(OUTPUT_LEMMAS_DIR, exist_ok=True)
-
-# --- Подготовка ---
-doc_term_counts = []
-doc_lemma_counts = []
-term_df = defaultdict(int)
-lemma_df = defaultdict(int)
-
-# --- Обработка документов ---
-for i in range(1, ARTICLES_COUNT + 1):
-    tokens_path = os.path.join(TOKENS_DIR, f'tokens_{i}.txt')
-    lemmas_path = os.path.join(TOKENS_DIR, f'lemmas_{i}.txt')
-
-    # --- Чтение токенов ---
-    with open(tokens_path, encoding='utf-8') as f:
-        tokens = [line.strip().lower() for line in f if line.strip()]
-
-    # --- Чтение лемм (первый столбец каждой строки) ---
-    with open(lemmas_path, encoding='utf-8') as f:
-        lemma_lines = [line.strip().split()[0].lower() for line in f if line.strip()]
-
-    # --- Подсчёт частот ---
-    term_count = Counter(tokens)
-    lemma_count = Counter(lemma_lines)
-
-    doc_term_counts.append(term_count)
-    doc_lemma_counts.append(lemma_count)
-
-    for term in term_count:
-        term_df[term] += 1
-    for lemma in lemma_count:
-        lemma_df[lemma] += 1
-
-# --- IDF ---
-N = ARTICLES_COUNT
-idf_terms = {term: math.log(N / df) for term, df in term_df.items()}
-idf_lemmas = {lemma: math.log(N / df) for lemma, df in lemma_df.items()}
-
-# --- Запись результатов ---
-for i in range(1, ARTICLES_COUNT + 1):
-    term_count = doc_term_counts[i - 1]
-    lemma_count = doc_lemma_counts[i - 1]
-
-    total_terms = sum(term_count.values())
-    total_lemmas = sum(lemma_count.values())
-
-    with open(f'{OUTPUT_TERMS_DIR}/article_{i}_tokens.txt', 'w', encoding='utf-8') as f:
-        for term in sorted(term_count):
-            tf = term_count[term] / total_terms if total_terms else 0
-            tfidf = tf * idf_terms[term]
-            f.write(f'{term} {idf_terms[term]:.6f} {tfidf:.6f}\n')
-
-    with open(f'{OUTPUT_LEMMAS_DIR}/article_{i}_lemmas.txt', 'w', encoding='utf-8') as f:
-        for lemma in sorted(lemma_count):
-            tf = lemma_count[lemma] / total_lemmas if total_lemmas else 0
-            tfidf = tf * idf_lemmas[lemma]
-            f.write(f'{lemma} {idf_lemmas[lemma]:.6f} {tfidf:.6f}\n')
+    results = run(args.tokens_dir, args.count, args.output,
+                  args.terms_dir if args.text else None, args.lemmas_dir if args.text else None)
+    print(f"Статей: {len(results['lemmas'].doc_ids)}, токенов: {len(results['tokens'].terms)}, "
+          f"лемм: {len(results['lemmas'].terms)}; tf-idf сохранены в {args.output}")
+    if args.metrics:
+        print(metrics.registry.report())
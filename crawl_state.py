@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+STATE_FILE = "crawl_state.sqlite"
+MANIFEST_FILE = "changed_documents.json"
+
+ADDED = "added"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """Состояние обхода: для каждой ссылки постоянный номер документа,
+    ETag/Last-Modified последнего ответа и хэш сохранённого содержимого"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        # Соединение общее для потоков скачивания, запись под блокировкой
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                doc_id INTEGER UNIQUE NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                fetched_at REAL
+            )
+        """)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def seed_from_index_file(self, index_filename):
+        """Переносит номера документов из index.txt прежних обходов, если состояние ещё пустое"""
+        if self.documents() or not os.path.exists(index_filename):
+            return
+        with open(index_filename, encoding="utf-8") as file:
+            rows = [match.groups() for match in (re.match(r"(\d+)\. (\S+)", line) for line in file) if match]
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO pages (url, doc_id) VALUES (?, ?)",
+                                [(url, int(doc_id)) for doc_id, url in rows])
+            self.db.commit()
+
+    def doc_id(self, url):
+        """Номер документа для ссылки; новая ссылка получает следующий свободный номер"""
+        with self.lock:
+            row = self.db.execute("SELECT doc_id FROM pages WHERE url = ?", (url,)).fetchone()
+            if row:
+                return row[0]
+            doc_id = self.db.execute("SELECT COALESCE(MAX(doc_id), 0) + 1 FROM pages").fetchone()[0]
+            self.db.execute("INSERT INTO pages (url, doc_id) VALUES (?, ?)", (url, doc_id))
+            self.db.commit()
+            return doc_id
+
+    def conditional_headers(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT etag, last_modified FROM pages WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def record(self, url, etag, last_modified, digest):
+        """Сохраняет ответ 200 и сообщает, новый это документ, изменённый или прежний"""
+        with self.lock:
+            previous = self.db.execute("SELECT content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+            self.db.execute(
+                "UPDATE pages SET etag = ?, last_modified = ?, content_hash = ?, fetched_at = ? WHERE url = ?",
+                (etag, last_modified, digest, time.time(), url))
+            self.db.commit()
+        if previous is None or previous[0] is None:
+            return ADDED
+        return UNCHANGED if previous[0] == digest else CHANGED
+
+    def touch(self, url):
+        """Ответ 304: содержимое не менялось"""
+        with self.lock:
+            self.db.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+
+    def stored_hash(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def documents(self):
+        """Пары (номер документа, ссылка) по возрастанию номера"""
+        with self.lock:
+            return self.db.execute("SELECT doc_id, url FROM pages ORDER BY doc_id").fetchall()
+
+
+def write_manifest(statuses, state, path=MANIFEST_FILE):
+    """Список изменившихся документов для следующих шагов (lemmas.py и т.д.).
+
+    statuses — {ссылка: ADDED | CHANGED | UNCHANGED} для этого обхода;
+    документы из состояния, которых в этом обходе не было, попадают в removed.
+    """
+    manifest = {ADDED: [], CHANGED: [], UNCHANGED: [], "removed": []}
+    for doc_id, url in state.documents():
+        manifest[statuses.get(url, "removed")].append(doc_id)
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    print(f"Манифест изменений сохранен: {path} (новых: {len(manifest[ADDED])}, "
+          f"изменённых: {len(manifest[CHANGED])}, без изменений: {len(manifest[UNCHANGED])})")
+    return manifest
+
+
+def load_changed_documents(path=MANIFEST_FILE):
+    """Номера документов, которые нужно обработать заново: новые и изменённые"""
+    with open(path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    return sorted(manifest[ADDED] + manifest[CHANGED])
@@ -1,14 +1,27 @@
 import os
+import re
+import argparse
+import threading
 import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 import time
 
+from crawl_state import CrawlState, content_hash, write_manifest, UNCHANGED
+from html_text import TEXT_FOLDER, extract_text
+
 # Настройки
 START_URL = "https://organiclawn.ru/page"  # Ссылка на раздел новостей
 BASE_URL = "https://organiclawn.ru/"
 SAVE_DIR = "rt_articles"
 TOTAL_PAGES = 100  # Количество страниц для скачивания
 MAX_PAGES = 10  # Максимальное количество страниц для обхода (по 10 статей с каждой)
+WORKERS = 8  # Потоков скачивания в параллельном режиме
+PER_HOST_LIMIT = 4  # Одновременных запросов к одному хосту
+REQUESTS_PER_SECOND = 5.0  # Средняя частота запросов к одному хосту
+REQUEST_TIMEOUT = 30
 
 # Создаем папку для сохранения
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -21,27 +34,71 @@ headers = {
 # Глобальная переменная для хранения уже добавленных ссылок
 added_links = set()
 
+
+def make_session(pool_size=WORKERS):
+    """Сессия с пулом соединений: TCP/TLS-соединения переиспользуются между запросами"""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = make_session()
+
+
+def extract_article_links(html, base_url=BASE_URL):
+    """Достаёт из страницы списка ссылки на статьи в порядке появления"""
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+
+    # Ищем все ссылки на статьи
+    for article in soup.find_all("a", href=True):
+        href = article.get("href")
+        # Ищем ссылки на статьи, начинающиеся с "/news/"
+        if "#href" not in href and "category" not in href and "%" not in href and base_url in href and "page" not in href and href.count("/") == 4:
+            links.append(f"{base_url}{href}" if href.startswith("/") else href)
+
+    return links
+
+
+# Теги <script> вместе с содержимым и теги <link>
+SCRIPT_AND_LINK_RE = re.compile(r"<script\b.*?</script\s*>|<link\b[^>]*>", re.IGNORECASE | re.DOTALL)
+
+
+def clean_article_html(html):
+    """Удаляет теги <link> и <script> и возвращает HTML статьи; дерево документа не строится"""
+    return SCRIPT_AND_LINK_RE.sub("", html)
+
+
+def save_article(html, index, save_dir=SAVE_DIR, save_text=False):
+    """С save_text вместо HTML сохраняется извлечённый текст — его потом не нужно разбирать"""
+    return write_article(extract_text(html) if save_text else clean_article_html(html), index, save_dir)
+
+
+def write_article(cleaned_html, index, save_dir=SAVE_DIR):
+    os.makedirs(save_dir, exist_ok=True)
+    filename = os.path.join(save_dir, f"article_{index}.txt")
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(cleaned_html)  # Сохраняем очищенный HTML
+    return filename
+
+
 def get_article_links(page_url):
     """Получает ссылки на статьи с указанной страницы"""
     global added_links  # Используем глобальную переменную
     try:
-        response = requests.get(page_url, headers=headers)  # Добавляем headers
+        response = session.get(page_url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Если ответ 4xx или 5xx, выбрасывается исключение
 
-        soup = BeautifulSoup(response.text, "html.parser")
         links = []
-
-        # Ищем все ссылки на статьи
-        for article in soup.find_all("a", href=True):
-            href = article.get("href")
-            # Ищем ссылки на статьи, начинающиеся с "/news/"
-            if "#href" not in href and "category" not in href and "%" not in href and BASE_URL in href and "page" not in href and href.count("/") == 4:
-                full_url = f"{BASE_URL}{href}" if href.startswith("/") else href
-                if full_url not in added_links:  # Проверяем, есть ли ссылка уже в added_links
-                    links.append(full_url)
-                    added_links.add(full_url)  # Добавляем ссылку в added_links
-                if len(links) >= TOTAL_PAGES:
-                    return links
+        for full_url in extract_article_links(response.text, BASE_URL):
+            if full_url not in added_links:  # Проверяем, есть ли ссылка уже в added_links
+                links.append(full_url)
+                added_links.add(full_url)  # Добавляем ссылку в added_links
+            if len(links) >= TOTAL_PAGES:
+                return links
 
         return links
 
@@ -50,23 +107,14 @@ def get_article_links(page_url):
         return []
 
 
-def download_article(url, index):
+def download_article(url, index, save_text=False):
     """Скачивает статью и сохраняет её в формате .txt"""
     try:
-        response = requests.get(url, headers=headers)  # Добавляем headers
+        response = session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
 
-        # Разбираем HTML, чтобы удалить теги <link> и <script>
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Удаляем все теги <link> и <script>
-        for tag in soup.find_all(["link", "script"]):
-            tag.decompose()
-
-        # Сохраняем страницу как текстовый файл с HTML-разметкой
-        filename = os.path.join(SAVE_DIR, f"article_{index}.txt")
-        with open(filename, "w", encoding="utf-8") as file:
-            file.write(str(soup))  # Сохраняем очищенный HTML
+        # Сохраняем страницу как текстовый файл с HTML-разметкой или только её текст
+        filename = save_article(response.text, index, TEXT_FOLDER if save_text else SAVE_DIR, save_text)
 
         print(f"Скачано: {url} -> {filename}")
         return url  # Возвращаем ссылку на статью
@@ -91,17 +139,191 @@ def get_all_article_links():
     return all_links[:TOTAL_PAGES]  # Возвращаем не более TOTAL_PAGES ссылок
 
 
-def create_index_file(links):
+def create_index_file(links, save_dir=SAVE_DIR):
     """Создает индексный файл index.txt"""
-    index_filename = os.path.join(SAVE_DIR, "index.txt")
+    write_index_entries(enumerate(links, start=1), save_dir)
+
+
+def write_index_entries(entries, save_dir=SAVE_DIR):
+    """Записывает index.txt из пар (номер файла, ссылка)"""
+    index_filename = os.path.join(save_dir, "index.txt")
     with open(index_filename, "w", encoding="utf-8") as file:
-        for idx, link in enumerate(links, start=1):
+        for idx, link in entries:
             file.write(f"{idx}. {link}\n")
     print(f"Индексный файл сохранен: {index_filename}")
 
 
-def main():
+class TokenBucket:
+    """Ограничение частоты: не больше rate запросов в секунду в среднем, всплеск до capacity"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """Для каждого хоста — свой семафор на число одновременных запросов и своё ведро токенов"""
+
+    def __init__(self, per_host=PER_HOST_LIMIT, rate=REQUESTS_PER_SECOND):
+        self.per_host = per_host
+        self.rate = rate
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                bucket = TokenBucket(self.rate) if self.rate else None
+                self.hosts[host] = (threading.Semaphore(self.per_host), bucket)
+            return self.hosts[host]
+
+
+class ConcurrentCrawler:
+    """Параллельный обход: ссылки со страницы списка сразу уходят на скачивание,
+    не дожидаясь, пока будут собраны все страницы.
+
+    С состоянием обхода (state) номера файлов берутся по ссылке, а не по порядку,
+    запросы идут условные, и неизменившиеся статьи не перезаписываются.
+    С save_text вместо HTML сохраняется извлечённый текст (по умолчанию в TEXT_FOLDER).
+    """
+
+    def __init__(self, start_url=START_URL, base_url=BASE_URL, save_dir=None, total=TOTAL_PAGES,
+                 workers=WORKERS, per_host=PER_HOST_LIMIT, rate=REQUESTS_PER_SECOND, state=None, save_text=False):
+        self.start_url = start_url
+        self.base_url = base_url
+        self.save_dir = save_dir or (TEXT_FOLDER if save_text else SAVE_DIR)
+        self.save_text = save_text
+        self.total = total
+        self.workers = workers
+        self.session = make_session(workers)
+        self.limiter = HostLimiter(per_host, rate)
+        self.state = state
+        self.statuses = {}  # ссылка -> added / changed / unchanged в этом обходе
+
+    def fetch(self, url, request_headers=None):
+        semaphore, bucket = self.limiter.get(url)
+        with semaphore:
+            if bucket is not None:
+                bucket.acquire()
+            response = self.session.get(url, headers=request_headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    def download(self, url, index):
+        try:
+            if self.state is None:
+                filename = save_article(self.fetch(url).text, index, self.save_dir, self.save_text)
+                print(f"Скачано: {url} -> {filename}")
+                return url
+
+            filename = os.path.join(self.save_dir, f"article_{index}.txt")
+            # Без локального файла условный запрос не нужен: при ответе 304 нечего было бы оставить
+            headers = self.state.conditional_headers(url) if os.path.exists(filename) else None
+            response = self.fetch(url, headers)
+            if response.status_code == 304 and os.path.exists(filename):
+                self.state.touch(url)
+                status = UNCHANGED
+            else:
+                if response.status_code == 304:
+                    # Файл пропал, пока шёл запрос: тела у ответа 304 нет, скачиваем статью заново
+                    response = self.fetch(url)
+                # В режиме текста изменением считается только изменение текста, а не разметки
+                html = extract_text(response.text) if self.save_text else clean_article_html(response.text)
+                status = self.state.record(url, response.headers.get("ETag"),
+                                           response.headers.get("Last-Modified"), content_hash(html))
+                if status != UNCHANGED or not os.path.exists(filename):
+                    write_article(html, index, self.save_dir)
+
+            self.statuses[url] = status
+            print(f"{status}: {url} -> {filename}")
+            return url
+        except requests.RequestException as e:
+            print(f"Ошибка при скачивании {url}: {e}")
+            return None
+
+    def discover(self):
+        """Обходит страницы списка и выдаёт пары (номер файла, ссылка) по мере нахождения"""
+        seen = set()
+        page_number = 1
+        while len(seen) < self.total:
+            page_url = f"{self.start_url}/{page_number}"
+            print(f"Обрабатываю страницу {page_url}, уже получено ссылок: {len(seen)}")
+            try:
+                links = extract_article_links(self.fetch(page_url).text, self.base_url)
+            except requests.RequestException as e:
+                print(f"Ошибка при получении страницы: {e}")
+                return
+
+            new_links = [link for link in links if link not in seen]
+            if not new_links:
+                return  # Страницы со статьями закончились
+            for link in new_links[:self.total - len(seen)]:
+                seen.add(link)
+                yield (self.state.doc_id(link) if self.state else len(seen)), link
+            page_number += 1
+
+    def crawl(self):
+        """Возвращает пары (номер файла, ссылка) для успешно скачанных статей"""
+        os.makedirs(self.save_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(index, pool.submit(self.download, link, index)) for index, link in self.discover()]
+            return [(index, future.result()) for index, future in futures if future.result()]
+
+    def stream(self):
+        """Выдаёт (номер, ссылка, очищенный HTML) по мере скачивания, ничего не сохраняя на диск"""
+        def fetch_article(link):
+            try:
+                return clean_article_html(self.fetch(link).text)
+            except requests.RequestException as e:
+                print(f"Ошибка при скачивании {link}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(fetch_article, link): (index, link) for index, link in self.discover()}
+            for future in as_completed(futures):
+                if future.result() is not None:
+                    index, link = futures[future]
+                    yield index, link, future.result()
+
+
+def main(concurrent=False, incremental=False, save_text=False):
     """Основная функция"""
+    if incremental:
+        state = CrawlState()
+        state.seed_from_index_file(os.path.join(SAVE_DIR, "index.txt"))
+        article_crawler = ConcurrentCrawler(state=state, save_text=save_text)
+        if not article_crawler.crawl():
+            print("Не удалось найти статьи.")
+            return
+        write_index_entries(state.documents())
+        write_manifest(article_crawler.statuses, state)
+        state.close()
+        return
+
+    if concurrent:
+        entries = ConcurrentCrawler(save_text=save_text).crawl()
+        if not entries:
+            print("Не удалось найти статьи.")
+            return
+        write_index_entries(entries)
+        return
+
     article_links = get_all_article_links()
     if not article_links:
         print("Не удалось найти статьи.")
@@ -112,7 +334,7 @@ def main():
     # Скачиваем статьи и сохраняем ссылки
     downloaded_links = []
     for i, article_url in enumerate(article_links, start=1):
-        url = download_article(article_url, i)
+        url = download_article(article_url, i, save_text)
         if url:
             downloaded_links.append(url)
 
@@ -121,4 +343,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrent", action="store_true", help="параллельное скачивание с ограничением частоты")
+    parser.add_argument("--incremental", action="store_true",
+                        help="повторный обход: условные запросы, постоянные номера документов, манифест изменений")
+    parser.add_argument("--save-text", action="store_true",
+                        help=f"сохранять в {TEXT_FOLDER}/ извлечённый текст вместо HTML")
+    args = parser.parse_args()
+    main(args.concurrent, args.incremental, args.save_text)
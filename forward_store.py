@@ -0,0 +1,162 @@
+"""Прямое хранилище: извлечённый текст статьи по её номеру, для сниппетов в выдаче.
+
+Тексты идут подряд и сжимаются zlib блоками примерно по BLOCK_SIZE байт: соседние статьи
+одного сайта сжимаются вместе лучше, чем по отдельности, а на статью распаковывается
+только её блок. Для каждой статьи хранится (блок, начало в блоке, длина), для блоков —
+смещения в секции сжатых данных. Файл того же формата, что binary_index, и читается через mmap.
+"""
+import argparse
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import html_text
+from binary_index import BinaryIndex, write_binary_index
+
+FORWARD_STORE_FILE = "forward_store.bin"
+BLOCK_SIZE = 32 * 1024
+COMPRESSION_LEVEL = 6
+# Распакованные блоки последних запросов: на странице выдачи часто соседние статьи
+BLOCK_CACHE_SIZE = 64
+
+DOC_INFO = np.dtype([
+    ("block", "<u4"),
+    ("start", "<u4"),
+    ("length", "<u4"),
+])
+
+
+class ForwardStoreWriter:
+    """Сжимает тексты по мере поступления блоками. Несжатым держится только текущий блок,
+    но сжатые блоки копятся в памяти до write() — это примерно пятая часть текста корпуса"""
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self.doc_ids: List[str] = []
+        self._info: List[Tuple[int, int, int]] = []
+        self._blocks: List[bytes] = []
+        self._pending = bytearray()
+        self.text_size = 0  # байт текста до сжатия
+
+    def add(self, doc_id: int, text: str):
+        data = text.encode("utf-8")
+        self.doc_ids.append(str(doc_id))
+        self._info.append((len(self._blocks), len(self._pending), len(data)))
+        self._pending += data
+        self.text_size += len(data)
+        if len(self._pending) >= self.block_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._blocks.append(zlib.compress(bytes(self._pending), COMPRESSION_LEVEL))
+            self._pending = bytearray()
+
+    def write(self, path: str = FORWARD_STORE_FILE):
+        self._flush()
+        block_offsets = np.zeros(len(self._blocks) + 1, dtype="<u8")
+        block_offsets[1:] = np.cumsum([len(block) for block in self._blocks])
+        write_binary_index(path, self.doc_ids, {}, extra_sections={
+            "docinfo": np.array(self._info, dtype=DOC_INFO).tobytes(),
+            "blkoffs": block_offsets.tobytes(),
+            "blocks": b"".join(self._blocks),
+        })
+        print(f"Тексты статей сохранены в {path}")
+
+
+class ForwardStore:
+    """Текст статьи по номеру: распаковывается один блок, последние блоки кэшируются"""
+
+    def __init__(self, path: str = FORWARD_STORE_FILE):
+        self._index = BinaryIndex(path)
+        self.doc_ids = self._index.doc_ids
+        self._info = self._index.section("docinfo", DOC_INFO)
+        self._block_offsets = self._index.section("blkoffs", "<u8")
+        self._blocks = self._index.section("blocks")
+        self._doc_nums: Optional[Dict[str, int]] = None
+        self._cache = OrderedDict()
+        # Хранилище делят потоки веб-сервера, а LRU меняется и при чтении
+        self._cache_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.doc_num(doc_id) is not None
+
+    def doc_num(self, doc_id: str) -> Optional[int]:
+        if self._doc_nums is None:
+            self._doc_nums = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        return self._doc_nums.get(str(doc_id))
+
+    def _block(self, block: int) -> bytes:
+        with self._cache_lock:
+            data = self._cache.get(block)
+            if data is not None:
+                self._cache.move_to_end(block)
+                return data
+        start, end = int(self._block_offsets[block]), int(self._block_offsets[block + 1])
+        data = zlib.decompress(self._blocks[start:end])
+        with self._cache_lock:
+            self._cache[block] = data
+            if len(self._cache) > BLOCK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return data
+
+    def text_at(self, doc_num: int) -> str:
+        record = self._info[doc_num]
+        start = int(record["start"])
+        return self._block(int(record["block"]))[start:start + int(record["length"])].decode("utf-8")
+
+    def text(self, doc_id: str) -> Optional[str]:
+        """Текст статьи или None, если её нет в хранилище"""
+        doc_num = self.doc_num(doc_id)
+        return None if doc_num is None else self.text_at(doc_num)
+
+
+def read_texts(folder: str, extracted: bool = False) -> Iterable[Tuple[int, str]]:
+    """Статьи article_N.txt по возрастанию номера; extracted — в папке уже текст, а не HTML"""
+    names = sorted((int(match.group(1)), name) for match, name in
+                   ((re.fullmatch(r"article_(\d+)\.txt", name), name) for name in os.listdir(folder)) if match)
+    for doc_id, name in names:
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            content = f.read()
+        yield doc_id, content if extracted else html_text.extract_text(content)
+
+
+def build_forward_store(folder: str, path: str = FORWARD_STORE_FILE, extracted: bool = False) -> ForwardStoreWriter:
+    writer = ForwardStoreWriter()
+    for doc_id, text in read_texts(folder, extracted):
+        writer.add(doc_id, text)
+    writer.write(path)
+    return writer
+
+
+def open_forward_store(path: str = FORWARD_STORE_FILE) -> Optional[ForwardStore]:
+    """Открывает хранилище; при первом запуске собирает его из html_text.TEXT_FOLDER или
+    HTML_FOLDER. Если статей нет ни там, ни там, возвращает None — выдача будет без сниппетов"""
+    if not os.path.exists(path):
+        for folder, extracted in ((html_text.TEXT_FOLDER, True), (html_text.HTML_FOLDER, False)):
+            if os.path.isdir(folder):
+                build_forward_store(folder, path, extracted)
+                break
+        else:
+            return None
+    return ForwardStore(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Собрать сжатое хранилище текстов статей для сниппетов")
+    parser.add_argument("--input", default=html_text.HTML_FOLDER,
+                        help="папка со статьями article_N.txt")
+    parser.add_argument("--texts", action="store_true", help="в папке уже извлечённый текст, а не HTML")
+    parser.add_argument("--output", default=FORWARD_STORE_FILE)
+    args = parser.parse_args()
+
+    writer = build_forward_store(args.input, args.output, args.texts)
+    print(f"Статей: {len(writer.doc_ids)}, текст {writer.text_size / 1024:.0f} КБ -> {os.path.getsize(args.output) / 1024:.0f} КБ")
@@ -0,0 +1,192 @@
+"""Потоковое извлечение текста статьи из HTML без построения дерева.
+
+html.parser.HTMLParser выдаёт теги и текст по мере чтения; текст внутри служебных
+элементов (скрипты, стили, формы) и шаблонных блоков сайта (меню, подвал, боковая
+панель, «Поделиться», похожие записи) пропускается целиком. Шаблонный блок узнаётся
+по тегу или по классу, id или role — одним регулярным выражением.
+
+Извлечённый текст можно хранить вместо HTML (папка TEXT_FOLDER, те же имена
+article_N.txt): тогда повторная обработка корпуса вообще не разбирает HTML.
+"""
+import argparse
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+import metrics
+
+HTML_FOLDER = "rt_articles"
+TEXT_FOLDER = "rt_texts"
+
+# Текст этих элементов не бывает частью статьи
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head", "nav", "footer", "aside", "form",
+             "button", "select", "textarea", "iframe"}
+# Внутри слова эти теги не разрывают текст, остальные — граница слов
+INLINE_TAGS = {"a", "abbr", "b", "bdi", "bdo", "cite", "code", "em", "font", "i", "mark", "q", "s", "small",
+               "span", "strong", "sub", "sup", "u", "wbr"}
+# Теги без закрывающей пары: их начало не должно менять глубину вложенности
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+             "track", "wbr"}
+BOILERPLATE_RE = re.compile(
+    r"(?:^|[\s_-])(?:nav|navigation|menu|menuitem|footer|sidebar|widget|share|social|breadcrumbs?|related|"
+    r"comments?|modal|search|login|skip-link|cookie|banner|advert|ads)(?=$|[\s_-])", re.IGNORECASE)
+
+
+# Элементы с необязательным закрывающим тегом: начало элемента из первого множества
+# закрывает открытый элемент; поиск идёт вниз по стеку до элемента из второго множества
+IMPLIED_END = {
+    "li": ({"li"}, {"ul", "ol", "menu"}),
+    "dt": ({"dt", "dd"}, {"dl"}),
+    "dd": ({"dt", "dd"}, {"dl"}),
+    "option": ({"option"}, {"select", "datalist", "optgroup"}),
+}
+# Начало этих элементов закрывает открытый <p>
+P_CLOSERS = {"address", "article", "aside", "blockquote", "details", "div", "dl", "fieldset", "figcaption", "figure",
+             "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "menu", "nav", "ol", "p",
+             "pre", "section", "table", "ul"}
+# Один проход по извлечённому тексту: пробельные участки сжимаются до пробела, слова
+# (те же, что lemmas.WORD_RE) собираются в токены
+SPACE_OR_WORD_RE = re.compile(r"(\s+)|\b([а-яА-ЯёЁ]+)\b")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self._open: List[str] = []  # стек открытых элементов
+        self._skip_at = None  # глубина в стеке, с которой начался пропускаемый блок
+        self._keep = False  # внутри <title>: он в пропускаемом <head>, но в нём название статьи
+
+    def _is_boilerplate(self, tag: str, attrs) -> bool:
+        if tag in SKIP_TAGS:
+            return True
+        for name, value in attrs:
+            if value and name in ("class", "id", "role") and BOILERPLATE_RE.search(value):
+                return True
+        return False
+
+    def _pop_to(self, depth: int):
+        """Закрывает элементы стека начиная с depth; пропуск кончается вместе с его элементом"""
+        closed = self._open[depth:]
+        del self._open[depth:]
+        if self._skip_at is not None and depth <= self._skip_at:
+            self._skip_at = None
+            self._keep = False
+            self.chunks.append(" ")
+        elif any(tag not in INLINE_TAGS for tag in closed):
+            self.chunks.append(" ")
+
+    def _close_implied(self, tag: str):
+        if tag in IMPLIED_END:
+            closed, scope = IMPLIED_END[tag]
+        elif tag in P_CLOSERS:
+            # <p> ищется только среди строчных элементов над ним
+            closed, scope = {"p"}, None
+        else:
+            return
+        for depth in range(len(self._open) - 1, -1, -1):
+            open_tag = self._open[depth]
+            if open_tag in closed:
+                self._pop_to(depth)
+                return
+            if open_tag in scope if scope is not None else open_tag not in INLINE_TAGS:
+                return
+
+    def handle_starttag(self, tag, attrs):
+        self._close_implied(tag)
+        if tag in VOID_TAGS:
+            # <br>, <hr>, <img> разделяют слова, хотя закрывающей пары у них нет
+            if self._skip_at is None and tag not in INLINE_TAGS:
+                self.chunks.append(" ")
+            return
+        self._open.append(tag)
+        if self._skip_at is not None:
+            if tag == "title" and self._open[self._skip_at] == "head":
+                self._keep = True
+            return
+        if self._is_boilerplate(tag, attrs):
+            self._skip_at = len(self._open) - 1
+        elif tag not in INLINE_TAGS:
+            self.chunks.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._keep:
+            self._keep = False
+            self.chunks.append(" ")
+        # Закрывающий тег закрывает и всё, что осталось открытым внутри; лишний — пропускается
+        for depth in range(len(self._open) - 1, -1, -1):
+            if self._open[depth] == tag:
+                self._pop_to(depth)
+                return
+        if self._skip_at is None and tag not in INLINE_TAGS:
+            self.chunks.append(" ")
+
+    def handle_data(self, data):
+        if self._skip_at is None or self._keep:
+            self.chunks.append(data)
+
+
+def split_words(raw: str) -> Tuple[str, List[str]]:
+    """Текст с пробелами, сжатыми до одного, и слова в нижнем регистре — за один проход регулярным выражением"""
+    words = []
+
+    def replace(match):
+        if match.group(1) is not None:
+            return " "
+        words.append(match.group(2).lower())
+        return match.group(2)
+
+    return SPACE_OR_WORD_RE.sub(replace, raw).strip(), words
+
+
+def _parse(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.chunks)
+
+
+@metrics.timed("html_parse")
+def extract_text(html: str) -> str:
+    """Текст статьи без разметки и шаблонных блоков, слова разделены одним пробелом"""
+    return " ".join(_parse(html).split())
+
+
+@metrics.timed("html_parse")
+def extract_words(html: str) -> Tuple[str, List[str]]:
+    """То же, что extract_text, и сразу слова текста в нижнем регистре (как lemmas.WORD_RE по тексту)"""
+    return split_words(_parse(html))
+
+
+def write_text(text: str, doc_id: int, folder: str = TEXT_FOLDER) -> str:
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"article_{doc_id}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def read_text(doc_id: int, folder: str = TEXT_FOLDER):
+    """Сохранённый текст статьи или None, если его нет"""
+    path = os.path.join(folder, f"article_{doc_id}.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сохранить текст статей вместо HTML для повторной обработки")
+    parser.add_argument("--input", default=HTML_FOLDER)
+    parser.add_argument("--output", default=TEXT_FOLDER)
+    args = parser.parse_args()
+
+    count = 0
+    for name in sorted(os.listdir(args.input)):
+        match = re.fullmatch(r"article_(\d+)\.txt", name)
+        if match:
+            with open(os.path.join(args.input, name), encoding="utf-8") as f:
+                write_text(extract_text(f.read()), int(match.group(1)), args.output)
+            count += 1
+    print(f"Тексты {count} статей сохранены в {args.output}/")
@@ -0,0 +1,385 @@
+"""Инкрементальный индекс из сегментов.
+
+Новые документы копятся в памяти и при commit() ложатся отдельным небольшим сегментом
+(файл в формате binary_index), поэтому добавление статьи не пересчитывает корпус.
+Удаление — это отметка (tombstone) в манифесте; сами данные уходят при слиянии сегментов,
+которое идёт в фоновом потоке. DF по каждой лемме поддерживается на лету,
+а IDF и tf-idf считаются при чтении, так что веса всегда согласованы с текущим корпусом.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from binary_index import BinaryIndex, write_binary_index
+from term_dictionary import TermDictionary
+
+INDEX_DIR = "index_segments"
+MANIFEST_FILE = "segments.json"
+MAX_BUFFERED_DOCS = 1000  # Сколько документов держать в памяти до записи сегмента
+MERGE_FACTOR = 8  # Столько сегментов сливаются в один
+TOKENS_DIR = "lemmas_tokens"
+
+
+def _write_segment(path: str, docs: List[Tuple[str, Dict[str, int]]]):
+    """Сегмент: постинги с числом вхождений леммы вместо веса и прямой индекс документ -> леммы"""
+    postings = defaultdict(list)
+    counts = defaultdict(list)
+    for doc_num, (_, lemma_counts) in enumerate(docs):
+        for lemma, count in lemma_counts.items():
+            postings[lemma].append(doc_num)
+            counts[lemma].append(count)
+
+    # Номера терминов совпадают с порядком словаря в write_binary_index
+    term_ids = {term: i for i, term in enumerate(sorted(postings, key=lambda term: term.encode("utf-8")))}
+    lengths = np.array([len(lemma_counts) for _, lemma_counts in docs], dtype="<u8")
+    forward_start = np.concatenate(([0], np.cumsum(lengths))).astype("<u8")
+    forward_terms = np.array([term_ids[lemma] for _, lemma_counts in docs for lemma in lemma_counts], dtype="<u4")
+    forward_counts = np.array([count for _, lemma_counts in docs for count in lemma_counts.values()], dtype="<u4")
+    totals = np.array([sum(lemma_counts.values()) for _, lemma_counts in docs], dtype="<u4")
+
+    write_binary_index(path, [doc_id for doc_id, _ in docs], postings, counts, extra_sections={
+        "dtotal": totals.tobytes(),
+        "fstart": forward_start.tobytes(),
+        "fterms": forward_terms.tobytes(),
+        "fcounts": forward_counts.tobytes(),
+    })
+
+
+def _read_document(segment: BinaryIndex, doc_num: int) -> Dict[str, int]:
+    start, end = segment.section("fstart", "<u8")[doc_num:doc_num + 2]
+    terms = segment.section("fterms", "<u4")[start:end]
+    counts = segment.section("fcounts", "<u4")[start:end]
+    return {segment.terms[int(term_id)]: int(count) for term_id, count in zip(terms, counts)}
+
+
+def _load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"next_segment": 1, "segments": [], "df": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class IndexWriter:
+    """Добавление, удаление и замена документов без перестроения всего индекса"""
+
+    def __init__(self, directory: str = INDEX_DIR, max_buffered_docs: int = MAX_BUFFERED_DOCS,
+                 merge_factor: int = MERGE_FACTOR, background_merges: bool = True):
+        self.directory = directory
+        self.max_buffered_docs = max_buffered_docs
+        self.merge_factor = merge_factor
+        self.background_merges = background_merges
+        os.makedirs(directory, exist_ok=True)
+
+        manifest = _load_manifest(directory)
+        self.next_segment = manifest["next_segment"]
+        self.segments = {entry["name"]: {"docs": entry["docs"], "deleted": set(entry["deleted"])}
+                         for entry in manifest["segments"]}
+        self.df = Counter(manifest["df"])
+
+        self.lock = threading.RLock()
+        self._buffer = {}  # документы, ещё не записанные в сегмент
+        self._locations = {}  # id документа -> (сегмент, номер в сегменте)
+        self._merging = set()
+        self._merge_thread = None
+        self._opened = {}  # открытые через mmap сегменты
+
+        for name, segment in self.segments.items():
+            for doc_num, doc_id in enumerate(self._segment(name).doc_ids):
+                if doc_num not in segment["deleted"]:
+                    self._locations[doc_id] = (name, doc_num)
+        self._remove_unused_files()
+
+    def _segment(self, name: str) -> BinaryIndex:
+        segment = self._opened.get(name)
+        if segment is None:
+            segment = self._opened[name] = BinaryIndex(os.path.join(self.directory, name))
+        return segment
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._buffer or doc_id in self._locations
+
+    def __len__(self) -> int:
+        return len(self._buffer) + len(self._locations)
+
+    def add_document(self, doc_id: str, lemma_counts: Dict[str, int]):
+        with self.lock:
+            if doc_id in self:
+                raise ValueError(f"Документ {doc_id} уже есть в индексе, используйте update_document")
+            lemma_counts = {lemma: count for lemma, count in lemma_counts.items() if count > 0}
+            self._buffer[doc_id] = lemma_counts
+            self.df.update(lemma_counts.keys())
+            if len(self._buffer) >= self.max_buffered_docs:
+                self._flush()
+
+    def delete_document(self, doc_id: str) -> bool:
+        with self.lock:
+            if doc_id in self._buffer:
+                lemma_counts = self._buffer.pop(doc_id)
+            elif doc_id in self._locations:
+                name, doc_num = self._locations.pop(doc_id)
+                self.segments[name]["deleted"].add(doc_num)
+                lemma_counts = _read_document(self._segment(name), doc_num)
+            else:
+                return False
+
+            self.df.subtract(lemma_counts.keys())
+            for lemma in lemma_counts:
+                if self.df[lemma] <= 0:
+                    del self.df[lemma]
+            return True
+
+    def update_document(self, doc_id: str, lemma_counts: Dict[str, int]):
+        with self.lock:
+            self.delete_document(doc_id)
+            self.add_document(doc_id, lemma_counts)
+
+    def _new_segment_name(self) -> str:
+        name = f"segment_{self.next_segment:06d}.bin"
+        self.next_segment += 1
+        return name
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        name = self._new_segment_name()
+        docs = list(self._buffer.items())
+        _write_segment(os.path.join(self.directory, name), docs)
+        self.segments[name] = {"docs": len(docs), "deleted": set()}
+        for doc_num, (doc_id, _) in enumerate(docs):
+            self._locations[doc_id] = (name, doc_num)
+        self._buffer.clear()
+
+    def _write_manifest(self):
+        manifest = {
+            "next_segment": self.next_segment,
+            "segments": [{"name": name, "docs": segment["docs"], "deleted": sorted(segment["deleted"])}
+                         for name, segment in self.segments.items()],
+            "df": dict(self.df),
+        }
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def commit(self):
+        """Записывает накопленные документы и отметки об удалении; читатели увидят их после открытия"""
+        with self.lock:
+            self._flush()
+            self._write_manifest()
+            self._remove_unused_files()
+        self.maybe_merge()
+
+    def maybe_merge(self):
+        with self.lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            candidates = [name for name in self.segments if name not in self._merging]
+            if len(candidates) < self.merge_factor:
+                return
+            # Сливаем самые маленькие сегменты: так каждый документ переписывается O(log N) раз
+            candidates.sort(key=lambda name: self.segments[name]["docs"] - len(self.segments[name]["deleted"]))
+            names = candidates[:self.merge_factor]
+            deleted = {name: set(self.segments[name]["deleted"]) for name in names}
+            # Сегменты открываются здесь, под замком: _opened меняют и удаления из других потоков
+            segments = {name: self._segment(name) for name in names}
+            new_name = self._new_segment_name()
+            # Эти файлы не трогает _remove_unused_files, пока идёт слияние
+            self._merging = set(names) | {new_name}
+
+        if self.background_merges:
+            self._merge_thread = threading.Thread(target=self._merge, args=(segments, deleted, new_name),
+                                                  daemon=True)
+            self._merge_thread.start()
+        else:
+            self._merge(segments, deleted, new_name)
+
+    def _merge(self, segments: Dict[str, BinaryIndex], deleted: Dict[str, set], new_name: str):
+        """Сливает уже открытые сегменты в новый; в манифест результат попадает при следующем commit()"""
+        docs = []
+        origins = []
+        for name, segment in segments.items():
+            for doc_num, doc_id in enumerate(segment.doc_ids):
+                if doc_num not in deleted[name]:
+                    docs.append((doc_id, _read_document(segment, doc_num)))
+                    origins.append((name, doc_num))
+
+        _write_segment(os.path.join(self.directory, new_name), docs)
+
+        with self.lock:
+            # Пока шло слияние, часть документов могла быть удалена или заменена
+            new_deleted = set()
+            for new_num, ((doc_id, _), origin) in enumerate(zip(docs, origins)):
+                if self._locations.get(doc_id) == origin:
+                    self._locations[doc_id] = (new_name, new_num)
+                else:
+                    new_deleted.add(new_num)
+            for name in segments:
+                del self.segments[name]
+                self._opened.pop(name, None)
+            self.segments[new_name] = {"docs": len(docs), "deleted": new_deleted}
+            self._merging = set()
+
+    def wait_for_merges(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.wait_for_merges()
+        with self.lock:
+            self._flush()
+            self._write_manifest()
+            self._remove_unused_files()
+
+    def _remove_unused_files(self):
+        for filename in os.listdir(self.directory):
+            if (filename.startswith("segment_") and filename.endswith(".bin")
+                    and filename not in self.segments and filename not in self._merging):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass  # Файл ещё открыт читателем (Windows) — удалим при следующем запуске
+
+
+class _SegmentView:
+    def __init__(self, index: BinaryIndex, deleted: set, offset: int):
+        self.index = index
+        self.offset = offset
+        self.live = np.ones(len(index), dtype=bool)
+        self.live[list(deleted)] = False
+        self.totals = index.section("dtotal", "<u4").astype(np.float64)
+
+
+class IndexReader:
+    """Снимок сегментного индекса на момент открытия.
+
+    Те же методы, что у BinaryIndex для ранжирования и булева поиска (doc_ids, postings,
+    max_weight, idf, df, doc_numbers), поэтому годится для search.search и BooleanSearchEngine.
+    Нормы документов зависят от текущих IDF и считаются при первом запросе.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR):
+        manifest = _load_manifest(directory)
+        self._df = manifest["df"]
+        self._segments = []
+        self.doc_ids = []
+        for entry in manifest["segments"]:
+            index = BinaryIndex(os.path.join(directory, entry["name"]))
+            self._segments.append(_SegmentView(index, set(entry["deleted"]), len(self.doc_ids)))
+            self.doc_ids.extend(index.doc_ids)
+        self.n_docs = sum(int(segment.live.sum()) for segment in self._segments)
+        self._norms = None
+        self._max_weights = {}
+        self._dictionary = None
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def df(self, lemma: str) -> int:
+        return self._df.get(lemma, 0)
+
+    def idf(self, lemma: str) -> Optional[float]:
+        df = self._df.get(lemma)
+        return math.log(self.n_docs / df) if df else None
+
+    @property
+    def dictionary(self) -> TermDictionary:
+        """Словарь лемм, которые есть хотя бы в одном живом документе"""
+        if self._dictionary is None:
+            self._dictionary = TermDictionary(sorted(lemma for lemma, df in self._df.items() if df))
+        return self._dictionary
+
+    def live_doc_numbers(self) -> np.ndarray:
+        return np.concatenate([np.flatnonzero(segment.live) + segment.offset for segment in self._segments]
+                              or [np.empty(0, dtype=np.int64)])
+
+    def doc_numbers(self, lemma: str) -> np.ndarray:
+        parts = []
+        for segment in self._segments:
+            docs = segment.index.doc_numbers(lemma)
+            parts.append(docs[segment.live[docs]] + segment.offset)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def _doc_norms(self) -> List[np.ndarray]:
+        if self._norms is None:
+            norms = []
+            for segment in self._segments:
+                index = segment.index
+                idf = np.array([self.idf(term) or 0.0 for term in index.terms])
+                start = index.section("fstart", "<u8").astype(np.int64)
+                doc_nums = np.repeat(np.arange(len(index)), np.diff(start))
+                tf = index.section("fcounts", "<u4") / np.maximum(segment.totals[doc_nums], 1)
+                weights = tf * idf[index.section("fterms", "<u4")]
+                norms.append(np.sqrt(np.bincount(doc_nums, weights=weights * weights, minlength=len(index))))
+            self._norms = norms
+        return self._norms
+
+    def postings(self, lemma: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        idf = self.idf(lemma)
+        if idf is None:
+            return None
+
+        doc_parts = []
+        weight_parts = []
+        for segment, norms in zip(self._segments, self._doc_norms()):
+            found = segment.index.postings(lemma)
+            if found is None:
+                continue
+            docs, counts = found
+            keep = segment.live[docs]
+            docs, counts = docs[keep], counts[keep]
+            # tf-idf как в count_tf_and_idf.py, нормированный по длине документа
+            norm = norms[docs]
+            weights = np.divide(counts / segment.totals[docs] * idf, norm, out=np.zeros(len(docs)), where=norm > 0)
+            doc_parts.append(docs + segment.offset)
+            weight_parts.append(weights)
+
+        if not doc_parts:
+            return None
+        return np.concatenate(doc_parts).astype(np.int32), np.concatenate(weight_parts)
+
+    def max_weight(self, lemma: str) -> float:
+        if lemma not in self._max_weights:
+            found = self.postings(lemma)
+            self._max_weights[lemma] = float(found[1].max(initial=0.0)) if found else 0.0
+        return self._max_weights[lemma]
+
+
+def tokens_doc_ids(tokens_dir: str = TOKENS_DIR) -> List[int]:
+    """Номера статей, для которых есть lemmas_N.txt, по возрастанию"""
+    return sorted(int(match.group(1)) for match in
+                  (re.fullmatch(r"lemmas_(\d+)\.txt", name) for name in os.listdir(tokens_dir)) if match)
+
+
+def read_lemma_counts(doc_id: int, tokens_dir: str = TOKENS_DIR) -> Dict[str, int]:
+    """Леммы статьи из lemmas_tokens/lemmas_N.txt, посчитанные так же, как в count_tf_and_idf.py"""
+    with open(os.path.join(tokens_dir, f"lemmas_{doc_id}.txt"), encoding="utf-8") as f:
+        return Counter(line.strip().split()[0].lower() for line in f if line.strip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help=f"проиндексировать все статьи из {TOKENS_DIR}/")
+    parser.add_argument("--add", type=int, nargs="*", default=[], help="добавить или обновить статьи с этими номерами")
+    parser.add_argument("--delete", type=int, nargs="*", default=[], help="удалить статьи с этими номерами")
+    args = parser.parse_args()
+
+    writer = IndexWriter()
+    doc_ids = args.add
+    if args.rebuild:
+        doc_ids = tokens_doc_ids()
+    for doc_id in doc_ids:
+        writer.update_document(str(doc_id), read_lemma_counts(doc_id))
+    for doc_id in args.delete:
+        if not writer.delete_document(str(doc_id)):
+            print(f"Документа {doc_id} нет в индексе")
+    writer.close()
+    print(f"Документов в индексе: {len(writer)}, сегментов: {len(writer.segments)}, лемм: {len(writer.df)}")
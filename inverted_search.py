@@ -1,140 +1,257 @@
+import argparse
 import os
-import json
-import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+import boolean_query
+import metrics
+from binary_index import BinaryIndex, is_stale, write_binary_index
+from bitmap import Bitmap
+from positional_index import PositionalIndex, POSITIONAL_INDEX_FILE
+from term_dictionary import TermDictionary
+
+# Сколько битовых карт терминов держать в памяти при работе с индексом через mmap
+BITMAP_CACHE_SIZE = 4096
+# Сколько скомпилированных планов запросов хранить
+PLAN_CACHE_SIZE = 1024
+# search_many: пачка от такого размера делится между процессами, меньшую быстрее посчитать на месте
+POOL_MIN_QUERIES = 5000
+POOL_CHUNK = 1000
+
+# Движки, открытые в процессе пула search_many: (индекс, позиционный индекс) -> движок
+_engines = {}
+
+
+def _evaluate_chunk(index_file, positional_file, queries):
+    engine = _engines.get((index_file, positional_file))
+    if engine is None:
+        engine = BooleanSearchEngine.from_index(BinaryIndex(index_file))
+        if positional_file is not None:
+            engine.attach_positional(PositionalIndex(positional_file))
+        _engines[index_file, positional_file] = engine
+    return engine._evaluate_many(queries)
 
 
 class BooleanSearchEngine:
-    def __init__(self, tokens_dir, index_file='inverted_index.json'):
+    def __init__(self, tokens_dir, index_file='inverted_index.bin', rebuild=False):
         self.tokens_dir = tokens_dir
         self.index_file = index_file
-        self.index = defaultdict(set)
-        self.documents = set()
-
-        self.build_index()
-        self.save_index()
-
+        self.index = {}  # термин -> номера документов по возрастанию
+        self.documents = []  # номер документа -> его имя
+        self.binary_index = None
+        self.live = None  # битовая карта неудалённых документов, если в индексе есть удаления
+        self.positional = None  # позиционный индекс для фраз и NEAR/n
+        self._positional_map = None
+        self._dictionary = None
+        self._bitmaps = OrderedDict()
+        self._plans = boolean_query.PlanCache(PLAN_CACHE_SIZE)
+
+        # Готовый индекс открывается через mmap; заново строится по требованию или если леммы новее него
+        if not rebuild and not is_stale(self.index_file, [self.tokens_dir]):
+            self.load_index()
+        else:
+            self.build_index()
+            self.save_index()
+
+    @classmethod
+    def from_postings(cls, documents, postings):
+        """Движок над готовыми постингами в памяти, без файлов (для тестов и бенчмарков)"""
+        engine = cls.__new__(cls)
+        engine.tokens_dir = None
+        engine.index_file = None
+        engine.documents = list(documents)
+        engine.index = {term: np.asarray(docs, dtype=np.int32) for term, docs in postings.items()}
+        engine.binary_index = None
+        engine.live = None
+        engine.positional = None
+        engine._positional_map = None
+        engine._dictionary = None
+        engine._bitmaps = OrderedDict()
+        engine._plans = boolean_query.PlanCache(PLAN_CACHE_SIZE)
+        return engine
+
+    @classmethod
+    def from_index(cls, index):
+        """Движок над открытым индексом: BinaryIndex или снимком index_writer.IndexReader"""
+        engine = cls.from_postings(index.doc_ids, {})
+        engine.binary_index = index
+        if hasattr(index, "live_doc_numbers"):
+            # Удалённые документы остаются в сегментах до слияния, NOT не должен их находить
+            engine.live = Bitmap.from_indices(index.live_doc_numbers(), len(engine.documents))
+        return engine
+
+    def attach_positional(self, positional):
+        """Подключает positional_index.PositionalIndex. Его документы — статьи,
+        а у движка документ статьи N называется lemmas_N, tokens_N или просто N"""
+        self.positional = positional
+        article_numbers = {doc_id: doc_num for doc_num, doc_id in enumerate(positional.doc_ids)}
+        self._positional_map = np.array([article_numbers.get(name.rsplit('_', 1)[-1], -1) for name in self.documents])
+        self._bitmaps.clear()
+        self._plans.clear()
+
+    @property
+    def dictionary(self):
+        """Словарь терминов для шаблонов (газо*) и опечаток (слово~)"""
+        if self.binary_index is not None:
+            return self.binary_index.dictionary
+        if self._dictionary is None:
+            self._dictionary = TermDictionary(sorted(self.index))
+        return self._dictionary
+
+    @metrics.timed("index_build")
     def build_index(self):
         print("Построение инвертированного индекса...")
-        for filename in os.listdir(self.tokens_dir):
-            if filename.endswith('.txt'):
-                doc_id = filename.split('.')[0]
-                self.documents.add(doc_id)
-
-                with open(os.path.join(self.tokens_dir, filename), 'r', encoding='utf-8') as f:
-                    tokens = f.read().split()
-                    for token in tokens:
-                        self.index[token].add(doc_id)
+        filenames = sorted(filename for filename in os.listdir(self.tokens_dir) if filename.endswith('.txt'))
+        self.documents = [filename.split('.')[0] for filename in filenames]
+
+        postings = defaultdict(list)
+        for doc_num, filename in enumerate(filenames):
+            with open(os.path.join(self.tokens_dir, filename), 'r', encoding='utf-8') as f:
+                tokens = set(f.read().split())
+                for token in tokens:
+                    postings[token].append(doc_num)
+
+        self.index = {term: np.array(docs, dtype=np.int32) for term, docs in postings.items()}
+        self._dictionary = None
+        self._bitmaps.clear()
+        self._plans.clear()
         print(f"Индекс построен. Документов: {len(self.documents)}, Уникальных терминов: {len(self.index)}")
 
     def save_index(self):
-        index_to_save = {term: list(docs) for term, docs in self.index.items()}
-
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'documents': list(self.documents),
-                'index': index_to_save
-            }, f, ensure_ascii=False, indent=2)
+        write_binary_index(self.index_file, self.documents, self.index)
         print(f"Индекс сохранен в {self.index_file}")
 
-    def search(self, query):
-        self.temp_results = {}
+    def load_index(self):
+        self.binary_index = BinaryIndex(self.index_file)
+        self.documents = self.binary_index.doc_ids
+        self._bitmaps.clear()
+        self._plans.clear()
+        print(f"Индекс загружен из {self.index_file}. Документов: {len(self.documents)}, "
+              f"Уникальных терминов: {len(self.binary_index.terms)}")
 
+    def search(self, query):
         try:
-            query = query.lower().strip()
-            if not query:
-                return set()
-
-            result = self._parse_expression(query)
-            return result
+            result = self.evaluate(query)
+            return {self.documents[i] for i in result.to_indices()}
         except Exception as e:
             print(f"Ошибка при обработке запроса: {e}")
             return set()
 
-    def _parse_expression(self, expression):
-        expression = expression.strip()
-        while expression.startswith('(') and expression.endswith(')'):
-            expression = expression[1:-1].strip()
-
-        tokens = self._tokenize(expression)
-        tokens = self._process_operator(tokens, 'not')
-        tokens = self._process_operator(tokens, 'and')
-        tokens = self._process_operator(tokens, 'or')
-
-        if len(tokens) != 1:
-            raise ValueError(f"Некорректное выражение: {expression}")
-
-        return self._get_docs_for_token(tokens[0])
-
-    def _tokenize(self, expression):
-        tokens = []
-        current = []
-        paren_level = 0
-
-        for char in expression:
-            if char == '(':
-                paren_level += 1
-                current.append(char)
-            elif char == ')':
-                paren_level -= 1
-                current.append(char)
-            elif char.isspace() and paren_level == 0:
-                if current:
-                    tokens.append(''.join(current))
-                    current = []
-            else:
-                current.append(char)
-
-        if current:
-            tokens.append(''.join(current))
-
-        return tokens
-
-    def _process_operator(self, tokens, operator):
-        i = 0
-        while i < len(tokens):
-            if tokens[i] == operator:
-                if operator == 'not':
-                    if i == len(tokens) - 1:
-                        raise ValueError(f"Оператор NOT требует аргумента")
-
-                    arg = tokens[i + 1]
-                    docs = self._get_docs_for_token(arg)
-                    result = self.documents - docs
-
-                    temp_id = f"temp_{len(self.temp_results)}"
-                    self.temp_results[temp_id] = result
-                    tokens[i:i + 2] = [temp_id]
-                else:
-                    if i == 0 or i == len(tokens) - 1:
-                        raise ValueError(f"Оператор {operator} требует два аргумента")
-
-                    left = tokens[i - 1]
-                    right = tokens[i + 1]
-                    left_docs = self._get_docs_for_token(left)
-                    right_docs = self._get_docs_for_token(right)
-
-                    if operator == 'and':
-                        result = left_docs & right_docs
-                    else:  # OR
-                        result = left_docs | right_docs
-
-                    temp_id = f"temp_{len(self.temp_results)}"
-                    self.temp_results[temp_id] = result
-                    tokens[i - 1:i + 2] = [temp_id]
-                    i -= 1
-            i += 1
-
-        return tokens
-
-    def _get_docs_for_token(self, token):
-        if token.startswith('temp_'):
-            return self.temp_results.get(token, set())
-
-        if '(' in token or ')' in token:
-            return self._parse_expression(token)
-
-        return self.index.get(token, set())
+    def search_many(self, queries, processes=None):
+        """Результаты пачки запросов в порядке queries — те же, что у search по одному.
+
+        Повторы запросов вычисляются один раз, общие подвыражения разных запросов
+        (например, «газон and полив» внутри нескольких) — тоже. Большая пачка по индексу
+        из файла делится между processes процессами (по умолчанию — по числу ядер).
+        """
+        keys = [boolean_query.normalize_text(query) for query in queries]
+        unique = list(dict.fromkeys(keys))
+        if (isinstance(self.binary_index, BinaryIndex) and self.live is None and len(unique) >= POOL_MIN_QUERIES
+                and (processes or os.cpu_count() or 1) > 1):
+            positional_file = self.positional.index.path if self.positional is not None else None
+            chunks = [unique[i:i + POOL_CHUNK] for i in range(0, len(unique), POOL_CHUNK)]
+            with ProcessPoolExecutor(processes) as pool:
+                found = [docs for chunk in pool.map(_evaluate_chunk, repeat(self.binary_index.path),
+                                                    repeat(positional_file), chunks)
+                         for docs in chunk]
+        else:
+            found = self._evaluate_many(unique)
+
+        results = {key: set() if docs is None else {self.documents[i] for i in docs} for key, docs in zip(unique, found)}
+        return [set(results[key]) for key in keys]
+
+    def _evaluate_many(self, queries):
+        """Номера найденных документов по каждому запросу; None — запрос с ошибкой"""
+        memo = {}
+        found = []
+        for query in queries:
+            try:
+                found.append(self.evaluate(query, memo).to_indices())
+            except Exception as e:
+                print(f"Ошибка при обработке запроса: {e}")
+                found.append(None)
+        return found
+
+    def evaluate(self, query, memo=None):
+        """Вычисляет запрос и возвращает битовую карту номеров документов.
+        memo — общий словарь подвыражений для пачки запросов (см. search_many)"""
+        key = boolean_query.normalize_text(query)
+        if not key:
+            return Bitmap.empty(len(self.documents))
+        metrics.count("boolean_queries")
+
+        # Повторный запрос берёт готовый план из кэша и не разбирается заново
+        plan = self._plans.get(key)
+        if plan is None:
+            with metrics.timer("query_parse"):
+                plan = self.compile(key)
+            self._plans.put(key, plan)
+
+        with metrics.timer("boolean_eval"):
+            result = boolean_query.execute(plan, self._term_docs, len(self.documents),
+                                           self._positional_docs if self.positional is not None else None, memo)
+        return result if self.live is None else result & self.live
+
+    def compile(self, query):
+        # Шаблоны раскрываются до планирования, так что в кэш попадает уже раскрытый план
+        tree = boolean_query.expand(boolean_query.parse(query), self._expand)
+        tree = boolean_query.normalize(tree)
+        return boolean_query.plan(tree, self._df, len(self.documents))
+
+    def _expand(self, node):
+        if isinstance(node, boolean_query.Wildcard):
+            return self.dictionary.wildcard(node.pattern)
+        return [term for term, _ in self.dictionary.fuzzy(node.word, node.distance)]
+
+    def _df(self, term):
+        if self.binary_index is None:
+            count = len(self.index.get(term, ()))
+        else:
+            count = self.binary_index.df(term)
+        # Стоп-слов нет в основном индексе, но во фразах они участвуют
+        if not count and self.positional is not None:
+            count = self.positional.df(term)
+        return count
+
+    def _term_docs(self, term):
+        bitmap = self._bitmaps.get(term)
+        if bitmap is not None:
+            self._bitmaps.move_to_end(term)
+            return bitmap
+
+        if self.binary_index is None:
+            doc_numbers = self.index.get(term, ())
+        else:
+            doc_numbers = self.binary_index.doc_numbers(term)
+        bitmap = Bitmap.from_indices(doc_numbers, len(self.documents))
+
+        self._bitmaps[term] = bitmap
+        if len(self._bitmaps) > BITMAP_CACHE_SIZE:
+            self._bitmaps.popitem(last=False)
+        return bitmap
+
+    def _positional_docs(self, node):
+        # Фразы кэшируются вместе с терминами: их ключи в кавычках или с near/n и не совпадают со словами
+        key = boolean_query.to_text(node)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is not None:
+            self._bitmaps.move_to_end(key)
+            return bitmap
+
+        # Сначала пересекаются списки статей, позиции читаются только для общих статей
+        if isinstance(node, boolean_query.Phrase):
+            articles = self.positional.phrase_docs(node.words)
+        else:
+            articles = self.positional.near_docs(node.words[0], node.words[1], node.distance)
+        bitmap = Bitmap.from_indices(np.flatnonzero(np.isin(self._positional_map, articles)), len(self.documents))
+
+        self._bitmaps[key] = bitmap
+        if len(self._bitmaps) > BITMAP_CACHE_SIZE:
+            self._bitmaps.popitem(last=False)
+        return bitmap
 
     def pretty_search(self, query):
         results = self.search(query)
@@ -147,9 +264,15 @@ class BooleanSearchEngine:
 
 if __name__ == "__main__":
     TOKENS_DIR = "./lemmas_tokens"
-    INDEX_FILE = "inverted_index.json"
+    INDEX_FILE = "inverted_index.bin"
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help=f"построить {INDEX_FILE} заново из {TOKENS_DIR}")
+    args = parser.parse_args()
 
-    search_engine = BooleanSearchEngine(TOKENS_DIR, INDEX_FILE)
+    search_engine = BooleanSearchEngine(TOKENS_DIR, INDEX_FILE, rebuild=args.rebuild)
+    if os.path.exists(POSITIONAL_INDEX_FILE):
+        search_engine.attach_positional(PositionalIndex(POSITIONAL_INDEX_FILE))
 
     print("\nБулев поиск по инвертированному индексу")
     print("Поддерживаемые операторы: AND, OR, NOT (в нижнем регистре)")
@@ -159,10 +282,19 @@ if __name__ == "__main__":
     print("  not клеопатра")
     print("  (клеопатра and цезарь) or антоний")
     print("  not (клеопатра or цезарь) and антоний")
+    print("  клеопат* and не?ть")
+    print("  клеопатар~ or цезарь~1")
+    if search_engine.positional is not None:
+        print('  "битва при акциуме" and not цезарь')
+        print("  клеопатра near/5 антоний")
     print("Введите 'exit' для выхода")
 
     while True:
         query = input("\nВведите поисковый запрос: ").strip()
         if query.lower() == 'exit':
             break
-        search_engine.pretty_search(query)
\ No newline at end of file
+        search_engine.pretty_search(query)
+
+    # SEARCH_METRICS=1 python inverted_search.py — время разбора и вычисления запросов
+    if metrics.ENABLED:
+        print(metrics.registry.report())
\ No newline at end of file
@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable
+
+DEFAULT_SIZE = 200_000
+# Разборы, сохранённые при обработке корпуса; поиск берёт их же, чтобы запрос и документы
+# лемматизировались одинаково
+CACHE_FILE = "lemma_cache.json"
+
+
+class LemmaCache:
+    """Ограниченный LRU-кэш «словоформа -> лемма» поверх морфологического анализатора.
+
+    Считает попадания и промахи, помнит формы, разобранные с последнего drain_new(), —
+    так рабочие процессы отдают родителю только новое, — и сохраняется в JSON между запусками.
+    Если новое никто не забирает (кэш запросов), track_new=False, иначе оно копится без предела.
+    Безопасен для потоков: веб-сервер обрабатывает запросы параллельно.
+    """
+
+    def __init__(self, analyze: Callable[[str], str], maxsize: int = DEFAULT_SIZE, track_new: bool = True):
+        self.analyze = analyze
+        self.maxsize = maxsize
+        self.track_new = track_new
+        self.hits = 0
+        self.misses = 0
+        self._lemmas = OrderedDict()
+        self._new = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lemmas)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._lemmas
+
+    def lemmatize(self, word: str) -> str:
+        with self._lock:
+            lemma = self._lemmas.get(word)
+            if lemma is not None:
+                self.hits += 1
+                self._lemmas.move_to_end(word)
+                return lemma
+            self.misses += 1
+
+        # Разбор — самая долгая часть, под замком его не держим
+        lemma = self.analyze(word)
+        with self._lock:
+            if self.track_new:
+                self._new[word] = lemma
+            self._put(word, lemma)
+        return lemma
+
+    def _put(self, word: str, lemma: str):
+        self._lemmas[word] = lemma
+        self._lemmas.move_to_end(word)
+        if len(self._lemmas) > self.maxsize:
+            self._lemmas.popitem(last=False)
+
+    def update(self, lemmas: Dict[str, str]):
+        """Добавляет готовые разборы (например, присланные рабочими процессами)"""
+        with self._lock:
+            for word, lemma in lemmas.items():
+                self._put(word, lemma)
+
+    def items(self) -> Iterable:
+        with self._lock:
+            return list(self._lemmas.items())
+
+    def drain_new(self) -> Dict[str, str]:
+        with self._lock:
+            new, self._new = self._new, {}
+        return new
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            self.update(json.load(f))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.items()), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
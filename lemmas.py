@@ -1,11 +1,23 @@
 import os
 import re
+import time
+import argparse
+from collections import Counter
 import pymorphy2
-from bs4 import BeautifulSoup
+from functools import partial
+from multiprocessing import Pool
+
+from crawl_state import load_changed_documents, MANIFEST_FILE
+from lemma_cache import LemmaCache, CACHE_FILE
+import html_text
+import metrics
 
 # Папки
 INPUT_FOLDER = "rt_articles"   # Папка с HTML-статьями
+TEXT_FOLDER = html_text.TEXT_FOLDER  # Уже извлечённый текст статей (html_text.py или crawler.py --save-text)
 OUTPUT_FOLDER = "lemmas_tokens"       # Папка для результатов
+COUNTS_FOLDER = "lemma_counts"        # Сколько раз каждая лемма встречается в статье
+LEMMA_CACHE_FILE = CACHE_FILE  # Разобранные словоформы между запусками
 
 # Cписок стоп-слов (союзы, предлоги и т.д.)
 STOPWORDS = {
@@ -23,69 +35,196 @@ STOPWORDS = {
     "такой", "им", "более", "всегда", "конечно", "всю", "между"
 }
 
-# Инициализируем лемматизатор
-morph = pymorphy2.MorphAnalyzer()
+# Лемматизатор создаётся при первом разборе — в каждом рабочем процессе один раз
+morph = None
+
+
+def get_morph():
+    global morph
+    if morph is None:
+        morph = pymorphy2.MorphAnalyzer()
+    return morph
+
+
+def analyze(word):
+    return get_morph().parse(word)[0].normal_form
+
+
+# Кэш словоформ: большинство слов повторяется из статьи в статью
+lemma_cache = LemmaCache(analyze)
 
 # Функция очистки HTML и извлечения текста
 def extract_text_from_html(file_path):
     with open(file_path, "r", encoding="utf-8") as file:
-        soup = BeautifulSoup(file, "html.parser")
-    text = soup.get_text()
-    text = re.sub(r'\s+', ' ', text)  # Убираем лишние пробелы и переносы строк
-    return text.strip()
+        return extract_text(file.read())
+
+# То же для HTML, уже прочитанного в строку (например, прямо из краулера);
+# меню, подвал, «Поделиться» и прочие шаблонные блоки сайта в текст не попадают
+def extract_text(html):
+    return html_text.extract_text(html)
+
+# Слова русского текста; регулярное выражение одно на все функции ниже
+WORD_RE = re.compile(r'\b[а-яА-ЯёЁ]+\b')
 
 # Функция токенизации с фильтрацией одиночных букв
+@metrics.timed("tokenize")
 def tokenize(text):
-    words = re.findall(r'\b[а-яА-ЯёЁ]+\b', text.lower())  # Ищем только слова
+    words = WORD_RE.findall(text.lower())  # Ищем только слова
     words = [word for word in words if len(word) > 1 and word not in STOPWORDS]  # Убираем односимвольные токены
     return list(set(words))  # Убираем дубликаты
 
+# То же, но с числом вхождений каждого слова — для BM25 и настоящего TF
+@metrics.timed("tokenize")
+def count_tokens(text):
+    return count_words(WORD_RE.findall(text.lower()))
+
+# Число вхождений по уже выделенным словам (html_text.extract_words)
+def count_words(words):
+    return Counter(word for word in words if len(word) > 1 and word not in STOPWORDS)
+
 # Функция лемматизации с фильтрацией односимвольных лемм
+@metrics.timed("lemmatize")
 def lemmatize_tokens(tokens):
     lemma_dict = {}
     for token in tokens:
-        lemma = morph.parse(token)[0].normal_form  # Получаем лемму
+        lemma = lemma_cache.lemmatize(token)  # Получаем лемму
         if len(lemma) > 1:  # Фильтруем леммы, которые короче 2 символов
             if lemma not in lemma_dict:
                 lemma_dict[lemma] = token  # Запоминаем одно слово для этой леммы
     return lemma_dict
 
+# Число вхождений каждой леммы: складываем вхождения её словоформ
+@metrics.timed("lemmatize")
+def count_lemmas(token_counts):
+    lemma_counts = Counter()
+    for token, count in token_counts.items():
+        lemma = lemma_cache.lemmatize(token)
+        if len(lemma) > 1:
+            lemma_counts[lemma] += count
+    return lemma_counts
+
+def write_lemma_counts(i, lemma_counts, folder=COUNTS_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f"lemma_counts_{i}.txt"), "w", encoding="utf-8") as f:
+        for lemma, count in sorted(lemma_counts.items()):
+            f.write(f"{lemma} {count}\n")
+
+def process_article(i, from_texts=False):
+    """Обрабатывает одну статью; возвращает номер, признак успеха и новые разборы из кэша.
+    С from_texts текст берётся из TEXT_FOLDER, и HTML не разбирается"""
+    file_name = f"article_{i}.txt"
+    input_path = os.path.join(TEXT_FOLDER if from_texts else INPUT_FOLDER, file_name)
+    if not os.path.exists(input_path):
+        print(f"Файл {file_name} не найден, пропускаем...")
+        return i, False, {}
+
+    print(f"Обрабатываю {file_name}...")
+
+    # 1-2. Извлекаем чистый текст и токенизируем, запоминая число вхождений;
+    # из HTML слова выделяются тем же проходом, что сжимает пробелы
+    if from_texts:
+        token_counts = count_tokens(html_text.read_text(i, TEXT_FOLDER))
+    else:
+        with open(input_path, "r", encoding="utf-8") as file:
+            _, words = html_text.extract_words(file.read())
+        token_counts = count_words(words)
+    tokens = list(token_counts)
+    metrics.count("documents")
+    metrics.count("tokens", sum(token_counts.values()))
+
+    # 3. Лемматизируем и убираем дубликаты
+    lemma_dict = lemmatize_tokens(tokens)
+
+    # 4. Записываем токены в файл
+    tokens_file = os.path.join(OUTPUT_FOLDER, f"tokens_{i}.txt")
+    with open(tokens_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(tokens))
+
+    # 5. Записываем леммы в файл
+    lemmas_file = os.path.join(OUTPUT_FOLDER, f"lemmas_{i}.txt")
+    with open(lemmas_file, "w", encoding="utf-8") as f:
+        for lemma, word in lemma_dict.items():
+            f.write(f"{lemma} {word}\n")  # Только одна форма слова
+
+    # 6. Записываем число вхождений лемм (отдельная папка: lemmas_tokens читает булев поиск)
+    write_lemma_counts(i, count_lemmas(token_counts))
+
+    return i, True, lemma_cache.drain_new()
+
+
+def _init_worker(known_lemmas):
+    # Рабочий процесс начинает с уже известных разборов и сам создаёт анализатор
+    lemma_cache.update(known_lemmas)
+    lemma_cache.reset_stats()
+    get_morph()
+
+
+def _process_article_in_worker(i, from_texts=False):
+    result = process_article(i, from_texts)
+    stats = (lemma_cache.hits, lemma_cache.misses)
+    lemma_cache.reset_stats()
+    # Счётчики и таймеры статьи уходят родителю вместе с результатом
+    snapshot = metrics.registry.snapshot() if metrics.ENABLED else None
+    metrics.registry.reset()
+    return result + stats + (snapshot,)
+
+
 # Основной процесс
-def process_articles():
+def process_articles(doc_ids=None, workers=None, cache_file=LEMMA_CACHE_FILE, from_texts=False):
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)  # Создаем папку, если ее нет
 
-    for i in range(1, 101):  # 100 файлов: article_1.txt - article_100.txt
-        file_name = f"article_{i}.txt"
-        input_path = os.path.join(INPUT_FOLDER, file_name)
-        if not os.path.exists(input_path):
-            print(f"Файл {file_name} не найден, пропускаем...")
-            continue
-
-        print(f"Обрабатываю {file_name}...")
-
-        # 1. Извлекаем чистый текст
-        text = extract_text_from_html(input_path)
-
-        # 2. Токенизируем
-        tokens = tokenize(text)
-
-        # 3. Лемматизируем и убираем дубликаты
-        lemma_dict = lemmatize_tokens(tokens)
-
-        # 4. Записываем токены в файл
-        tokens_file = os.path.join(OUTPUT_FOLDER, f"tokens_{i}.txt")
-        with open(tokens_file, "w", encoding="utf-8") as f:
-            f.write("\n".join(tokens))
-
-        # 5. Записываем леммы в файл
-        lemmas_file = os.path.join(OUTPUT_FOLDER, f"lemmas_{i}.txt")
-        with open(lemmas_file, "w", encoding="utf-8") as f:
-            for lemma, word in lemma_dict.items():
-                f.write(f"{lemma} {word}\n")  # Только одна форма слова
-
+    if doc_ids is None:
+        doc_ids = range(1, 101)  # 100 файлов: article_1.txt - article_100.txt
+    doc_ids = list(doc_ids)
+    workers = workers or os.cpu_count() or 1
+
+    if cache_file:
+        lemma_cache.load(cache_file)
+    lemma_cache.reset_stats()
+    lemma_cache.drain_new()
+
+    start = time.perf_counter()
+    processed = 0
+    if workers == 1:
+        for i in doc_ids:
+            processed += process_article(i, from_texts)[1]
+        hits, misses = lemma_cache.hits, lemma_cache.misses
+    else:
+        hits = misses = 0
+        known = dict(lemma_cache.items())
+        process = partial(_process_article_in_worker, from_texts=from_texts)
+        with Pool(workers, initializer=_init_worker, initargs=(known,)) as pool:
+            for _, ok, new_lemmas, worker_hits, worker_misses, snapshot in pool.imap_unordered(process, doc_ids):
+                processed += ok
+                lemma_cache.update(new_lemmas)
+                hits += worker_hits
+                misses += worker_misses
+                if snapshot:
+                    metrics.registry.merge(snapshot)
+    elapsed = time.perf_counter() - start
+
+    if cache_file:
+        lemma_cache.save(cache_file)
+
+    hit_rate = hits / (hits + misses) if hits + misses else 0.0
+    print(f"Обработано статей: {processed} за {elapsed:.2f} с ({processed / elapsed if elapsed else 0:.1f} док/с), "
+          f"процессов: {workers}, попаданий в кэш лемм: {hit_rate:.1%}, в кэше словоформ: {len(lemma_cache)}")
     print("Обработка завершена! Все файлы сохранены в папке output/.")
+    if metrics.ENABLED:
+        print(metrics.registry.report())
+    return {"documents": processed, "seconds": elapsed, "hits": hits, "misses": misses}
 
 # Запуск скрипта
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"обработать только новые и изменённые статьи из {MANIFEST_FILE}")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — по числу ядер)")
+    parser.add_argument("--from-texts", action="store_true",
+                        help=f"брать уже извлечённый текст из {TEXT_FOLDER}/ вместо разбора HTML")
+    parser.add_argument("--metrics", action="store_true", help="вывести время по стадиям обработки")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    process_articles(load_changed_documents() if args.changed_only else None, args.workers, from_texts=args.from_texts)
@@ -0,0 +1,249 @@
+"""Счётчики и таймеры стадий обработки корпуса и поиска.
+
+Стадии: разбор HTML, токенизация, лемматизация, запись индексов, разбор запроса,
+подсчёт оценок и сортировка выдачи. По умолчанию выключено: timer() возвращает
+общий пустой контекстный менеджер, а count() сразу выходит — на горячем пути
+остаётся одна проверка флага. Включается переменной окружения SEARCH_METRICS=1
+или enable(). Значения копятся в процессе: у рабочих процессов веб-сервера они
+свои, а lemmas.py собирает снимки своих рабочих процессов через merge().
+
+Здесь же выборочный профилировщик: отдельный поток раз в interval снимает стек
+профилируемого потока, результат — свёрнутые стеки для flamegraph.pl или speedscope.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+ENABLED = os.environ.get("SEARCH_METRICS") == "1"
+PREFIX = "search"
+# Границы корзин гистограммы времени стадии, секунды
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+PROFILE_INTERVAL = 0.001
+
+_NULL = nullcontext()
+# Интервалы работающих SamplingProfiler и исходный интервал переключения потоков процесса
+_profile_lock = threading.Lock()
+_profile_intervals: List[float] = []
+_switch_interval: Optional[float] = None
+
+
+class _Stage:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+
+class Registry:
+    """Потокобезопасные счётчики и таймеры стадий одного процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._counters: Counter = Counter()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = _Stage()
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def merge(self, snapshot: dict):
+        """Добавляет снимок другого процесса (например, рабочего процесса lemmas.py)"""
+        with self._lock:
+            for stage, other in snapshot["stages"].items():
+                entry = self._stages.get(stage)
+                if entry is None:
+                    entry = self._stages[stage] = _Stage()
+                entry.count += other["count"]
+                entry.total += other["seconds"]
+                entry.max = max(entry.max, other["max_seconds"])
+                entry.buckets = [a + b for a, b in zip(entry.buckets, other["buckets"])]
+            self._counters.update(snapshot["counters"])
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {stage: {"count": entry.count, "seconds": entry.total, "max_seconds": entry.max,
+                                   "buckets": list(entry.buckets)}
+                           for stage, entry in sorted(self._stages.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def to_prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Текстовый формат Prometheus; gauges — дополнительные мгновенные значения (размеры кэшей и т. п.)"""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {PREFIX}_stage_seconds Время стадий обработки и поиска",
+                 f"# TYPE {PREFIX}_stage_seconds histogram"]
+        for stage, entry in snapshot["stages"].items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), entry["buckets"]):
+                cumulative += count
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {entry["seconds"]:.9f}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        lines.append(f"# TYPE {PREFIX}_stage_max_seconds gauge")
+        for stage, entry in snapshot["stages"].items():
+            lines.append(f'{PREFIX}_stage_max_seconds{{stage="{stage}"}} {entry["max_seconds"]:.9f}')
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        """Таблица для вывода в консоль после обработки корпуса"""
+        snapshot = self.snapshot()
+        lines = [f"{'стадия':<16} {'вызовов':>9} {'всего, с':>10} {'среднее, мс':>12} {'максимум, мс':>13}"]
+        for stage, entry in snapshot["stages"].items():
+            mean = entry["seconds"] / entry["count"] * 1000 if entry["count"] else 0.0
+            lines.append(f"{stage:<16} {entry['count']:>9} {entry['seconds']:>10.3f} {mean:>12.3f} "
+                         f"{entry['max_seconds'] * 1000:>13.3f}")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+registry = Registry()
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.observe(self.stage, time.perf_counter() - self.start)
+
+
+def enable(enabled: bool = True):
+    """Включает сбор и в процессах, которые будут запущены потом (через окружение)"""
+    global ENABLED
+    ENABLED = enabled
+    os.environ["SEARCH_METRICS"] = "1" if enabled else "0"
+
+
+def timer(stage: str):
+    """with metrics.timer("tokenize"): ... — время блока попадает в стадию"""
+    return _Timer(stage) if ENABLED else _NULL
+
+
+def timed(stage: str):
+    """Декоратор: время каждого вызова функции попадает в стадию"""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _Timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, value: int = 1):
+    if ENABLED:
+        registry.add(name, value)
+
+
+def _start_profile(interval: float):
+    global _switch_interval
+    with _profile_lock:
+        if not _profile_intervals:
+            _switch_interval = sys.getswitchinterval()
+        _profile_intervals.append(interval)
+        sys.setswitchinterval(min(_switch_interval, *_profile_intervals))
+
+
+def _stop_profile(interval: float):
+    with _profile_lock:
+        _profile_intervals.remove(interval)
+        if _profile_intervals:
+            sys.setswitchinterval(min(_switch_interval, *_profile_intervals))
+        else:
+            sys.setswitchinterval(_switch_interval)
+
+
+class SamplingProfiler:
+    """Выборочный профилировщик одного потока (по умолчанию — того, что его создал).
+
+    with SamplingProfiler() as profiler: ... — пока блок выполняется, фоновый поток
+    раз в interval секунд снимает стек через sys._current_frames(). Чтобы фоновый поток
+    успевал получить GIL, на время профилирования интервал переключения потоков
+    интерпретатора уменьшается до interval (это действует на весь процесс). Профили могут
+    пересекаться: действует наименьший interval из работающих, а исходное значение
+    возвращается, когда завершается последний.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self) -> "SamplingProfiler":
+        _start_profile(self.interval)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        _stop_profile(self.interval)
+
+    def collapsed(self) -> str:
+        """Строки «функция;функция;... число выборок» — вход flamegraph.pl"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Функции, в которых чаще всего заставали поток (вершина стека)"""
+        functions = Counter()
+        for stack, samples in self.samples.items():
+            functions[stack.rsplit(";", 1)[-1]] += samples
+        return functions.most_common(n)
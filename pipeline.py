@@ -0,0 +1,241 @@
+"""Потоковая обработка корпуса за один проход: HTML -> текст -> токены -> леммы -> индексы.
+
+Заменяет цепочку crawler.py -> lemmas.py -> count_tf_and_idf.py -> построение индексов:
+документы идут через генераторы по одному, промежуточные файлы не нужны
+(но их можно записать для совместимости флагом --legacy).
+"""
+import argparse
+import math
+import os
+import re
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import lemmas
+import metrics
+from binary_index import write_binary_index
+from bm25 import BM25_INDEX_FILE, write_bm25_index
+from forward_store import ForwardStoreWriter
+from inverted_search import BooleanSearchEngine
+from positional_index import PositionalIndexBuilder
+from search import INDEX_FILE as SEARCH_INDEX_FILE
+
+BOOLEAN_INDEX_FILE = "inverted_index.bin"
+OUTPUT_TERMS_DIR = "output_tokens"
+OUTPUT_LEMMAS_DIR = "output_lemmas"
+
+
+def read_html_files(folder: str = lemmas.INPUT_FOLDER, doc_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, str]]:
+    """Статьи article_N.txt с диска по возрастанию номера (из lemmas.TEXT_FOLDER — уже текст)"""
+    if doc_ids is None:
+        doc_ids = sorted(int(match.group(1)) for match in
+                         (re.fullmatch(r"article_(\d+)\.txt", name) for name in os.listdir(folder)) if match)
+    for doc_id in doc_ids:
+        path = os.path.join(folder, f"article_{doc_id}.txt")
+        if not os.path.exists(path):
+            print(f"Файл {path} не найден, пропускаем...")
+            continue
+        with open(path, encoding="utf-8") as f:
+            yield doc_id, f.read()
+
+
+def crawl_html(**crawler_options) -> Iterator[Tuple[int, str]]:
+    """Статьи прямо из краулера, без сохранения HTML на диск"""
+    from crawler import ConcurrentCrawler
+
+    for doc_id, _, html in ConcurrentCrawler(**crawler_options).stream():
+        yield doc_id, html
+
+
+def extract_texts(documents: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    for doc_id, html in documents:
+        yield doc_id, lemmas.extract_text(html)
+
+
+def index_positions(documents: Iterable[Tuple[int, str]], builder: PositionalIndexBuilder) -> Iterator[Tuple[int, str]]:
+    """Пропускает тексты дальше, попутно запоминая позиции слов для фраз и NEAR/n"""
+    for doc_id, text in documents:
+        builder.add(doc_id, text)
+        yield doc_id, text
+
+
+def store_texts(documents: Iterable[Tuple[int, str]], writer: ForwardStoreWriter) -> Iterator[Tuple[int, str]]:
+    """Пропускает тексты дальше, попутно сжимая их в хранилище для сниппетов"""
+    for doc_id, text in documents:
+        writer.add(doc_id, text)
+        yield doc_id, text
+
+
+def tokenize_texts(documents: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, Counter]]:
+    for doc_id, text in documents:
+        token_counts = lemmas.count_tokens(text)
+        metrics.count("documents")
+        metrics.count("tokens", sum(token_counts.values()))
+        yield doc_id, token_counts
+
+
+def lemmatize_documents(documents: Iterable[Tuple[int, Counter]]) -> Iterator[Tuple[int, List[str], Dict[str, str], Counter]]:
+    """Для документа: токены, лемма -> одна из её словоформ и число вхождений каждой леммы"""
+    for doc_id, token_counts in documents:
+        tokens = list(token_counts)
+        yield doc_id, tokens, lemmas.lemmatize_tokens(tokens), lemmas.count_lemmas(token_counts)
+
+
+def write_legacy_tokens(documents, folder: str = lemmas.OUTPUT_FOLDER):
+    """Пропускает документы дальше, попутно записывая tokens_N.txt, lemmas_N.txt и lemma_counts_N.txt, как lemmas.py"""
+    os.makedirs(folder, exist_ok=True)
+    for doc_id, tokens, lemma_dict, lemma_counts in documents:
+        with open(os.path.join(folder, f"tokens_{doc_id}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(tokens))
+        with open(os.path.join(folder, f"lemmas_{doc_id}.txt"), "w", encoding="utf-8") as f:
+            for lemma, word in lemma_dict.items():
+                f.write(f"{lemma} {word}\n")
+        lemmas.write_lemma_counts(doc_id, lemma_counts)
+        yield doc_id, tokens, lemma_dict, lemma_counts
+
+
+class IndexBuilder:
+    """Накапливает документы в виде номеров терминов и в конце пишет оба бинарных индекса.
+
+    Тексты и HTML не хранятся: на документ остаются только массивы номеров терминов,
+    которые нужны, чтобы посчитать tf-idf после того, как станет известен DF.
+    """
+
+    def __init__(self):
+        self.doc_ids = []
+        self._term_ids = {}
+        self._terms = []
+        self._lemma_df = defaultdict(int)
+        self._token_df = defaultdict(int)
+        self._doc_lemmas = []  # номера лемм документа
+        self._doc_tokens = []  # номера токенов документа
+        self._doc_words = []   # номера словоформ, записанных рядом с леммами в lemmas_N.txt
+        self._doc_counts = []  # число вхождений лемм документа, в том же порядке, что _doc_lemmas
+
+    def _ids(self, terms: Iterable[str]) -> array:
+        ids = array("I")
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                term_id = self._term_ids[term] = len(self._terms)
+                self._terms.append(term)
+            ids.append(term_id)
+        return ids
+
+    def add(self, doc_id: int, tokens: List[str], lemma_dict: Dict[str, str], lemma_counts: Optional[Dict[str, int]] = None):
+        token_set = {token.lower() for token in tokens}
+        lemma_set = {lemma.lower() for lemma in lemma_dict}
+        for lemma in lemma_set:
+            self._lemma_df[lemma] += 1
+        for token in token_set:
+            self._token_df[token] += 1
+
+        self.doc_ids.append(doc_id)
+        self._doc_lemmas.append(self._ids(sorted(lemma_set)))
+        self._doc_counts.append(array("I", ((lemma_counts or {}).get(lemma, 1) for lemma in sorted(lemma_set))))
+        self._doc_tokens.append(self._ids(sorted(token_set)))
+        self._doc_words.append(self._ids(lemma_dict.values()))
+
+    def consume(self, documents: Iterable[Tuple[int, List[str], Dict[str, str], Counter]]) -> "IndexBuilder":
+        for doc_id, tokens, lemma_dict, lemma_counts in documents:
+            self.add(doc_id, tokens, lemma_dict, lemma_counts)
+        return self
+
+    def _tf_idf(self, doc_terms: List[array], df: Dict[str, int]) -> Iterator[List[Tuple[str, float, float]]]:
+        """Для каждого документа — (термин, idf, tf-idf) по алфавиту, как в count_tf_and_idf.py"""
+        n = len(self.doc_ids)
+        idf = {term: math.log(n / count) for term, count in df.items()}
+        for term_ids in doc_terms:
+            tf = 1 / len(term_ids) if term_ids else 0
+            yield [(self._terms[i], idf[self._terms[i]], tf * idf[self._terms[i]]) for i in term_ids]
+
+    def write_search_index(self, path: str = SEARCH_INDEX_FILE):
+        postings = defaultdict(list)
+        weights = defaultdict(list)
+        idf = {}
+        for doc_num, rows in enumerate(self._tf_idf(self._doc_lemmas, self._lemma_df)):
+            norm = math.sqrt(sum(tfidf * tfidf for _, _, tfidf in rows))
+            for lemma, lemma_idf, tfidf in rows:
+                idf[lemma] = lemma_idf
+                postings[lemma].append(doc_num)
+                weights[lemma].append(tfidf / norm if norm else 0.0)
+        write_binary_index(path, [str(doc_id) for doc_id in self.doc_ids], postings, weights, idf)
+        print(f"Индекс для ранжирования сохранен в {path}")
+
+    def write_bm25_index(self, path: str = BM25_INDEX_FILE):
+        doc_counts = [{self._terms[term_id]: count for term_id, count in zip(lemma_ids, counts)}
+                      for lemma_ids, counts in zip(self._doc_lemmas, self._doc_counts)]
+        write_bm25_index(path, [str(doc_id) for doc_id in self.doc_ids], doc_counts)
+        print(f"Индекс BM25 сохранен в {path}")
+
+    def write_boolean_index(self, path: str = BOOLEAN_INDEX_FILE):
+        # Как BooleanSearchEngine.build_index по lemmas_tokens: документы lemmas_N и tokens_N
+        named = []
+        for doc_id, lemma_ids, word_ids, token_ids in zip(self.doc_ids, self._doc_lemmas, self._doc_words, self._doc_tokens):
+            named.append((f"lemmas_{doc_id}", set(lemma_ids) | set(word_ids)))
+            named.append((f"tokens_{doc_id}", set(token_ids)))
+        named.sort(key=lambda item: item[0])
+
+        postings = defaultdict(list)
+        for doc_num, (_, term_ids) in enumerate(named):
+            for term_id in term_ids:
+                postings[self._terms[term_id]].append(doc_num)
+
+        engine = BooleanSearchEngine.from_postings([name for name, _ in named], postings)
+        engine.index_file = path
+        engine.save_index()
+
+    def write_legacy_tf_idf(self, terms_dir: str = OUTPUT_TERMS_DIR, lemmas_dir: str = OUTPUT_LEMMAS_DIR):
+        os.makedirs(terms_dir, exist_ok=True)
+        os.makedirs(lemmas_dir, exist_ok=True)
+        for doc_id, rows in zip(self.doc_ids, self._tf_idf(self._doc_tokens, self._token_df)):
+            with open(os.path.join(terms_dir, f"article_{doc_id}_tokens.txt"), "w", encoding="utf-8") as f:
+                for term, idf, tfidf in rows:
+                    f.write(f"{term} {idf:.6f} {tfidf:.6f}\n")
+        for doc_id, rows in zip(self.doc_ids, self._tf_idf(self._doc_lemmas, self._lemma_df)):
+            with open(os.path.join(lemmas_dir, f"article_{doc_id}_lemmas.txt"), "w", encoding="utf-8") as f:
+                for lemma, idf, tfidf in rows:
+                    f.write(f"{lemma} {idf:.6f} {tfidf:.6f}\n")
+
+
+def run(documents: Iterable[Tuple[int, str]], legacy: bool = False, extracted: bool = False) -> IndexBuilder:
+    """extracted — документы уже текст, а не HTML"""
+    positions = PositionalIndexBuilder()
+    store = ForwardStoreWriter()
+    texts = documents if extracted else extract_texts(documents)
+    stream = lemmatize_documents(tokenize_texts(store_texts(index_positions(texts, positions), store)))
+    if legacy:
+        stream = write_legacy_tokens(stream)
+
+    builder = IndexBuilder().consume(stream)
+    print(f"Обработано документов: {len(builder.doc_ids)}")
+
+    builder.write_search_index()
+    builder.write_bm25_index()
+    builder.write_boolean_index()
+    positions.write()
+    store.write()
+    if legacy:
+        builder.write_legacy_tf_idf()
+    return builder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crawl", action="store_true", help="брать статьи прямо из краулера, а не из rt_articles/")
+    parser.add_argument("--texts", action="store_true",
+                        help=f"брать уже извлечённый текст из {lemmas.TEXT_FOLDER}/, не разбирая HTML")
+    parser.add_argument("--legacy", action="store_true",
+                        help="дополнительно записать lemmas_tokens/, output_tokens/ и output_lemmas/")
+    parser.add_argument("--metrics", action="store_true", help="вывести время по стадиям обработки")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+
+    if args.crawl:
+        run(crawl_html(), args.legacy)
+    else:
+        run(read_html_files(lemmas.TEXT_FOLDER if args.texts else lemmas.INPUT_FOLDER), args.legacy, args.texts)
+    if args.metrics:
+        print(metrics.registry.report())
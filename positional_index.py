@@ -0,0 +1,185 @@
+"""Позиционный индекс для фраз и запросов NEAR/n.
+
+Для каждого слова хранятся номера статей (как в binary_index) и позиции слова в тексте
+статьи: по возрастанию, разностями в varint. Позиции считаются по всем словам текста,
+включая стоп-слова, поэтому фраза «полив в жару» ищется точно. При поиске сначала
+пересекаются списки статей, и позиции декодируются только для статей из пересечения.
+"""
+import argparse
+import re
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from binary_index import BinaryIndex, encode_varints, decode_varints, write_binary_index
+
+POSITIONAL_INDEX_FILE = "positional_index.bin"
+
+# Те же слова, что в lemmas.tokenize, но без отбрасывания стоп-слов и повторов
+WORD_RE = re.compile(r'\b[а-яА-ЯёЁ]+\b')
+
+# Ключ (статья, позиция) в одном int64 — так совпадения ищутся сразу во всех статьях
+_POSITION_BITS = 32
+
+
+def word_positions(text: str) -> Dict[str, List[int]]:
+    positions = defaultdict(list)
+    for position, match in enumerate(WORD_RE.finditer(text.lower())):
+        positions[match.group()].append(position)
+    return positions
+
+
+class PositionalIndexBuilder:
+    """Копит позиции по мере поступления статей и пишет индекс одним файлом"""
+
+    def __init__(self):
+        self.doc_ids = []
+        self._docs = defaultdict(lambda: array("I"))
+        self._positions = defaultdict(list)  # слово -> массивы позиций по статьям
+
+    def add(self, doc_id: int, text: str):
+        doc_num = len(self.doc_ids)
+        self.doc_ids.append(str(doc_id))
+        for word, positions in word_positions(text).items():
+            self._docs[word].append(doc_num)
+            self._positions[word].append(array("I", positions))
+
+    def write(self, path: str = POSITIONAL_INDEX_FILE):
+        write_positional_index(path, self.doc_ids, self._docs, self._positions)
+        print(f"Позиционный индекс сохранен в {path}")
+
+
+def write_positional_index(path: str, doc_ids: List[str], postings: Dict[str, Sequence[int]],
+                           positions: Dict[str, Sequence[Sequence[int]]]):
+    """positions[word][j] — позиции слова в статье postings[word][j]"""
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    term_start = np.zeros(len(terms) + 1, dtype="<u8")  # номер первого постинга слова
+    byte_offsets = [np.zeros(1, dtype="<u8")]  # начало позиций каждого постинга в секции pos
+    encoded = []
+    total = 0
+    for i, term in enumerate(terms):
+        term_positions = positions[term]
+        term_start[i + 1] = term_start[i] + len(term_positions)
+        lengths = np.array([len(p) for p in term_positions])
+        flat = np.concatenate([np.asarray(p, dtype=np.int64) for p in term_positions])
+        # Разности внутри статьи: первая позиция статьи хранится как есть
+        deltas = np.diff(flat, prepend=0)
+        deltas[np.cumsum(lengths)[:-1]] = flat[np.cumsum(lengths)[:-1]]
+        data = encode_varints(deltas)
+        ends = np.cumsum(np.concatenate(([0], lengths)))[1:]
+        # Длины varint по постингам: где заканчивается последнее число каждой статьи
+        last_bytes = np.flatnonzero(data < 0x80)[ends - 1] + 1
+        byte_offsets.append((total + last_bytes).astype("<u8"))
+        encoded.append(data.tobytes())
+        total += len(data)
+
+    write_binary_index(path, doc_ids, postings, extra_sections={
+        "tpost": term_start.tobytes(),
+        "posoffs": np.concatenate(byte_offsets).astype("<u8").tobytes(),
+        "pos": b"".join(encoded),
+    })
+
+
+class PositionalIndex:
+    """Позиционный индекс, открытый через mmap"""
+
+    def __init__(self, path: str = POSITIONAL_INDEX_FILE):
+        self.index = BinaryIndex(path)
+        self.doc_ids = self.index.doc_ids
+        self._term_start = self.index.section("tpost", "<u8")
+        self._offsets = self.index.section("posoffs", "<u8")
+        self._data = self.index.section("pos")
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def df(self, word: str) -> int:
+        return self.index.df(word)
+
+    def doc_numbers(self, word: str) -> np.ndarray:
+        return self.index.doc_numbers(word)
+
+    def _positions(self, word: str, docs: np.ndarray) -> np.ndarray:
+        """Ключи (статья, позиция) для позиций слова в статьях docs (все они есть в постингах слова)"""
+        term_id = self.index.term_id(word)
+        postings = self.index.doc_numbers_at(term_id)
+        selected = int(self._term_start[term_id]) + np.searchsorted(postings, docs)
+        starts = self._offsets[selected].astype(np.int64)
+        ends = self._offsets[selected + 1].astype(np.int64)
+        data = np.concatenate([self._data[start:end] for start, end in zip(starts, ends)] or [np.empty(0, np.uint8)])
+        deltas = decode_varints(data).astype(np.int64)
+
+        # Сколько чисел в каждой статье: считаем последние байты varint по статьям
+        is_last = data < 0x80
+        counts = np.add.reduceat(is_last, np.concatenate(([0], np.cumsum(ends - starts)[:-1]))) if len(docs) else []
+        counts = np.asarray(counts, dtype=np.int64)
+        first = np.cumsum(counts) - counts
+        # Восстанавливаем позиции из разностей отдельно внутри каждой статьи
+        positions = np.cumsum(deltas)
+        positions -= np.repeat(positions[first] - deltas[first], counts)
+        return (np.repeat(docs.astype(np.int64), counts) << _POSITION_BITS) | positions
+
+    def _common_docs(self, words: Iterable[str]) -> Optional[np.ndarray]:
+        words = sorted(set(words), key=self.df)
+        if not words or not self.df(words[0]):
+            return None
+        docs = self.doc_numbers(words[0])
+        for word in words[1:]:
+            docs = np.intersect1d(docs, self.doc_numbers(word), assume_unique=True)
+            if not len(docs):
+                return None
+        return docs
+
+    def phrase_docs(self, words: Sequence[str]) -> np.ndarray:
+        """Статьи, где слова идут подряд в этом порядке"""
+        docs = self._common_docs(words)
+        if docs is None:
+            return np.empty(0, dtype=np.int64)
+
+        # Начало фразы — позиция i-го слова минус i; совпадение должно быть у всех слов
+        starts = self._positions(words[0], docs)
+        for offset, word in enumerate(words[1:], start=1):
+            starts = np.intersect1d(starts, self._positions(word, docs) - offset, assume_unique=True)
+            if not len(starts):
+                break
+        return np.unique(starts >> _POSITION_BITS)
+
+    def near_docs(self, first: str, second: str, distance: int) -> np.ndarray:
+        """Статьи, где между словами (в любом порядке) не больше distance позиций"""
+        docs = self._common_docs((first, second))
+        if docs is None:
+            return np.empty(0, dtype=np.int64)
+
+        left = self._positions(first, docs)
+        if first == second:
+            # Слово с самим собой: нужны два разных вхождения, то есть соседние ключи одной статьи
+            close = ((left[1:] >> _POSITION_BITS) == (left[:-1] >> _POSITION_BITS)) & (left[1:] - left[:-1] <= distance)
+            return np.unique(left[1:][close] >> _POSITION_BITS)
+
+        right = self._positions(second, docs)
+        # Для каждой позиции первого слова проверяем ближайшие позиции второго слева и справа
+        found = np.zeros(len(left), dtype=bool)
+        pos = np.searchsorted(right, left)
+        for neighbour in (pos - 1, pos):
+            valid = (neighbour >= 0) & (neighbour < len(right))
+            other = right[np.clip(neighbour, 0, len(right) - 1)]
+            same_doc = (other >> _POSITION_BITS) == (left >> _POSITION_BITS)
+            found |= valid & same_doc & (np.abs(other - left) <= distance)
+        return np.unique(left[found] >> _POSITION_BITS)
+
+
+if __name__ == "__main__":
+    import lemmas
+    from pipeline import read_html_files
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=lemmas.INPUT_FOLDER)
+    parser.add_argument("--output", default=POSITIONAL_INDEX_FILE)
+    args = parser.parse_args()
+
+    builder = PositionalIndexBuilder()
+    for doc_id, html in read_html_files(args.input):
+        builder.add(doc_id, lemmas.extract_text(html))
+    builder.write(args.output)
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+DEFAULT_SIZE = 10_000
+DEFAULT_TTL = 300.0  # секунд
+
+
+class QueryCache:
+    """Ограниченный LRU-кэш выдачи с временем жизни записей.
+
+    Потокобезопасен: веб-сервер обрабатывает запросы в нескольких потоках.
+    Устаревшая запись считается промахом и удаляется при обращении.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_SIZE, ttl: float = DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # ключ -> (момент записи, значение)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, usable: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """Значение по ключу или None. usable(значение) — годится ли запись для этого обращения
+        (например, хватает ли в ней результатов); если нет, это промах, а запись остаётся до put"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None and (usable is None or usable(entry[1])):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,164 @@
+import math
+from array import array
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np
+
+import metrics
+
+# Во сколько раз приближённый режим завышает порог отсечения
+APPROX_BOOST = 1.5
+
+
+class PostingsIndex:
+    """Постинги по леммам: номера документов по возрастанию и tf-idf, нормированный по длине документа.
+
+    Тот же набор методов (doc_ids, postings, max_weight, idf) есть у binary_index.BinaryIndex,
+    поэтому функции поиска ниже работают с обоими.
+    """
+
+    def __init__(self, doc_ids: List[str], postings: Dict[str, Tuple[np.ndarray, np.ndarray]], idf: Dict[str, float]):
+        self.doc_ids = doc_ids
+        self._postings = postings
+        self._idf = idf
+        self._max_weights = {lemma: float(weights.max()) for lemma, (_, weights) in postings.items()}
+
+    @classmethod
+    def from_index(cls, index: Dict[str, Dict[str, Tuple[float, float]]]) -> "PostingsIndex":
+        doc_ids = list(index)
+        postings = {}
+        idf = {}
+
+        # Документы обходятся по возрастанию номера, поэтому списки сразу отсортированы
+        for doc_num, doc_data in enumerate(index.values()):
+            norm = math.sqrt(sum(tfidf * tfidf for _, tfidf in doc_data.values()))
+            for lemma, (lemma_idf, tfidf) in doc_data.items():
+                idf.setdefault(lemma, lemma_idf)
+                if not tfidf:
+                    continue
+                if lemma not in postings:
+                    postings[lemma] = (array('i'), array('d'))
+                docs, weights = postings[lemma]
+                docs.append(doc_num)
+                weights.append(tfidf / norm)
+
+        postings = {lemma: (np.frombuffer(docs, dtype=np.int32), np.frombuffer(weights, dtype=np.float64))
+                    for lemma, (docs, weights) in postings.items()}
+        return cls(doc_ids, postings, idf)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def postings(self, lemma: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        return self._postings.get(lemma)
+
+    def max_weight(self, lemma: str) -> float:
+        return self._max_weights.get(lemma, 0.0)
+
+    def idf(self, lemma: str) -> Optional[float]:
+        return self._idf.get(lemma)
+
+
+def _normalized_query(query_vector: Dict[str, float], index: PostingsIndex) -> List[Tuple[str, float]]:
+    # Как и в search.search, норма запроса считается по всем его леммам, включая неизвестные индексу
+    query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+    if not query_norm:
+        return []
+    return [(lemma, weight / query_norm) for lemma, weight in query_vector.items()
+            if weight > 0 and index.postings(lemma) is not None]
+
+
+def search_taat(query_vector: Dict[str, float], index: PostingsIndex,
+                top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+    """Term-at-a-time: аккумуляторы заводятся только для документов, где есть леммы запроса"""
+    terms = _normalized_query(query_vector, index)
+    if not terms:
+        return []
+
+    with metrics.timer("scoring"):
+        doc_parts = []
+        score_parts = []
+        for lemma, weight in terms:
+            docs, weights = index.postings(lemma)
+            doc_parts.append(docs)
+            score_parts.append(weights.astype(np.float64) * weight)
+
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(docs))
+    metrics.count("candidates_scored", len(docs))
+
+    with metrics.timer("sort"):
+        keep = scores > 0
+        docs, scores = docs[keep], scores[keep]
+        if top_k is not None and top_k < len(docs):
+            if top_k <= 0:
+                return []
+            kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+            keep = scores >= kth
+            docs, scores = docs[keep], scores[keep]
+
+        order = np.lexsort((docs, -scores))[:top_k]
+        return [(index.doc_ids[docs[i]], float(scores[i])) for i in order]
+
+
+def search_maxscore(query_vector: Dict[str, float], index: PostingsIndex, top_k: int,
+                    exact: bool = True) -> List[Tuple[str, float]]:
+    """Term-at-a-time с отсечением MaxScore.
+
+    Леммы обходятся по убыванию верхней оценки. Как только сумма оценок оставшихся лемм
+    становится меньше k-й частичной оценки, новые документы больше не заводятся, а длинные
+    списки частых лемм только проверяются двоичным поиском для уже найденных кандидатов.
+    При exact=False порог завышается в APPROX_BOOST раз — быстрее, но часть выдачи может потеряться.
+    """
+    if top_k <= 0:
+        return []
+    boost = 1.0 if exact else APPROX_BOOST
+
+    with metrics.timer("scoring"):
+        terms = []
+        for lemma, weight in _normalized_query(query_vector, index):
+            docs, weights = index.postings(lemma)
+            terms.append((weight * index.max_weight(lemma), docs, weights.astype(np.float64) * weight))
+        if not terms:
+            return []
+        terms.sort(key=lambda term: term[0], reverse=True)
+
+        # rest[i] — сколько максимум могут добавить леммы начиная с i-й
+        rest = np.cumsum([term[0] for term in terms][::-1])[::-1].tolist() + [0.0]
+
+        cand_docs = np.empty(0, dtype=np.int32)
+        cand_scores = np.empty(0, dtype=np.float64)
+        threshold = 0.0
+
+        for i, (_, docs, weights) in enumerate(terms):
+            if rest[i] >= threshold * boost:
+                all_docs = np.concatenate((cand_docs, docs))
+                cand_docs, inverse = np.unique(all_docs, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=np.concatenate((cand_scores, weights)),
+                                          minlength=len(cand_docs))
+            else:
+                pos = np.searchsorted(docs, cand_docs)
+                pos[pos == len(docs)] = 0
+                hit = docs[pos] == cand_docs
+                cand_scores[hit] += weights[pos[hit]]
+
+            # Частичные оценки — нижние границы итоговых, поэтому k-я из них — надёжный порог
+            if len(cand_scores) >= top_k:
+                threshold = -np.partition(-cand_scores, top_k - 1)[top_k - 1]
+                keep = (cand_scores >= threshold) | (cand_scores + rest[i + 1] >= threshold * boost)
+                cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+
+    with metrics.timer("sort"):
+        keep = cand_scores > 0
+        cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+        order = np.lexsort((cand_docs, -cand_scores))[:top_k]
+        return [(index.doc_ids[cand_docs[i]], float(cand_scores[i])) for i in order]
+
+
+def search(query_vector: Dict[str, float], index: PostingsIndex, top_k: Optional[int] = None,
+           method: str = "maxscore", exact: bool = True) -> List[Tuple[str, float]]:
+    if top_k is None or method == "taat":
+        return search_taat(query_vector, index, top_k)
+    if method == "maxscore":
+        return search_maxscore(query_vector, index, top_k, exact)
+    raise ValueError(f"Неизвестный метод ранжирования: {method}")
@@ -1,18 +1,57 @@
+import argparse
 import os
-from collections import defaultdict
-from typing import List, Tuple, Dict, Any
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Callable, List, Tuple, Dict, Any, NamedTuple, Optional, Union
 
 import pymorphy3
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import coo_matrix, csr_matrix, csc_matrix
+
+import metrics
+import ranked_search
+from binary_index import BinaryIndex, is_stale, write_binary_index
+from bm25 import BM25Index
+from compact_index import CompactIndex, open_compact_index
+from count_tf_and_idf import TF_IDF_FILE, load_tf_idf, to_index
+from lemma_cache import LemmaCache, CACHE_FILE
+from sharded_index import ShardedIndex
+from term_dictionary import TermDictionary, fuzzy_distance, is_pattern
 
 OUTPUT_TF_IDF_RESULT_DIR = "output_lemmas"
+INDEX_FILE = "search_index.bin"
 EPSILON = 1e-6
 URL_FOR_PARSE = "https://organiclawn.ru/page"
+QUERY_LEMMA_CACHE_SIZE = 100_000
+# search_many: пачка от такого размера делится между процессами, меньшую быстрее посчитать на месте
+POOL_MIN_QUERIES = 5000
+POOL_CHUNK = 1000
 
 morph = pymorphy3.MorphAnalyzer()
 
 
+def analyze(word: str) -> str:
+    return morph.parse(word)[0].normal_form
+
+
+# Разборы словоформ запросов; начинаем с сохранённых при обработке корпуса
+query_lemma_cache = LemmaCache(analyze, QUERY_LEMMA_CACHE_SIZE, track_new=False)
+query_lemma_cache.load(CACHE_FILE)
+
+
+class SearchMatrix(NamedTuple):
+    """Разреженная матрица документов, строится один раз при старте"""
+    doc_ids: List[str]
+    lemma_to_col: Dict[str, int]
+    matrix: csr_matrix   # tf-idf документов, строки нормированы по L2
+    columns: csc_matrix  # та же матрица по столбцам — для выборки только лемм запроса
+    norms: np.ndarray    # исходные L2-нормы документов
+    idf: np.ndarray      # IDF леммы по номеру столбца
+    df: np.ndarray       # число документов с леммой по номеру столбца
+    dictionary: TermDictionary  # леммы столбцов — для шаблонов и исправления опечаток
+
+
 def load_index() -> Dict[str, Dict[str, Tuple[float, float]]]:
     index = {}
 
@@ -31,9 +70,102 @@ def load_index() -> Dict[str, Dict[str, Tuple[float, float]]]:
     return index
 
 
-def compute_query_vector(query: str, index: Dict[str, Dict[str, Tuple[float, float]]]) -> Dict[str, float]:
-    words = [word for word in query.split() if word.isalpha()]  # Фильтруем не-слова
-    lemmatized_query = [morph.parse(word)[0].normal_form for word in words]
+def build_index_file(index: Dict[str, Dict[str, Tuple[float, float]]], path: str = INDEX_FILE):
+    """Сохраняет индекс в бинарном формате с весами, уже нормированными по длине документа"""
+    postings = defaultdict(list)
+    weights = defaultdict(list)
+    idf = {}
+
+    for doc_num, doc_data in enumerate(index.values()):
+        norm = np.sqrt(sum(tfidf * tfidf for _, tfidf in doc_data.values()))
+        for lemma, (lemma_idf, tfidf) in doc_data.items():
+            idf.setdefault(lemma, lemma_idf)
+            postings[lemma].append(doc_num)
+            weights[lemma].append(tfidf / norm if norm else 0.0)
+
+    write_binary_index(path, list(index), postings, weights, idf)
+
+
+def open_index(path: str = INDEX_FILE, rebuild: bool = False) -> BinaryIndex:
+    """Открывает бинарный индекс; собирает его из TF_IDF_FILE (count_tf_and_idf.py),
+    а без него — из текстовых файлов OUTPUT_TF_IDF_RESULT_DIR, если индекса ещё нет,
+    он старше этих файлов или rebuild"""
+    source = TF_IDF_FILE if os.path.exists(TF_IDF_FILE) else OUTPUT_TF_IDF_RESULT_DIR
+    if rebuild or is_stale(path, [source]):
+        index = to_index(load_tf_idf()["lemmas"]) if source == TF_IDF_FILE else load_index()
+        build_index_file(index, path)
+    return BinaryIndex(path)
+
+
+def lemmatize_query(query: str) -> List[str]:
+    """Леммы слов запроса; шаблоны вида газо* остаются как есть, их раскрывает resolve_lemmas"""
+    lemmas = []
+    for word in query.lower().split():
+        if is_pattern(word) and word.strip("*?").isalpha():
+            lemmas.append(word)
+        elif word.isalpha():  # Фильтруем не-слова
+            # Регистр на лемму не влияет, а кэш по словам в нижнем регистре общий с lemmas.py
+            lemmas.append(query_lemma_cache.lemmatize(word))
+    return lemmas
+
+
+def _terms(index, matrix: Optional[SearchMatrix]) -> Tuple[Callable[[], TermDictionary], Callable[[str], int]]:
+    """Словарь лемм (получается только по требованию) и df — для шаблонов и исправления опечаток"""
+    if isinstance(index, dict):
+        return (lambda: matrix.dictionary), (lambda lemma: int(matrix.df[matrix.lemma_to_col[lemma]])
+                                             if lemma in matrix.lemma_to_col else 0)
+    return (lambda: index.dictionary), index.df
+
+
+def resolve_lemmas(lemmas: List[str], dictionary: Callable[[], TermDictionary],
+                   corrections: Optional[Dict[str, str]] = None) -> List[str]:
+    """Шаблоны раскрываются в подходящие леммы словаря, остальные леммы остаются как есть
+    (или заменяются по corrections). Словарь запрашивается, только если в запросе есть шаблон:
+    у бинарного индекса он строится при первом обращении"""
+    resolved = []
+    for lemma in lemmas:
+        if is_pattern(lemma):
+            resolved.extend(dictionary().wildcard(lemma))
+        else:
+            resolved.append(corrections.get(lemma, lemma) if corrections else lemma)
+    return resolved
+
+
+def correct_lemmas(lemmas: List[str], dictionary: Callable[[], TermDictionary],
+                   df: Callable[[str], int]) -> Dict[str, str]:
+    """Замены для неизвестных индексу лемм: ближайшая известная (при равном расстоянии — более частая)"""
+    corrections = {}
+    for lemma in lemmas:
+        if is_pattern(lemma) or lemma in corrections or df(lemma):
+            continue
+        candidates = dictionary().fuzzy(lemma, fuzzy_distance(lemma))
+        if candidates:
+            closest = candidates[0][1]
+            corrections[lemma] = max((term for term, distance in candidates if distance == closest), key=df)
+    return corrections
+
+
+def correct_query(query: str, index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex, BM25Index, ShardedIndex],
+                  matrix: Optional[SearchMatrix] = None) -> Dict[str, str]:
+    """Исправления опечаток в запросе: лемма -> замена (пусто, если все леммы известны индексу)"""
+    if isinstance(index, dict) and matrix is None:
+        matrix = search_matrix(index)
+    return correct_lemmas(lemmatize_query(query), *_terms(index, matrix))
+
+
+def query_key(query: str) -> str:
+    """Нормализованный запрос: у запросов с одинаковым ключом одинаковый вектор, а значит и выдача"""
+    return " ".join(sorted(lemmatize_query(query)))
+
+
+def compute_query_vector(query: str, index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex],
+                         matrix: Optional[SearchMatrix] = None,
+                         corrections: Optional[Dict[str, str]] = None) -> Dict[str, float]:
+    """corrections — замены лемм из correct_query; без них неизвестные леммы остаются как есть"""
+    if isinstance(index, dict) and matrix is None:
+        matrix = search_matrix(index)
+
+    lemmatized_query = resolve_lemmas(lemmatize_query(query), _terms(index, matrix)[0], corrections)
     query_tf = defaultdict(int)
 
     for lemma in lemmatized_query:
@@ -43,50 +175,291 @@ def compute_query_vector(query: str, index: Dict[str, Dict[str, Tuple[float, flo
     query_vector = {}
 
     for lemma, tf in query_tf.items():
-        idf = next((index[doc][lemma][0] for doc in index if lemma in index[doc]), EPSILON)
+        if isinstance(index, dict):
+            # Таблица IDF строится вместе с матрицей, без прохода по документам на каждый запрос
+            col = matrix.lemma_to_col.get(lemma)
+            idf = EPSILON if col is None else float(matrix.idf[col])
+        else:
+            idf = index.idf(lemma)
+            if idf is None:
+                idf = EPSILON
         query_vector[lemma] = (tf / max_tf) * idf
 
     return query_vector
 
 
-def search(query: str, index: Dict[str, Dict[str, Tuple[float, float]]]) -> List[Tuple[str, float]]:
-    if not query or not index:
+def build_search_matrix(index: Dict[str, Dict[str, Tuple[float, float]]]) -> SearchMatrix:
+    lemma_to_col = {lemma: col for col, lemma in enumerate(sorted({lemma for doc in index.values() for lemma in doc}))}
+
+    doc_ids = []
+    indptr = [0]
+    indices = []
+    data = []
+    idf = np.zeros(len(lemma_to_col))
+    df = np.zeros(len(lemma_to_col), dtype=np.int64)
+
+    # Порядок строк совпадает с порядком документов в индексе — от него зависит порядок при равных оценках
+    for doc_id, doc_data in index.items():
+        doc_ids.append(doc_id)
+        for lemma, (lemma_idf, tfidf) in doc_data.items():
+            col = lemma_to_col[lemma]
+            if not df[col]:
+                idf[col] = lemma_idf
+            df[col] += 1
+            if tfidf:
+                indices.append(col)
+                data.append(tfidf)
+        indptr.append(len(indices))
+
+    matrix = csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(doc_ids), len(lemma_to_col)),
+    )
+    matrix.sort_indices()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    matrix = csr_matrix(matrix.multiply(scale.reshape(-1, 1)))
+
+    return SearchMatrix(doc_ids, lemma_to_col, matrix, matrix.tocsc(), norms, idf, df, TermDictionary(lemma_to_col))
+
+
+# Матрица последнего индекса-словаря без matrix=: (индекс, матрица). Сам индекс хранится,
+# чтобы его id не достался другому объекту; словарь не поддерживает слабые ссылки
+_last_matrix = None
+
+
+def search_matrix(index: Dict[str, Dict[str, Tuple[float, float]]]) -> SearchMatrix:
+    """Матрица для index, построенная один раз на объект индекса.
+    Индекс считается неизменным: после правок матрицу нужно построить заново через build_search_matrix"""
+    global _last_matrix
+    cached = _last_matrix
+    if cached is None or cached[0] is not index:
+        cached = _last_matrix = (index, build_search_matrix(index))
+    return cached[1]
+
+
+def _top_k(scores: np.ndarray, top_k: Optional[int]) -> np.ndarray:
+    candidates = np.flatnonzero(scores > 0)
+
+    if top_k is not None and top_k < len(candidates):
+        if top_k <= 0:
+            return candidates[:0]
+        candidate_scores = scores[candidates]
+        # k-я по величине оценка; всё, что не меньше неё, сортируем полностью,
+        # чтобы равные оценки на границе шли в том же порядке, что и при полной сортировке
+        kth = candidate_scores[np.argpartition(-candidate_scores, top_k - 1)[top_k - 1]]
+        candidates = candidates[candidate_scores >= kth]
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:top_k]
+
+
+def search(query: str, index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex, BM25Index, ShardedIndex],
+           top_k: Optional[int] = None, matrix: Optional[SearchMatrix] = None,
+           corrections: Optional[Dict[str, str]] = None) -> List[Tuple[str, float]]:
+    """corrections — замены лемм из correct_query; сам search опечатки не исправляет (см. search_corrected)"""
+    if not query or not len(index):
         return []
+    metrics.count("queries")
 
-    query_vector = compute_query_vector(query, index)
+    # BM25: оценки уже посчитаны при построении индекса, нужны только леммы запроса
+    if isinstance(index, BM25Index):
+        with metrics.timer("query_parse"):
+            lemmas = resolve_lemmas(lemmatize_query(query), _terms(index, None)[0], corrections)
+        return index.search(lemmas, top_k)
+
+    if isinstance(index, dict) and matrix is None:
+        matrix = search_matrix(index)
+
+    with metrics.timer("query_parse"):
+        query_vector = compute_query_vector(query, index, matrix, corrections)
     if not query_vector:
         return []
 
-    all_lemmas = set(query_vector.keys())
-    for doc in index.values():
-        all_lemmas.update(doc.keys())
-    all_lemmas = sorted(all_lemmas)
+    # Вектор запроса считается по глобальным IDF, шарды только ранжируют свои документы
+    if isinstance(index, ShardedIndex):
+        return index.search(query_vector, top_k)
 
-    query_array = np.array([query_vector.get(lemma, 0) for lemma in all_lemmas]).reshape(1, -1)
+    # Бинарный индекс читается с диска по мере надобности — по нему идём постингами, без матрицы
+    if not isinstance(index, dict):
+        return ranked_search.search(query_vector, index, top_k)
 
-    doc_arrays = []
-    doc_ids = []
+    return rank(query_vector, matrix, top_k)
 
-    for doc_id, doc_data in index.items():
-        doc_vector = {lemma: tfidf for lemma, (_, tfidf) in doc_data.items()}
-        doc_array = np.array([doc_vector.get(lemma, 0) for lemma in all_lemmas])
-        doc_arrays.append(doc_array)
-        doc_ids.append(doc_id)
 
-    if not doc_arrays:
+def rank(query_vector: Dict[str, float], matrix: SearchMatrix, top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+    # Норма запроса учитывает и неизвестные индексу леммы (их вес EPSILON), как и раньше
+    query_norm = np.sqrt(sum(weight * weight for weight in query_vector.values()))
+    cols = [matrix.lemma_to_col[lemma] for lemma in query_vector if lemma in matrix.lemma_to_col]
+    if not query_norm or not cols:
         return []
 
-    doc_matrix = np.vstack(doc_arrays)
+    weights = np.array([query_vector[lemma] for lemma in query_vector if lemma in matrix.lemma_to_col]) / query_norm
+    with metrics.timer("scoring"):
+        scores = matrix.columns[:, cols] @ weights
+
+    with metrics.timer("sort"):
+        return [(matrix.doc_ids[i], float(scores[i])) for i in _top_k(scores, top_k)]
+
+
+def search_corrected(query: str,
+                     index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex, BM25Index, ShardedIndex],
+                     top_k: Optional[int] = None,
+                     matrix: Optional[SearchMatrix] = None) -> Tuple[List[Tuple[str, float]], Dict[str, str]]:
+    """Выдача и исправления, по которым она получена. Опечатки исправляются, только если
+    по запросу как есть ничего не нашлось: ранжирование найденного исправления не меняют"""
+    results = search(query, index, top_k, matrix)
+    if results or not query or not len(index):
+        return results, {}
+    corrections = correct_query(query, index, matrix)
+    return (search(query, index, top_k, matrix, corrections) if corrections else []), corrections
+
 
-    similarities = cosine_similarity(query_array, doc_matrix)[0]
+def _doc_columns(index: Union[BinaryIndex, BM25Index], lemmas: List[str]) -> csr_matrix:
+    """Столбцы лемм запросов в матрице документов (документы × леммы), собранные из постингов"""
+    rows, cols, data = [], [], []
+    for col, lemma in enumerate(lemmas):
+        docs, weights = index.postings(lemma)
+        rows.append(docs)
+        cols.append(np.full(len(docs), col, dtype=np.int32))
+        data.append(weights.astype(np.float64))
+    # Строк столько, сколько номеров документов: у IndexReader len() считает только живые,
+    # а номера идут по всем doc_ids, включая удалённые
+    return coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(len(index.doc_ids), len(lemmas))).tocsr()
 
-    results = sorted(zip(doc_ids, similarities), key=lambda x: x[1], reverse=True)
 
-    return [(doc_id, score) for doc_id, score in results if score > 0]
+def _top_k_row(docs: np.ndarray, scores: np.ndarray, top_k: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """То же, что _top_k, по ненулевым оценкам одной строки произведения матриц"""
+    keep = scores > 0
+    docs, scores = docs[keep], scores[keep]
+    if top_k is not None and top_k < len(docs):
+        if top_k <= 0:
+            return docs[:0], scores[:0]
+        kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+        keep = scores >= kth
+        docs, scores = docs[keep], scores[keep]
+    order = np.lexsort((docs, -scores))[:top_k]
+    return docs[order], scores[order]
+
+
+def _search_batch(queries: List[str], index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex, BM25Index],
+                  top_k: Optional[int], matrix: Optional[SearchMatrix]) -> List[List[Tuple[str, float]]]:
+    """Выдачи для различных запросов: все оценки — одно произведение
+    (запросы × леммы) @ (леммы × документы) разреженных матриц"""
+    if isinstance(index, dict) and matrix is None:
+        matrix = search_matrix(index)
+
+    # Запросы с одинаковым набором лемм (разные словоформы, порядок слов) дают одинаковый вектор
+    with metrics.timer("query_parse"):
+        keys = [query_key(query) for query in queries]
+        vectors = {}
+        for query, key in zip(queries, keys):
+            if key in vectors:
+                continue
+            if isinstance(index, BM25Index):
+                # BM25: вес леммы — сколько раз она повторена в запросе, как в BM25Index.search
+                vectors[key] = dict(Counter(resolve_lemmas(lemmatize_query(query), _terms(index, None)[0])))
+            else:
+                vector = compute_query_vector(query, index, matrix)
+                # Как и в rank, норма учитывает неизвестные индексу леммы
+                norm = np.sqrt(sum(weight * weight for weight in vector.values()))
+                vectors[key] = {lemma: weight / norm for lemma, weight in vector.items() if weight > 0} if norm else {}
+
+        if isinstance(index, dict):
+            known = matrix.lemma_to_col.__contains__
+        else:
+            known = lambda lemma: index.df(lemma) > 0
+        lemmas = sorted({lemma for vector in vectors.values() for lemma in vector if known(lemma)})
+        lemma_col = {lemma: col for col, lemma in enumerate(lemmas)}
+        rows, cols, data = [], [], []
+        for row, vector in enumerate(vectors.values()):
+            for lemma, weight in vector.items():
+                if lemma in lemma_col:
+                    rows.append(row)
+                    cols.append(lemma_col[lemma])
+                    data.append(weight)
+        query_matrix = csr_matrix((np.array(data, dtype=np.float64), (rows, cols)), shape=(len(vectors), len(lemmas)))
+
+    doc_ids = matrix.doc_ids if isinstance(index, dict) else index.doc_ids
+    with metrics.timer("scoring"):
+        if not lemmas:
+            scores = csr_matrix((len(vectors), len(doc_ids)))
+        elif isinstance(index, dict):
+            scores = query_matrix @ matrix.columns[:, [matrix.lemma_to_col[lemma] for lemma in lemmas]].T
+        else:
+            scores = query_matrix @ _doc_columns(index, lemmas).T
+        scores = csr_matrix(scores)
+
+    scale = index.scale if isinstance(index, BM25Index) else 1.0
+    results = {}
+    with metrics.timer("sort"):
+        for row, key in enumerate(vectors):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            docs, row_scores = _top_k_row(scores.indices[start:end], scores.data[start:end], top_k)
+            results[key] = [(doc_ids[doc], float(score) * scale) for doc, score in zip(docs, row_scores)]
+    return [results[key] for key in keys]
+
+
+# Индексы, открытые в процессе пула search_many: (тип, путь) -> индекс
+_opened = {}
+
+
+def _search_chunk(kind: str, path: str, queries: List[str], top_k: Optional[int]) -> List[List[Tuple[str, float]]]:
+    index = _opened.get((kind, path))
+    if index is None:
+        index = _opened[kind, path] = BM25Index(path) if kind == "bm25" else BinaryIndex(path)
+    return _search_batch(queries, index, top_k, None)
+
+
+def search_many(queries: List[str],
+                index: Union[Dict[str, Dict[str, Tuple[float, float]]], BinaryIndex, BM25Index, ShardedIndex],
+                top_k: Optional[int] = None, matrix: Optional[SearchMatrix] = None,
+                processes: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+    """Выдачи для пачки запросов в порядке queries — те же, что у search по одному
+    (оценки tf-idf могут отличаться в последнем знаке: слагаемые складываются в другом порядке).
+
+    Повторы запросов и запросы с одинаковым набором лемм считаются один раз. Большая пачка
+    по индексу на диске делится между processes процессами (по умолчанию — по числу ядер),
+    каждый открывает индекс сам; ShardedIndex и так распределяет работу, по нему — цикл по search.
+    """
+    texts = list(dict.fromkeys(query for query in queries if query))
+    if not texts or not len(index):
+        return [[] for _ in queries]
+
+    if isinstance(index, ShardedIndex):
+        results = [search(query, index, top_k) for query in texts]
+    elif (isinstance(index, (BinaryIndex, BM25Index)) and len(texts) >= POOL_MIN_QUERIES
+          and (processes or os.cpu_count() or 1) > 1):
+        kind, path = ("bm25", index.index.path) if isinstance(index, BM25Index) else ("tfidf", index.path)
+        chunks = [texts[i:i + POOL_CHUNK] for i in range(0, len(texts), POOL_CHUNK)]
+        with ProcessPoolExecutor(processes) as pool:
+            results = [result for chunk in pool.map(_search_chunk, repeat(kind), repeat(path), chunks, repeat(top_k))
+                       for result in chunk]
+    else:
+        results = _search_batch(texts, index, top_k, matrix)
+    if not isinstance(index, ShardedIndex):
+        metrics.count("queries", len(queries))
+
+    by_query = dict(zip(texts, results))
+    return [list(by_query[query]) if query else [] for query in queries]
 
 
 if __name__ == "__main__":
-    index = load_index()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bm25", action="store_true", help="ранжировать по BM25 (индекс строит pipeline.py или bm25.py)")
+    parser.add_argument("--shards", metavar="DIR", help="искать по шардам из sharded_index.py")
+    parser.add_argument("--compact", action="store_true", help="держать индекс в памяти в компактном виде (compact_index.py)")
+    parser.add_argument("--rebuild", action="store_true", help=f"построить {INDEX_FILE} заново")
+    args = parser.parse_args()
+
+    if args.shards:
+        index = ShardedIndex(args.shards)
+    elif args.compact:
+        index = open_compact_index() if os.path.exists(TF_IDF_FILE) else CompactIndex.from_index(load_index())
+    else:
+        index = BM25Index() if args.bm25 else open_index(rebuild=args.rebuild)
     print(f"Загружено {len(index)} документов в индекс")
 
     while True:
@@ -94,7 +467,9 @@ if __name__ == "__main__":
         if query.lower() == "stop":
             break
 
-        results = search(query, index)
+        results, corrections = search_corrected(query, index)
+        if corrections:
+            print("Ничего не найдено, исправлено: " + ", ".join(f"{lemma} -> {fixed}" for lemma, fixed in corrections.items()))
 
         if not results:
             print("Релевантных документов не найдено")
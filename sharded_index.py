@@ -0,0 +1,209 @@
+"""Индекс, разбитый на шарды, и координатор запросов scatter-gather.
+
+Статьи делятся на N шардов подряд идущими диапазонами номеров. Построение идёт в два прохода:
+каждый шард считает свою статистику (df лемм), статистики складываются в глобальные IDF,
+и каждый шард записывает обычный binary_index с весами tf-idf по глобальным IDF. Поэтому
+оценка статьи в шарде та же, что в едином индексе, а топ-k корпуса — слияние топ-k шардов.
+
+Координатор рассылает запрос шардам в пул процессов; процесс открывает шард через mmap
+при первом обращении и дальше держит его открытым.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice, repeat
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+import ranked_search
+from binary_index import BinaryIndex, write_binary_index
+from index_writer import TOKENS_DIR, read_lemma_counts, tokens_doc_ids
+from inverted_search import BooleanSearchEngine
+from term_dictionary import TermDictionary
+
+SHARDS_DIR = "shards"
+MANIFEST_FILE = "shards.json"
+N_SHARDS = 4
+
+
+def _shard_stats(doc_ids: Sequence[int], tokens_dir: str) -> Counter:
+    df = Counter()
+    for doc_id in doc_ids:
+        df.update(read_lemma_counts(doc_id, tokens_dir).keys())
+    return df
+
+
+def _write_shard(path: str, doc_ids: Sequence[int], tokens_dir: str, df: Dict[str, int], n_docs: int):
+    postings = defaultdict(list)
+    weights = defaultdict(list)
+    for doc_num, doc_id in enumerate(doc_ids):
+        counts = read_lemma_counts(doc_id, tokens_dir)
+        total = sum(counts.values())
+        # tf-idf как в count_tf_and_idf.py, но с IDF по всему корпусу, а не по шарду
+        tf_idf = {lemma: count / total * math.log(n_docs / df[lemma]) for lemma, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in tf_idf.values()))
+        for lemma, weight in tf_idf.items():
+            postings[lemma].append(doc_num)
+            weights[lemma].append(weight / norm if norm else 0.0)
+
+    idf = {lemma: math.log(n_docs / df[lemma]) for lemma in postings}
+    write_binary_index(path, [str(doc_id) for doc_id in doc_ids], postings, weights, idf)
+
+
+def build_shards(directory: str = SHARDS_DIR, n_shards: int = N_SHARDS, tokens_dir: str = TOKENS_DIR,
+                 processes: Optional[int] = None):
+    """Строит шарды из lemmas_tokens/lemmas_N.txt; шарды считаются параллельно,
+    с processes=0 — по очереди в этом процессе, как и поиск у ShardedIndex"""
+    doc_ids = tokens_doc_ids(tokens_dir)
+    parts = [[int(doc_id) for doc_id in part] for part in np.array_split(doc_ids, n_shards) if len(part)]
+    names = [f"shard_{i:03d}.bin" for i in range(len(parts))]
+    paths = [os.path.join(directory, name) for name in names]
+    os.makedirs(directory, exist_ok=True)
+
+    pool = None if processes == 0 else ProcessPoolExecutor(processes)
+    try:
+        run = map if pool is None else pool.map
+        df = Counter()
+        for shard_df in run(_shard_stats, parts, repeat(tokens_dir)):
+            df.update(shard_df)
+        list(run(_write_shard, paths, parts, repeat(tokens_dir), repeat(dict(df)), repeat(len(doc_ids))))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    manifest = {"n_docs": len(doc_ids), "shards": [{"name": name, "docs": len(part)} for name, part in zip(names, parts)]}
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+# Шарды, открытые в процессе-исполнителе: путь -> (индекс, булев движок над ним)
+_opened = {}
+
+
+def _open_shard(path: str) -> Tuple[BinaryIndex, BooleanSearchEngine]:
+    shard = _opened.get(path)
+    if shard is None:
+        index = BinaryIndex(path)
+        shard = _opened[path] = (index, BooleanSearchEngine.from_index(index))
+    return shard
+
+
+def _search_shard(path: str, query_vector: Dict[str, float], top_k: Optional[int]) -> List[Tuple[str, float]]:
+    index, _ = _open_shard(path)
+    return ranked_search.search(query_vector, index, top_k)
+
+
+def _boolean_shard(path: str, query: str) -> List[str]:
+    _, engine = _open_shard(path)
+    return [engine.documents[i] for i in engine.evaluate(query).to_indices()]
+
+
+class ShardedIndex:
+    """Координатор поиска по шардам.
+
+    Глобальные idf, df и dictionary берутся из шардов, открытых в этом процессе, поэтому
+    search.compute_query_vector и search.search работают с ним так же, как с BinaryIndex.
+    processes=0 — шарды опрашиваются по очереди в этом же процессе (для отладки).
+    """
+
+    def __init__(self, directory: str = SHARDS_DIR, processes: Optional[int] = None):
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.n_docs = manifest["n_docs"]
+        self.paths = [os.path.join(directory, shard["name"]) for shard in manifest["shards"]]
+        self._shards = [BinaryIndex(path) for path in self.paths]
+        self._dictionary = None
+        self._pool = None if processes == 0 else ProcessPoolExecutor(processes or len(self.paths))
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def __enter__(self) -> "ShardedIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def idf(self, lemma: str) -> Optional[float]:
+        # IDF глобальный, поэтому в любом шарде с леммой он один и тот же
+        for shard in self._shards:
+            idf = shard.idf(lemma)
+            if idf is not None:
+                return idf
+        return None
+
+    def df(self, lemma: str) -> int:
+        return sum(shard.df(lemma) for shard in self._shards)
+
+    @property
+    def dictionary(self) -> TermDictionary:
+        if self._dictionary is None:
+            self._dictionary = TermDictionary(term for term, _ in groupby(heapq.merge(*(shard.terms for shard in self._shards))))
+        return self._dictionary
+
+    def _scatter(self, function, *args) -> list:
+        if self._pool is None:
+            return [function(path, *args) for path in self.paths]
+        futures = [self._pool.submit(function, path, *args) for path in self.paths]
+        return [future.result() for future in futures]
+
+    def search(self, query_vector: Dict[str, float], top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Топ-k по вектору запроса (см. search.compute_query_vector)"""
+        with metrics.timer("shard_scatter"):
+            results = self._scatter(_search_shard, query_vector, top_k)
+        # Выдача шарда уже отсортирована; при равной оценке выше шард с меньшими номерами статей,
+        # как и в едином индексе
+        with metrics.timer("sort"):
+            merged = heapq.merge(*([(-score, shard, rank, doc_id) for rank, (doc_id, score) in enumerate(shard_results)]
+                                   for shard, shard_results in enumerate(results)))
+            return [(doc_id, -score) for score, _, _, doc_id in islice(merged, top_k)]
+
+    def boolean_search(self, query: str) -> List[str]:
+        """Статьи, подходящие под булев запрос (синтаксис boolean_query), по возрастанию номера"""
+        return [doc_id for docs in self._scatter(_boolean_shard, query) for doc_id in docs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--build", action="store_true", help=f"построить шарды из {TOKENS_DIR}/")
+    parser.add_argument("--shards", type=int, default=N_SHARDS)
+    parser.add_argument("--directory", default=SHARDS_DIR)
+    parser.add_argument("--processes", type=int, help="размер пула процессов; 0 — без пула")
+    parser.add_argument("--boolean", action="store_true", help="булевы запросы вместо ранжированных")
+    args = parser.parse_args()
+
+    if args.build or not os.path.exists(os.path.join(args.directory, MANIFEST_FILE)):
+        build_shards(args.directory, args.shards, processes=args.processes)
+
+    import search
+
+    with ShardedIndex(args.directory, args.processes) as index:
+        print(f"Документов: {len(index)}, шардов: {len(index.paths)}")
+        while True:
+            query = input("\nВведите поисковый запрос (для выхода напишите stop): ").strip()
+            if query.lower() == "stop":
+                break
+            if args.boolean:
+                try:
+                    results = index.boolean_search(query)
+                except ValueError as e:
+                    print(e)
+                    continue
+                print(f"Найдено документов: {len(results)}")
+                print(", ".join(results))
+            else:
+                for doc_id, score in search.search(query, index, 10):
+                    print(f"{search.URL_FOR_PARSE}/{doc_id} - {score:.4f}")
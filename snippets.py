@@ -0,0 +1,102 @@
+"""Сниппеты для страницы выдачи: окно текста статьи с лучшим покрытием слов запроса.
+
+Слова текста не лемматизируются: для каждой леммы запроса pymorphy один раз строит все её
+словоформы, и слово текста подсвечивается, если оно среди них. Окно выбирается по
+попаданиям: сумма весов разных лемм запроса в окне плюс небольшая добавка за повторы.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+from search import morph
+
+# Те же слова, что в lemmas.tokenize, по тексту в нижнем регистре; split с группой
+# за один вызов даёт и слова, и разделители между ними
+WORD_SPLIT_RE = re.compile(r'\b([а-яё]+)\b')
+
+SNIPPET_WORDS = 30
+# За каждое повторное вхождение леммы в окне — доля её веса
+REPEAT_BONUS = 0.1
+# Сколько символов начала статьи просматривается: длинная статья не должна тормозить выдачу
+SCAN_CHARS = 50_000
+FORMS_CACHE_SIZE = 10_000
+
+Snippet = List[Tuple[str, bool]]  # куски текста и признак «подсветить»
+
+
+def _normalize(word: str) -> str:
+    return word.lower().replace("ё", "е")
+
+
+@lru_cache(maxsize=FORMS_CACHE_SIZE)
+def word_forms(lemma: str) -> FrozenSet[str]:
+    """Все словоформы леммы по всем её разборам, в нижнем регистре и с «е» вместо «ё»"""
+    forms = {lemma}
+    for parse in morph.parse(lemma):
+        if parse.normal_form == lemma:
+            forms.update(form.word for form in parse.lexeme)
+    return frozenset(_normalize(form) for form in forms)
+
+
+def _best_window(hits: List[Tuple[int, str]], weights: Dict[str, float], size: int) -> Tuple[int, int]:
+    """Позиции первого и последнего попадания лучшего окна; при равенстве — более раннего"""
+    best = (-1.0, 0, 0)
+    counts: Dict[str, int] = {}
+    score = 0.0
+    end = 0
+    for position, lemma in hits:
+        while end < len(hits) and hits[end][0] < position + size:
+            added = hits[end][1]
+            counts[added] = counts.get(added, 0) + 1
+            score += weights[added] * (1.0 if counts[added] == 1 else REPEAT_BONUS)
+            end += 1
+        if score > best[0]:
+            best = (score, position, hits[end - 1][0])
+        counts[lemma] -= 1
+        score -= weights[lemma] * (1.0 if not counts[lemma] else REPEAT_BONUS)
+    return best[1], best[2]
+
+
+def make_snippet(text: str, weights: Dict[str, float], size: int = SNIPPET_WORDS) -> Snippet:
+    """weights — леммы запроса с весами (вектор запроса из search.compute_query_vector).
+    Без попаданий сниппет — начало статьи"""
+    forms = {}
+    for lemma in weights:
+        for form in word_forms(lemma):
+            forms.setdefault(form, lemma)
+
+    scanned = text[:SCAN_CHARS]
+    normalized = _normalize(scanned)
+    if len(normalized) != len(scanned):
+        # Редкие символы, у которых нижний регистр длиннее, оставляем как есть, чтобы сдвиги совпадали
+        normalized = "".join(char if len(_normalize(char)) != 1 else _normalize(char) for char in scanned)
+    parts = WORD_SPLIT_RE.split(normalized)  # разделитель, слово, разделитель, ..., разделитель
+    words = parts[1::2]
+    if not words:
+        return []
+    hits = [(i, forms[word]) for i, word in enumerate(words) if word in forms]
+
+    if hits:
+        first, last = _best_window(hits, weights, size)
+        start = max(0, first - (size - (last - first + 1)) // 2)
+    else:
+        start = 0
+    end = min(len(words), start + size)
+    start = max(0, end - size)
+
+    snippet = [("… ", False)] if start else []
+    position = sum(map(len, parts[:2 * start + 1]))
+    plain = position
+    for i in range(start, end):
+        if i > start:
+            position += len(parts[2 * i])
+        if words[i] in forms:
+            snippet.append((text[plain:position], False))
+            snippet.append((text[position:position + len(words[i])], True))
+            plain = position + len(words[i])
+        position += len(words[i])
+    snippet.append((text[plain:position], False))
+    if end < len(words) or len(text) > SCAN_CHARS:
+        snippet.append((" …", False))
+    return [(part, hit) for part, hit in snippet if part]
+
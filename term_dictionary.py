@@ -0,0 +1,256 @@
+"""Словарь терминов с префиксным сжатием (front coding) и поиском по шаблону и с опечатками.
+
+Термины отсортированы и разбиты на блоки по BLOCK_SIZE: первый термин блока хранится целиком,
+остальные — длиной общего с предыдущим префикса и остатком. По первым терминам блоков
+идёт двоичный поиск, так что префикс находится за O(log n) с разбором одного блока.
+
+Нечёткий поиск обходит словарь по порядку, как бор: строки матрицы Левенштейна для общего
+с предыдущим термином префикса переиспользуются, а если все значения строки больше допустимого
+расстояния, весь диапазон терминов с этим префиксом пропускается.
+"""
+import re
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+BLOCK_SIZE = 16
+MAX_EXPANSIONS = 50  # Сколько терминов максимум даёт один шаблон или нечёткий поиск
+EXPANSION_CACHE_SIZE = 1024
+WILDCARD_CHARS = "*?"
+# Верхняя граница для префиксного диапазона: больше любого символа в терминах
+_MAX_CHAR = "\U0010ffff"
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def is_pattern(word: str) -> bool:
+    return any(char in word for char in WILDCARD_CHARS)
+
+
+def fuzzy_distance(word: str) -> int:
+    """Допустимое число опечаток: в коротких словах исправление чаще даёт другое слово"""
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+class TermDictionary:
+    """Неизменяемый отсортированный словарь терминов"""
+
+    def __init__(self, terms: Iterable[str]):
+        self._data = bytearray()
+        self._block_offsets = []
+        self._heads = []  # первые термины блоков
+        self._count = 0
+        previous = b""
+        for term in terms:
+            encoded = term.encode("utf-8")
+            if self._count % BLOCK_SIZE == 0:
+                self._block_offsets.append(len(self._data))
+                self._heads.append(term)
+                _encode_varint(len(encoded), self._data)
+                self._data += encoded
+            else:
+                shared = 0
+                limit = min(len(previous), len(encoded))
+                while shared < limit and previous[shared] == encoded[shared]:
+                    shared += 1
+                _encode_varint(shared, self._data)
+                _encode_varint(len(encoded) - shared, self._data)
+                self._data += encoded[shared:]
+            previous = encoded
+            self._count += 1
+        self._data = bytes(self._data)
+        self._cache = OrderedDict()
+        # Словарь делят потоки веб-сервера, а LRU меняется и при чтении
+        self._cache_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Память словаря: сжатые термины, смещения и первые термины блоков"""
+        return (sys.getsizeof(self._data) + sys.getsizeof(self._block_offsets) + sys.getsizeof(self._heads)
+                + sum(map(sys.getsizeof, self._block_offsets)) + sum(map(sys.getsizeof, self._heads)))
+
+    def _block(self, block: int) -> List[str]:
+        data = self._data
+        pos = self._block_offsets[block]
+        length, pos = _decode_varint(data, pos)
+        previous = data[pos:pos + length]
+        pos += length
+        terms = [previous]
+        for _ in range(min(BLOCK_SIZE, self._count - block * BLOCK_SIZE) - 1):
+            shared, pos = _decode_varint(data, pos)
+            length, pos = _decode_varint(data, pos)
+            previous = previous[:shared] + data[pos:pos + length]
+            pos += length
+            terms.append(previous)
+        return [term.decode("utf-8") for term in terms]
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._block(i // BLOCK_SIZE)[i % BLOCK_SIZE]
+
+    def iter_from(self, start: int) -> Iterator[str]:
+        block = start // BLOCK_SIZE
+        terms = self._block(block) if start < self._count else []
+        offset = start % BLOCK_SIZE
+        while terms:
+            yield from terms[offset:]
+            block += 1
+            offset = 0
+            terms = self._block(block) if block * BLOCK_SIZE < self._count else []
+
+    def _bisect(self, term: str) -> int:
+        """Номер первого термина не меньше term"""
+        block = bisect_right(self._heads, term) - 1
+        if block < 0:
+            return 0
+        return block * BLOCK_SIZE + bisect_left(self._block(block), term)
+
+    def __contains__(self, term: str) -> bool:
+        return self.term_id(term) is not None
+
+    def term_id(self, term: str) -> Optional[int]:
+        """Номер термина по порядку словаря или None; разбирается один блок"""
+        block = bisect_right(self._heads, term) - 1
+        if block < 0:
+            return None
+        terms = self._block(block)
+        i = bisect_left(terms, term)
+        if i < len(terms) and terms[i] == term:
+            return block * BLOCK_SIZE + i
+        return None
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Номера [начало, конец) терминов, начинающихся с prefix"""
+        return self._bisect(prefix), self._bisect(prefix + _MAX_CHAR)
+
+    def _cached(self, key, compute):
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                return result
+        result = tuple(compute())
+        with self._cache_lock:
+            self._cache[key] = result
+            if len(self._cache) > EXPANSION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def prefix(self, prefix: str, limit: int = MAX_EXPANSIONS) -> Tuple[str, ...]:
+        return self._cached(("prefix", prefix, limit), lambda: self._prefix(prefix, limit))
+
+    def _prefix(self, prefix: str, limit: int) -> List[str]:
+        start, end = self.prefix_range(prefix)
+        return [term for term, _ in zip(self.iter_from(start), range(min(limit, end - start)))]
+
+    def wildcard(self, pattern: str, limit: int = MAX_EXPANSIONS) -> Tuple[str, ...]:
+        """Термины по шаблону: * — любая подстрока, ? — один символ"""
+        return self._cached(("wildcard", pattern, limit), lambda: self._wildcard(pattern, limit))
+
+    def _wildcard(self, pattern: str, limit: int) -> List[str]:
+        literal = len(pattern)
+        for char in WILDCARD_CHARS:
+            if char in pattern:
+                literal = min(literal, pattern.index(char))
+        regex = re.compile("".join(".*" if char == "*" else "." if char == "?" else re.escape(char) for char in pattern))
+
+        # Перебираются только термины с буквальным началом шаблона; шаблон вида *слово просматривает весь словарь
+        start, end = self.prefix_range(pattern[:literal])
+        matches = []
+        for _, term in zip(range(end - start), self.iter_from(start)):
+            if regex.fullmatch(term):
+                matches.append(term)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def fuzzy(self, word: str, max_distance: int, limit: int = MAX_EXPANSIONS) -> Tuple[Tuple[str, int], ...]:
+        """Термины на расстоянии Левенштейна не больше max_distance: (термин, расстояние) от ближних к дальним"""
+        return self._cached(("fuzzy", word, max_distance, limit), lambda: self._fuzzy(word, max_distance, limit))
+
+    def _fuzzy(self, word: str, max_distance: int, limit: int) -> List[Tuple[str, int]]:
+        found = []
+        rows = [list(range(len(word) + 1))]  # rows[d] — строка матрицы после d символов термина
+        previous = ""
+        block = 0
+        terms = self._block(0) if self._count else []
+        offset = 0
+        while True:
+            if offset == len(terms):
+                block += 1
+                if block * BLOCK_SIZE >= self._count:
+                    break
+                terms = self._block(block)
+                offset = 0
+            term = terms[offset]
+
+            shared = 0
+            limit_shared = min(len(previous), len(term), len(rows) - 1)
+            while shared < limit_shared and previous[shared] == term[shared]:
+                shared += 1
+            del rows[shared + 1:]
+
+            dead = False
+            for char in term[shared:]:
+                above = rows[-1]
+                row = [above[0] + 1]
+                for j, word_char in enumerate(word, start=1):
+                    row.append(min(row[j - 1] + 1, above[j] + 1, above[j - 1] + (word_char != char)))
+                rows.append(row)
+                if min(row) > max_distance:
+                    dead = True
+                    break
+
+            if dead:
+                # Ни одно продолжение этого префикса уже не подойдёт: пропускаем все термины с ним,
+                # целые блоки — по первым терминам блоков, без разбора
+                previous = term[:len(rows) - 1]
+                last_block = bisect_left(self._heads, previous + _MAX_CHAR) - 1
+                if last_block > block:
+                    block = last_block
+                    terms = self._block(block)
+                    offset = 0
+                while offset < len(terms) and terms[offset].startswith(previous):
+                    offset += 1
+                continue
+
+            if rows[-1][-1] <= max_distance:
+                found.append((term, rows[-1][-1]))
+            previous = term
+            offset += 1
+
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found[:limit]
+
+
+def expand(dictionary: TermDictionary, word: str, limit: int = MAX_EXPANSIONS) -> Sequence[str]:
+    """Шаблон раскрывается по словарю, известное слово остаётся собой, неизвестное исправляется"""
+    if is_pattern(word):
+        return dictionary.wildcard(word, limit)
+    if word in dictionary:
+        return (word,)
+    return tuple(term for term, _ in dictionary.fuzzy(word, fuzzy_distance(word), limit))
@@ -0,0 +1,39 @@
+import html_text
+
+
+def test_void_tags_separate_words():
+    assert html_text.extract_text("<p>Первая строка<br>вторая строка</p>") == "Первая строка вторая строка"
+    assert html_text.extract_text("<p>до<hr>после<img src='x.png'>конец</p>") == "до после конец"
+
+
+def test_inline_tags_do_not_split_words():
+    assert html_text.extract_text("<p>по<b>лив</b> газо<wbr>на</p>") == "полив газона"
+
+
+def test_boilerplate_with_implied_li_end_is_closed_by_parent():
+    html = '<ul class="related-posts"><li>похожая<li>ещё</ul><p>статья</p>'
+    assert html_text.extract_text(html) == "статья"
+
+
+def test_boilerplate_li_is_closed_by_next_li():
+    html = '<ul><li class="menu-item">Меню<li>Статья текст</ul><p>Основной текст статьи</p>'
+    assert html_text.extract_text(html) == "Статья текст Основной текст статьи"
+
+
+def test_boilerplate_p_is_closed_by_block():
+    html = '<div><p class="share">Поделиться<div>Текст</div></div>'
+    assert html_text.extract_text(html) == "Текст"
+
+
+def test_nested_boilerplate_and_title():
+    html = ("<html><head><title>Газон</title><style>p {}</style></head><body>"
+            "<nav><div><a>Меню</a></div></nav><div class='content'><p>Полив <i>газона</i></p></div>"
+            "<footer><div>Подвал</div></footer></body></html>")
+    assert html_text.extract_text(html) == "Газон Полив газона"
+
+
+def test_extract_words_matches_extract_text():
+    html = "<p>Полив\n\tгазона  летом: 10 раз, Ёлка<br>abcслово</p>"
+    text, words = html_text.extract_words(html)
+    assert text == html_text.extract_text(html)
+    assert words == ["полив", "газона", "летом", "раз", "ёлка"]
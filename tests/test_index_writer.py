@@ -0,0 +1,64 @@
+import pytest
+
+import search
+from index_writer import IndexReader, IndexWriter
+
+DOCS = {
+    "1": {"газон": 3, "трава": 1},
+    "2": {"газон": 1, "полив": 2},
+    "3": {"трава": 2, "полив": 1},
+    "4": {"семя": 1, "газон": 1},
+    "5": {"полив": 1, "трава": 1, "семя": 2},
+    "6": {"газон": 2, "семя": 1},
+    "7": {"клевер": 1, "трава": 3},
+    "8": {"клевер": 2, "полив": 1},
+}
+QUERIES = ["газон", "трава полив", "семя газон", "клевер", "мох"]
+
+
+def live_doc_ids(reader):
+    return {reader.doc_ids[doc] for doc in reader.live_doc_numbers()}
+
+
+def results(reader):
+    return [[(doc_id, pytest.approx(score)) for doc_id, score in search.search(query, reader)] for query in QUERIES]
+
+
+def fresh_reader(directory, docs):
+    writer = IndexWriter(str(directory), background_merges=False)
+    for doc_id, lemma_counts in docs.items():
+        writer.add_document(doc_id, lemma_counts)
+    writer.close()
+    return IndexReader(str(directory))
+
+
+def test_add_delete_merge(tmp_path):
+    writer = IndexWriter(str(tmp_path / "segments"), max_buffered_docs=2, merge_factor=2)
+    for doc_id, lemma_counts in DOCS.items():
+        writer.add_document(doc_id, lemma_counts)
+    assert writer.delete_document("3")
+    assert not writer.delete_document("9")
+    writer.commit()
+    writer.wait_for_merges()
+
+    # Удаление после записи сегмента — отметка, которую убирает слияние
+    assert writer.delete_document("5")
+    writer.update_document("7", {"клевер": 1, "газон": 1})
+    writer.commit()
+    writer.wait_for_merges()
+    writer.close()
+
+    expected = {doc_id: lemma_counts for doc_id, lemma_counts in DOCS.items() if doc_id not in ("3", "5")}
+    expected["7"] = {"клевер": 1, "газон": 1}
+    reader = IndexReader(str(tmp_path / "segments"))
+    assert len(writer.segments) < len(DOCS) // 2
+    assert live_doc_ids(reader) == set(expected) and len(reader) == len(expected)
+    assert reader.df("трава") == 1 and reader.df("газон") == 5 and reader.df("семя") == 2
+
+    fresh = fresh_reader(tmp_path / "fresh", expected)
+    assert results(reader) == results(fresh)
+    assert search.search_many(QUERIES, reader) == [search.search(query, reader) for query in QUERIES]
+
+    # После открытия заново писатель видит те же документы
+    reopened = IndexWriter(str(tmp_path / "segments"), background_merges=False)
+    assert len(reopened) == len(expected) and "5" not in reopened and "7" in reopened
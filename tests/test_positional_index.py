@@ -0,0 +1,35 @@
+import pytest
+
+from positional_index import PositionalIndex, PositionalIndexBuilder
+
+
+@pytest.fixture
+def index(tmp_path):
+    builder = PositionalIndexBuilder()
+    builder.add(1, "газон один раз")
+    builder.add(2, "газон и ещё раз газон")
+    builder.add(3, "газон газон")
+    builder.add(4, "газон полив трава один газон")
+    path = str(tmp_path / "positional_index.bin")
+    builder.write(path)
+    return PositionalIndex(path)
+
+
+def near(index, first, second, distance):
+    return {index.doc_ids[doc] for doc in index.near_docs(first, second, distance)}
+
+
+def test_near_same_word_needs_two_occurrences(index):
+    assert near(index, "газон", "газон", 4) == {"2", "3", "4"}
+    assert near(index, "газон", "газон", 3) == {"3"}
+    assert near(index, "газон", "газон", 0) == set()
+
+
+def test_near_different_words_in_any_order(index):
+    assert near(index, "газон", "раз", 2) == {"1", "2"}
+    assert near(index, "раз", "газон", 1) == {"2"}
+    assert near(index, "полив", "один", 1) == set()
+
+
+def test_phrase(index):
+    assert {index.doc_ids[doc] for doc in index.phrase_docs(["газон", "газон"])} == {"3"}
@@ -0,0 +1,33 @@
+import pytest
+
+import search
+from index_writer import IndexReader, IndexWriter
+
+DOCS = {
+    "1": {"газон": 3, "трава": 1},
+    "2": {"газон": 1, "полив": 2},
+    "3": {"трава": 2, "полив": 1},
+    "4": {"семя": 1, "газон": 1},
+    "5": {"полив": 1, "трава": 1, "семя": 2},
+    "6": {"газон": 2, "семя": 1},
+}
+QUERIES = ["газон", "трава полив", "семя газон", "полив", "клевер", "газон трава семя"]
+
+
+@pytest.fixture
+def reader(tmp_path):
+    writer = IndexWriter(str(tmp_path), max_buffered_docs=2, background_merges=False)
+    for doc_id, lemma_counts in DOCS.items():
+        writer.add_document(doc_id, lemma_counts)
+    writer.commit()
+    writer.delete_document("2")
+    writer.close()
+    return IndexReader(str(tmp_path))
+
+
+def test_search_many_with_deleted_documents_matches_search(reader):
+    assert len(reader) < len(reader.doc_ids)
+    expected = [search.search(query, reader) for query in QUERIES]
+    assert search.search_many(QUERIES, reader) == expected
+    assert search.search_many(QUERIES, reader, top_k=2) == [search.search(query, reader, 2) for query in QUERIES]
+    assert all(doc_id != "2" for results in expected for doc_id, _ in results)
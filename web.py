@@ -1,22 +1,227 @@
-from flask import Flask, render_template, request
-from search import load_index, search, URL_FOR_PARSE
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+from flask import Flask, Response, g, jsonify, render_template, request
+from werkzeug.serving import make_server
+
+import metrics
+from forward_store import open_forward_store
+from query_cache import QueryCache
+from search import compute_query_vector, open_index, search_corrected, query_key, query_lemma_cache, URL_FOR_PARSE
+from snippets import make_snippet
+
+MAX_K = 100
+# Сколько результатов кэшировать на запрос: следующие страницы выдачи берутся из того же кэша
+CACHE_DEPTH = 100
+CACHE_SIZE = 10_000
+CACHE_TTL = 300.0
+# Сюда пишутся свёрнутые стеки запросов, профилированных по ?profile=1 (сервер запущен с --profile)
+PROFILE_DIR = "profiles"
 
 app = Flask(__name__)
-index = load_index()
+app.config["PROFILE"] = False
+# Индекс открывается через mmap до запуска рабочих процессов, страницы файла у них общие
+index = open_index()
+# Тексты статей для сниппетов; без них выдача показывается, как раньше, только ссылками
+store = open_forward_store()
+cache = QueryCache(CACHE_SIZE, CACHE_TTL)
+
+
+@app.before_request
+def start_request():
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+    if app.config["PROFILE"] and request.args.get("profile") == "1":
+        g.profiler = metrics.SamplingProfiler().__enter__()
+
+
+def stop_profiler(profiler):
+    """Останавливает профилировщик запроса и сохраняет его стеки; возвращает путь к файлу"""
+    profiler.__exit__(None, None, None)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.time_ns() // 1_000_000}-{os.getpid()}-{request.endpoint}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.collapsed())
+    return path
+
+
+@app.after_request
+def finish_request(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        response.headers["X-Profile-File"] = stop_profiler(profiler)
+        response.headers["X-Profile-Samples"] = str(sum(profiler.samples.values()))
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.registry.observe(f"request_{request.endpoint}", time.perf_counter() - start)
+    return response
+
+
+@app.teardown_request
+def stop_failed_profile(exc):
+    # Если обработчик упал, after_request не вызывается: профилировщик останавливается здесь,
+    # иначе его поток и уменьшенный интервал переключения потоков остались бы в процессе
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        stop_profiler(profiler)
+
+
+def cached_search(query, k, offset=0):
+    """Страница выдачи, исправления опечаток, по которым она получена (пусто, если запрос
+    нашёлся как есть), и признак того, что выдача взята из кэша"""
+    key = query_key(query)
+    if not key:
+        return [], {}, False
+
+    # Неполная запись, в которой меньше offset + k результатов, не годится: это промах
+    entry = cache.get(key, lambda cached: cached[1] or len(cached[0]) >= offset + k)
+    hit = entry is not None
+    if not hit:
+        depth = max(CACHE_DEPTH, offset + k)
+        results, corrections = search_corrected(query, index, top_k=depth)
+        # Если результатов меньше, чем просили, выдача полная и годится для любой страницы
+        entry = (results, len(results) < depth, corrections)
+        cache.put(key, entry)
+    return entry[0][offset:offset + k], entry[2], hit
+
+
+def with_snippets(query, results, corrections=None):
+    """(doc_id, оценка, сниппет) для страницы выдачи; сниппет None, если текста статьи нет"""
+    if store is None or not results:
+        return [(doc_id, score, None) for doc_id, score in results]
+    weights = compute_query_vector(query, index, corrections=corrections)
+    snippets = []
+    for doc_id, score in results:
+        text = store.text(doc_id)
+        snippets.append((doc_id, score, make_snippet(text, weights) if text is not None else None))
+    return snippets
 
 
 @app.route("/", methods=["GET", "POST"])
 def home():
     results = []
+    corrections = {}
     query = ""
 
     if request.method == "POST":
         query = request.form.get("query", "")
-        all_results = search(query, index)
-        results = all_results[:10]  # ТОП-10
+        results, corrections, _ = cached_search(query, 10)  # ТОП-10
+        results = with_snippets(query, results, corrections)
+
+    return render_template("index.html", results=results, corrections=corrections, query=query,
+                           url_base=URL_FOR_PARSE)
+
+
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    query = request.args.get("q", "").strip()
+    try:
+        k = int(request.args.get("k", 10))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify(error="k и offset должны быть целыми числами"), 400
+    if not query:
+        return jsonify(error="пустой запрос"), 400
+    if not 1 <= k <= MAX_K or offset < 0:
+        return jsonify(error=f"k должно быть от 1 до {MAX_K}, offset — неотрицательным"), 400
+
+    start = time.perf_counter()
+    results, corrections, cached = cached_search(query, k, offset)
+    return jsonify(
+        query=query,
+        k=k,
+        offset=offset,
+        cached=cached,
+        corrections=corrections,
+        took_ms=round((time.perf_counter() - start) * 1000, 3),
+        results=[{"doc_id": doc_id, "url": f"{URL_FOR_PARSE}/{doc_id}", "score": score} for doc_id, score in results],
+    )
+
+
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    """Счётчики кэшей этого рабочего процесса"""
+    return jsonify(
+        pid=os.getpid(),
+        query_cache={"size": len(cache), "hits": cache.hits, "misses": cache.misses, "hit_rate": cache.hit_rate},
+        lemma_cache={"size": len(query_lemma_cache), "hits": query_lemma_cache.hits,
+                     "misses": query_lemma_cache.misses, "hit_rate": query_lemma_cache.hit_rate},
+    )
+
 
-    return render_template("index.html", results=results, query=query, url_base=URL_FOR_PARSE)
+@app.route("/metrics", methods=["GET"])
+def metrics_export():
+    """Таймеры стадий и счётчики этого рабочего процесса: формат Prometheus, ?format=json — JSON.
+    Пока сбор не включён (--metrics или SEARCH_METRICS=1), видны только размеры кэшей"""
+    gauges = {
+        "query_cache_size": len(cache), "query_cache_hits": cache.hits, "query_cache_misses": cache.misses,
+        "lemma_cache_size": len(query_lemma_cache), "lemma_cache_hits": query_lemma_cache.hits,
+        "lemma_cache_misses": query_lemma_cache.misses,
+    }
+    if request.args.get("format") == "json":
+        return jsonify(pid=os.getpid(), enabled=metrics.ENABLED, gauges=gauges, **metrics.registry.snapshot())
+    return Response(metrics.registry.to_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
+
+def serve(host, port, workers):
+    """Несколько заранее запущенных процессов принимают соединения с одного сокета.
+
+    В каждом процессе запросы обрабатываются в отдельных потоках, поэтому медленный запрос
+    не задерживает остальные. Без fork (Windows) работает один многопоточный процесс.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        print(f"Сервер запущен на http://{host}:{port}")
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    # При остановке главного процесса останавливаем и рабочие
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Сервер запущен на http://{host}:{port}, рабочих процессов: {workers}")
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--debug", action="store_true", help="отладочный сервер Flask с перезагрузкой, как раньше")
+    parser.add_argument("--metrics", action="store_true", help="собирать время по стадиям поиска для /metrics")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"разрешить профилирование запроса по ?profile=1 (стеки пишутся в {PROFILE_DIR}/)")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    app.config["PROFILE"] = args.profile
+
+    if args.debug:
+        app.run(host=args.host, port=args.port, debug=True)
+    else:
+        serve(args.host, args.port, args.workers)